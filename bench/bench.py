@@ -0,0 +1,213 @@
+"""
+Benchmarks dos caminhos quentes do main.py (strip_ansi, parse_cli_stdout, summarize_run,
+build_human_report, build_html_report) e do pipeline inteiro com um Postman CLI falso.
+
+    python bench/bench.py                       # roda e compara com bench/baseline.json
+    python bench/bench.py --save                # grava um novo baseline (rode na máquina do CI)
+    python bench/bench.py --sizes 10,1000 --pipeline
+
+Sai com código 1 se algum estágio ficar mais lento ou usar mais memória que o baseline
+além da tolerância.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import main  # noqa: E402
+import synthetic  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_SIZES = (10, 1000, 10_000, 100_000)
+# Diferenças abaixo disso são ruído de medição, não regressão
+MIN_TIME_DELTA_S = 0.005
+MIN_MEM_DELTA_KB = 256
+# Mais rápido que isso (fração do baseline) não é otimização, é estágio que deixou de rodar
+IMPLAUSIBLE_SPEEDUP = 0.2
+# ru_maxrss dos filhos conta o RSS herdado no fork (o do próprio bench, já inchado pelos estágios
+# grandes): o pipeline roda sob um launcher enxuto, que informa o pico só do main.py e do CLI falso
+_RSS_LAUNCHER = ("import resource, subprocess, sys; rc = subprocess.call(sys.argv[1:]); "
+                 "print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss, file=sys.stderr); sys.exit(rc)")
+
+
+def measure(fn, repeat: int) -> dict:
+    """Melhor tempo de `repeat` execuções + pico de memória Python (tracemalloc) de uma execução à parte."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t
+        best = dt if best is None else min(best, dt)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"time_s": round(best, 6), "peak_kb": round(peak / 1024, 1)}
+
+
+def _grouped(summary: dict) -> dict:
+    return {"Bench": {"Bench.postman_environment": [{"collection_name": "Bench.postman_collection.json",
+                                                     "summary": summary, "attachments": []}]}}
+
+
+def bench_stages(sizes, workdir: str) -> dict:
+    results = {}
+    for n in sizes:
+        repeat = 5 if n <= 1000 else (3 if n <= 10_000 else 1)
+        names = synthetic.request_names(n)
+        raw = synthetic.gen_stdout(names)
+        clean_lines = [main.strip_ansi(ln) for ln in raw.split("\n")]
+        clean = "\n".join(clean_lines)
+
+        results[f"strip_ansi@{n}"] = measure(lambda: [main.strip_ansi(ln) for ln in raw.split("\n")], repeat)
+        results[f"parse_cli_stdout@{n}"] = measure(lambda: main.parse_cli_stdout(clean), repeat)
+        stdout_items = main.parse_cli_stdout(clean)
+
+        for fmt in ("new", "old"):
+            path = os.path.join(workdir, f"run-{fmt}-{n}.json")
+            synthetic.write_run_json(path, names, fmt)
+            results[f"summarize_run[{fmt}]@{n}"] = measure(
+                lambda: main.summarize_run(path, clean, stdout_items), repeat)
+
+        summary = main.summarize_run(os.path.join(workdir, f"run-new-{n}.json"), clean, stdout_items)
+        grouped = _grouped(summary)
+        results[f"build_human_report@{n}"] = measure(lambda: main.build_human_report(grouped), repeat)
+        results[f"build_html_report@{n}"] = measure(lambda: main.build_html_report(grouped), repeat)
+        print(f"  n={n}: ok", flush=True)
+    return results
+
+
+def bench_pipeline(workdir: str, projects: int = 2, collections: int = 3, requests: int = 2000,
+                   jobs: int = 4) -> dict:
+    """main.py --all de ponta a ponta contra bench/bin/postman (sem rede, sem SMTP)."""
+    root = os.path.join(workdir, "pipeline")
+    for p in range(projects):
+        base = os.path.join(root, "collections", f"Proj{p}")
+        os.makedirs(os.path.join(base, "requests"))
+        os.makedirs(os.path.join(base, "enviroment"))
+        with open(os.path.join(base, "enviroment", "Dev.postman_environment.json"), "w", encoding="utf-8") as f:
+            json.dump(synthetic.gen_environment("Dev"), f)
+        for c in range(collections):
+            with open(os.path.join(base, "requests", f"Col{c}.postman_collection.json"), "w", encoding="utf-8") as f:
+                json.dump(synthetic.gen_collection(requests, name=f"Col{c}"), f)
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("SMTP_", "AUTOMATEST_", "MAIL_"))}
+    env.update({
+        "PATH": os.path.join(BENCH_DIR, "bin") + os.pathsep + env.get("PATH", ""),
+        "AUTOMATEST_HISTORY_DB": "off",
+        "AUTOMATEST_ENGINE": "cli",
+        "AUTOMATEST_MAX_PER_ENV": "0",
+        "AUTOMATEST_MAIL_FLUSH_TIMEOUT": "1",
+        # baseUrl sintético (127.0.0.1:9) não responde: sem isso o health check pula todos os jobs
+        "AUTOMATEST_PROBE": "false",
+        "AUTOMATEST_ARCHIVE_DIR": "off",
+        "AUTOMATEST_LOG_RETENTION_DAYS": "0",
+    })
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    t = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", _RSS_LAUNCHER,
+                           sys.executable, os.path.join(REPO_DIR, "main.py"), "--all", "-j", str(jobs)],
+                          cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - t
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if proc.returncode != 0:
+        raise SystemExit(f"pipeline falhou (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+    # Medir uma execução vazia passaria no gate sem testar nada: todos os jobs precisam ter rodado
+    ran = proc.stdout.count("=== Executando:")
+    if ran != projects * collections or "indisponível" in proc.stdout:
+        raise SystemExit(f"pipeline rodou {ran} de {projects * collections} job(s) (jobs pulados?):\n"
+                         f"{proc.stdout[-2000:]}")
+    key = f"pipeline@{projects}x{collections}x{requests}"
+    return {key: {
+        "time_s": round(wall, 3),
+        "cpu_s": round((after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime), 3),
+        "peak_kb": int(proc.stderr.rsplit(None, 1)[-1]),  # maior RSS entre main.py e o CLI falso
+    }}
+
+
+def compare(results: dict, baseline: dict, time_tol: float, mem_tol: float) -> list:
+    problems = []
+    for key, cur in sorted(results.items()):
+        base = baseline.get(key)
+        if not base:
+            continue
+        if cur["time_s"] > base["time_s"] * (1 + time_tol) and cur["time_s"] - base["time_s"] > MIN_TIME_DELTA_S:
+            problems.append(f"{key}: tempo {cur['time_s']:.4f}s > baseline {base['time_s']:.4f}s (+{time_tol:.0%})")
+        if cur["peak_kb"] > base["peak_kb"] * (1 + mem_tol) and cur["peak_kb"] - base["peak_kb"] > MIN_MEM_DELTA_KB:
+            problems.append(f"{key}: memória {cur['peak_kb']:.0f}KB > baseline {base['peak_kb']:.0f}KB (+{mem_tol:.0%})")
+        if base["time_s"] > MIN_TIME_DELTA_S and cur["time_s"] < base["time_s"] * IMPLAUSIBLE_SPEEDUP:
+            problems.append(f"{key}: tempo {cur['time_s']:.4f}s < {IMPLAUSIBLE_SPEEDUP:.0%} do baseline "
+                            f"{base['time_s']:.4f}s (o estágio rodou de verdade? atualize o baseline se sim)")
+    return problems
+
+
+def main_cli(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmarks do runner (tempo e pico de memória).")
+    ap.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                    help="quantidades de execuções separadas por vírgula")
+    ap.add_argument("--pipeline", action="store_true", help="inclui o main.py completo com o CLI falso")
+    ap.add_argument("--save", action="store_true", help="grava os resultados como novo baseline")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--time-tolerance", type=float, default=0.5, help="folga de tempo (0.5 = +50%%)")
+    ap.add_argument("--mem-tolerance", type=float, default=0.2, help="folga de memória (0.2 = +20%%)")
+    args = ap.parse_args(argv)
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    workdir = tempfile.mkdtemp(prefix="automatest-bench-")
+    try:
+        print(f"Estágios ({', '.join(map(str, sizes))} execuções)...")
+        results = bench_stages(sizes, workdir)
+        if args.pipeline:
+            print("Pipeline completo (main.py + postman falso)...")
+            results.update(bench_pipeline(workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+    print(f"\n{'benchmark':<36} {'tempo (s)':>11} {'baseline':>11} {'pico (KB)':>11} {'baseline':>11}")
+    for key, cur in sorted(results.items()):
+        base = baseline.get(key, {})
+        print(f"{key:<36} {cur['time_s']:>11.4f} {base.get('time_s', float('nan')):>11.4f} "
+              f"{cur['peak_kb']:>11.0f} {base.get('peak_kb', float('nan')):>11.0f}")
+
+    if args.save:
+        merged = {**baseline, **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"machine": {"python": platform.python_version(), "platform": platform.platform(),
+                                   "ijson": main.ijson is not None},
+                       "results": dict(sorted(merged.items()))}, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline salvo em {args.baseline}")
+        return 0
+
+    problems = compare(results, baseline, args.time_tolerance, args.mem_tolerance)
+    if problems:
+        print("\nREGRESSÕES:")
+        for p in problems:
+            print(" -", p)
+        return 1
+    print("\nSem regressões." if baseline else "\nSem baseline para comparar (use --save).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
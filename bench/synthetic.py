@@ -0,0 +1,107 @@
+"""
+Dados sintéticos para os benchmarks: collections, stdout do Postman CLI e run.json
+(formatos novo e antigo), com falhas determinísticas a cada `fail_every` testes.
+"""
+import json
+
+ANSI_OK = "\x1b[32m✓\x1b[0m"
+ANSI_FAIL = "\x1b[31m✗\x1b[0m"
+TESTS_PER_REQUEST = 2
+
+
+def request_names(n: int) -> list:
+    return [f"Request {i:06d}" for i in range(n)]
+
+
+def _failed(i: int, k: int, fail_every: int) -> bool:
+    return bool(fail_every) and (i * TESTS_PER_REQUEST + k) % fail_every == 0
+
+
+def _status(i: int) -> int:
+    return 500 if i % 97 == 96 else 200
+
+
+def _ms(i: int) -> int:
+    return 40 + (i * 37) % 400
+
+
+def gen_collection(n: int, folders: int = 10, name: str = "Bench") -> dict:
+    """Collection v2.1 com `n` requests distribuídos em `folders` folders."""
+    names = request_names(n)
+    groups = [{"name": f"Folder {f:02d}", "item": []} for f in range(max(1, folders))]
+    for i, req in enumerate(names):
+        groups[i % len(groups)]["item"].append({
+            "name": req,
+            "event": [{"listen": "test", "script": {"type": "text/javascript", "exec": [
+                "pm.test('Status 200', () => pm.response.to.have.status(200));",
+                "pm.test('Tempo < 2000ms', () => pm.expect(pm.response.responseTime).to.be.below(2000));",
+            ]}}],
+            "request": {"method": "GET", "url": {"raw": "{{baseUrl}}/items/" + str(i)}},
+        })
+    return {
+        "info": {"name": name, "schema": "https://schema.getpostman.com/json/collection/v2.1.0/collection.json"},
+        "item": groups,
+        "variable": [{"key": "baseUrl", "value": "http://127.0.0.1:9"}],
+    }
+
+
+def gen_environment(name: str = "Bench") -> dict:
+    return {"name": name, "values": [{"key": "baseUrl", "value": "http://127.0.0.1:9", "enabled": True}]}
+
+
+def iter_stdout_lines(names: list, fail_every: int = 7, title: str = "Bench"):
+    """Linhas no formato do reporter `cli` (com ANSI, como sai do processo)."""
+    yield "\x1b[1mpostman\x1b[0m"
+    yield ""
+    yield title
+    for i, req in enumerate(names):
+        sc = _status(i)
+        yield f"→ {req}"
+        yield f"  GET http://127.0.0.1:9/items/{i} [{sc} {'OK' if sc == 200 else 'Internal Server Error'}, 1.2kB, {_ms(i)}ms]"
+        for k, test in enumerate(("Status 200", "Tempo < 2000ms")):
+            if _failed(i, k, fail_every):
+                yield f"  {k + 1}. {ANSI_FAIL}  {test}"
+            else:
+                yield f"  {ANSI_OK}  {test}"
+
+
+def gen_stdout(names: list, fail_every: int = 7) -> str:
+    return "\n".join(iter_stdout_lines(names, fail_every))
+
+
+def _execution(i: int, req: str, fmt: str, fail_every: int) -> dict:
+    tests = [(t, _failed(i, k, fail_every)) for k, t in enumerate(("Status 200", "Tempo < 2000ms"))]
+    response = {"code": _status(i), "status": "OK", "responseTime": _ms(i), "responseSize": 1200}
+    if fmt == "new":
+        return {
+            "id": f"exec-{i}", "requestExecuted": {"name": req, "url": f"http://127.0.0.1:9/items/{i}"},
+            "response": response, "startedAt": 1_700_000_000_000 + i,
+            "tests": [{"name": t, "status": "failed" if bad else "passed",
+                       **({"error": {"message": "expected false to be truthy"}} if bad else {})} for t, bad in tests],
+        }
+    return {
+        "id": f"exec-{i}", "item": {"id": f"item-{i}", "name": req}, "response": response,
+        "assertions": [{"assertion": t, **({"error": {"name": "AssertionError", "message": "expected false"}}
+                                          if bad else {})} for t, bad in tests],
+    }
+
+
+def write_run_json(path: str, names: list, fmt: str = "new", fail_every: int = 7):
+    """Grava o run.json em stream (uma execução por vez), como o CLI faria com 100k execuções."""
+    failed = sum(_failed(i, k, fail_every) for i in range(len(names)) for k in range(TESTS_PER_REQUEST))
+    total = len(names) * TESTS_PER_REQUEST
+    if fmt == "new":
+        head = {"summary": {"executedRequests": {"executed": len(names)},
+                            "tests": {"executed": total, "failed": 0}}}
+    else:
+        head = {"stats": {"requests": {"total": len(names), "failed": 0},
+                          "tests": {"total": total, "failed": failed}}}
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"collection": {"info": {"name": "Bench"}}, "run": ')
+        f.write(json.dumps(head)[:-1])
+        f.write(', "executions": [')
+        for i, req in enumerate(names):
+            if i:
+                f.write(",")
+            f.write(json.dumps(_execution(i, req, fmt, fail_every), ensure_ascii=False))
+        f.write("]}}")
@@ -6,10 +6,50 @@ import shutil
 import subprocess
 import datetime
 import smtplib
+import base64
+import hashlib
+import http.client
+import uuid
+import urllib.parse
+import sqlite3
+import tempfile
 import ssl
+import statistics
+import string
+import struct
+import threading
+import asyncio
+import contextlib
+import csv
+import ctypes
+import ctypes.util
+import functools
+import cProfile
+import queue
+import select
+import random
+import signal
+import socket
+import time
+import zipfile
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from email import message_from_binary_file, policy as email_policy
 from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from html import escape
 
+try:
+    import resource  # só POSIX: uso de CPU/memória dos processos filhos
+except ImportError:
+    resource = None
+
+try:
+    import ijson  # opcional: parser de eventos em C para run.json gigantes
+except ImportError:
+    ijson = None
+
 # =====================================================================
 # Destinatários: SOMENTE via constants.py
 # =====================================================================
@@ -41,6 +81,72 @@ def load_dotenv(path=".env"):
         os.environ.setdefault(k, v)
     return env
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+# =====================================================================
+# Instrumentação: spans por fase/job (trace no formato do Chrome) e uso dos processos filhos
+# =====================================================================
+CHILD_SAMPLE_INTERVAL = 0.2
+
+class Tracer:
+    """
+    Coleta spans (wall e CPU da thread) de forma thread-safe. `write()` gera um JSON no
+    formato Chrome Trace Event (abre em chrome://tracing ou ui.perfetto.dev).
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.events = []
+        self.log_dir = None
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = "phase", **args):
+        """Os valores gravados no dict devolvido entram nos `args` do span."""
+        start, cpu = time.perf_counter(), time.thread_time()
+        extra = {}
+        try:
+            yield extra
+        finally:
+            end = time.perf_counter()
+            ev = {
+                "name": name, "cat": cat, "ph": "X",
+                "ts": round((start - self.t0) * 1e6), "dur": round((end - start) * 1e6),
+                "pid": os.getpid(), "tid": threading.get_native_id(),
+                "args": {**{k: v for k, v in args.items() if v is not None}, **extra,
+                         "cpu_ms": round((time.thread_time() - cpu) * 1000, 1)},
+            }
+            with self._lock:
+                self.events.append(ev)
+
+    def spans(self, cat: str = None) -> list:
+        with self._lock:
+            return [e for e in self.events if cat is None or e["cat"] == cat]
+
+    def write(self, path: str):
+        ensure_dir(os.path.dirname(path) or ".")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.spans(), "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+TRACER = Tracer()
+
+def _proc_usage(pid: int):
+    """(CPU em s, pico de RSS em KB) de um processo vivo via /proc; None fora do Linux."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status", "r") as f:
+            hwm = next((int(ln.split()[1]) for ln in f if ln.startswith("VmHWM:")), 0)
+    except (OSError, ValueError, IndexError):
+        return None
+    # utime, stime, cutime, cstime (campos 14-17 do stat; o split começa no campo 3)
+    ticks = sum(int(x) for x in fields[11:15])
+    return ticks / os.sysconf("SC_CLK_TCK"), hwm
+
 # =====================================================================
 # Shell helpers
 # =====================================================================
@@ -54,7 +160,9 @@ def run(cmd: str, cwd: str = None):
         errors="replace"
     )
 
+@functools.lru_cache(maxsize=1)
 def which_postman():
+    # memorizado: no daemon o PATH não muda entre execuções
     return shutil.which("postman")
 
 def postman_whoami_ok():
@@ -68,6 +176,17 @@ def postman_login_if_needed():
     if api_key:
         _ = run(f'postman login --with-api-key "{api_key}"')
 
+_LOGIN_CHECKED_AT = None
+
+def ensure_postman_login(ttl_s: int):
+    """postman_login_if_needed no máximo uma vez a cada `ttl_s` segundos (daemon)."""
+    global _LOGIN_CHECKED_AT
+    now = time.monotonic()
+    if _LOGIN_CHECKED_AT is not None and now - _LOGIN_CHECKED_AT < ttl_s:
+        return
+    postman_login_if_needed()
+    _LOGIN_CHECKED_AT = now
+
 # =====================================================================
 # Descoberta (raiz/collections/<proj>/{enviroment,requests})
 # =====================================================================
@@ -116,382 +235,3992 @@ def env_label_from_path(env_path: str) -> str:
     base = os.path.basename(env_path)
     return os.path.splitext(base)[0]
 
+_ANSI_RE = re.compile(r'\x1B\[[0-9;]*[mK]')
+
 def strip_ansi(s: str) -> str:
-    ansi = re.compile(r'\x1B\[[0-9;]*[mK]')
-    return ansi.sub('', s)
+    return _ANSI_RE.sub('', s)
 
 # =====================================================================
 # Execução (ABS paths)
 # =====================================================================
-def run_collection(collection_path: str, environment_path: str, out_dir: str):
+# Linhas guardadas em memória por job (o restante vai só para o cli.log.txt)
+STDOUT_TAIL_LINES = 200
+STDERR_TAIL_LINES = 2000
+# Itens parseados do stdout (NDJSON ao lado do cli.log.txt, relido no resumo)
+STDOUT_ITEMS_FILE = "cli.items.ndjson"
+# Limite de uma única linha do CLI (StreamReader padrão é 64 KiB)
+STREAM_LINE_LIMIT = 4 * 1024 * 1024
+
+def _kill_process_tree(proc):
+    # POSIX: o CLI roda em sessão própria -> mata o grupo inteiro (node + filhos)
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+    try:
+        proc.kill()
+    except ProcessLookupError:
+        pass
+
+async def _read_line(stream) -> bytes:
+    """
+    Como `StreamReader.readline`, mas uma linha maior que STREAM_LINE_LIMIT não derruba a
+    leitura: o começo é mantido e o resto é consumido em blocos e descartado.
+    """
+    parts, size = [], 0
+    while True:
+        try:
+            chunk, done = await stream.readuntil(b"\n"), True
+        except asyncio.IncompleteReadError as e:
+            chunk, done = e.partial, True  # EOF sem \n final
+        except asyncio.LimitOverrunError as e:
+            chunk, done = await stream.read(max(e.consumed, 1)), False
+            if not chunk:
+                done = True
+        if size < STREAM_LINE_LIMIT:
+            parts.append(chunk[:STREAM_LINE_LIMIT - size])
+        size += len(chunk)
+        if done:
+            break
+    line = b"".join(parts)
+    if size > STREAM_LINE_LIMIT:
+        line = line.rstrip(b"\r\n") + f" ... [automatest] linha truncada ({size} bytes)\n".encode()
+    return line
+
+async def _stream_process(argv: list, out_txt: str, on_line, timeout: float = None) -> dict:
+    """
+    Roda `argv` lendo stdout linha a linha: cada linha sai sem ANSI, vai direto para
+    `out_txt` e para `on_line`. Só as últimas linhas ficam em memória.
+    Com `timeout` (s), o grupo de processos é morto quando o tempo estoura.
+    """
+    kwargs = {"start_new_session": True} if os.name == "posix" else {}
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=STREAM_LINE_LIMIT,
+        **kwargs,
+    )
+    stdout_tail = deque(maxlen=STDOUT_TAIL_LINES)
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+
+    async def pump_stdout(f):
+        while True:
+            raw = await _read_line(proc.stdout)
+            if not raw:
+                break
+            line = strip_ansi(raw.decode("utf-8", errors="replace")).rstrip("\r\n")
+            if f:
+                f.write(line + "\n")
+            on_line(line)
+            stdout_tail.append(line)
+
+    async def pump_stderr():
+        while True:
+            raw = await _read_line(proc.stderr)
+            if not raw:
+                break
+            stderr_tail.append(strip_ansi(raw.decode("utf-8", errors="replace")).rstrip("\r\n"))
+
+    usage = {"cpu_s": None, "peak_rss_kb": None}
+
+    async def sample_usage():
+        # amostra /proc enquanto o filho vive (o pico de RSS é o VmHWM, então não se perde entre amostras)
+        while proc.returncode is None:
+            sample = _proc_usage(proc.pid)
+            if sample:
+                usage["cpu_s"] = sample[0]
+                usage["peak_rss_kb"] = max(sample[1], usage["peak_rss_kb"] or 0)
+            await asyncio.sleep(CHILD_SAMPLE_INTERVAL)
+
+    f = None
+    try:
+        f = open(out_txt, "w", encoding="utf-8", errors="replace")
+    except Exception:
+        f = None
+    timed_out = False
+    sampler = asyncio.create_task(sample_usage())
+    try:
+        try:
+            await asyncio.wait_for(asyncio.gather(pump_stdout(f), pump_stderr(), proc.wait()), timeout=timeout or None)
+        except asyncio.TimeoutError:
+            timed_out = True
+            _kill_process_tree(proc)
+            await proc.wait()
+            stderr_tail.append(f"[automatest] tempo limite de {timeout:g}s excedido; processo finalizado.")
+        except Exception as e:
+            # falha lendo a saída: não deixa o CLI órfão nem derruba o run inteiro
+            _kill_process_tree(proc)
+            await proc.wait()
+            stderr_tail.append(f"[automatest] falha lendo a saída do CLI ({str(e) or type(e).__name__}); processo finalizado.")
+        if f and stderr_tail:
+            f.write("\n\n[STDERR]\n")
+            f.write("\n".join(stderr_tail))
+    finally:
+        sampler.cancel()
+        await asyncio.gather(sampler, return_exceptions=True)
+        if f:
+            f.close()
+    return {
+        "returncode": proc.returncode,
+        "timed_out": timed_out,
+        "stdout": "\n".join(stdout_tail),
+        "stderr": "\n".join(stderr_tail),
+        "wrote_txt": f is not None,
+        "usage": usage,
+    }
+
+def _private_environment(environment_path: str, env_vars: dict) -> str:
+    """
+    Cópia do environment com `env_vars` sobrescritas, num arquivo temporário 0600 fora de logs/.
+    Tokens em --env-var ficariam visíveis no `ps` de qualquer usuário da máquina.
+    """
+    with open(environment_path, "r", encoding="utf-8") as f:
+        env = json.load(f)
+    values = [v for v in env.get("values") or [] if v.get("key") not in env_vars]
+    values += [{"key": k, "value": v, "type": "secret", "enabled": True} for k, v in env_vars.items()]
+    env["values"] = values
+    fd, path = tempfile.mkstemp(prefix="automatest-env-", suffix=".json")  # O_EXCL, modo 0600
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(env, f)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def run_collection(collection_path: str, environment_path: str, out_dir: str, timeout: float = None,
+                   extra_args: list = None, env_vars: dict = None):
     collection_abs = os.path.abspath(collection_path)
     env_abs = os.path.abspath(environment_path)
     out_dir_abs = os.path.abspath(out_dir)
     ensure_dir(out_dir_abs)
     out_json = os.path.join(out_dir_abs, "run.json")
     out_txt  = os.path.join(out_dir_abs, "cli.log.txt")
-    cmd = (
-        f'postman collection run "{collection_abs}" '
-        f'-e "{env_abs}" '
-        f'--reporters cli,json '
-        f'--reporter-json-export "{out_json}"'
-    )
-    proc = run(cmd)
-    # salva stdout/stderr limpos (sem ANSI)
-    try:
-        with open(out_txt, "w", encoding="utf-8", errors="replace") as f:
-            f.write(strip_ansi(proc.stdout or ""))
-            if proc.stderr:
-                f.write("\n\n[STDERR]\n")
-                f.write(strip_ansi(proc.stderr))
-    except Exception:
-        out_txt = None
+    # tokens do cache vão num environment temporário, nunca na linha de comando
+    private_env = _private_environment(env_abs, env_vars) if env_vars else None
+    argv = [
+        which_postman() or "postman", "collection", "run", collection_abs,
+        "-e", private_env or env_abs,
+        "--reporters", "cli,json",
+        "--reporter-json-export", out_json,
+    ] + list(extra_args or [])
+    shown = list(argv)
+    shown[4] = env_abs
+    cmd = shlex.join(["postman"] + shown[1:])
+    if env_vars:
+        cmd += f"  # + {', '.join(sorted(env_vars))} do cache de tokens (environment temporário)"
+
+    # stdout é parseado enquanto o processo roda (resumo pronto no exit); os itens vão para o disco
+    stdout_items = StdoutItems(os.path.join(out_dir_abs, STDOUT_ITEMS_FILE))
+    parser = CliStdoutParser(stdout_items.add)
+    with TRACER.span("postman", cat="child", collection=os.path.basename(collection_path)) as span:
+        try:
+            proc = asyncio.run(_stream_process(argv, out_txt, parser.feed, timeout))
+        except OSError as e:
+            proc = {"returncode": 127, "timed_out": False, "stdout": "",
+                    "stderr": f"falha ao iniciar o Postman CLI: {e}", "wrote_txt": False, "usage": {}}
+        finally:
+            parser.finish()
+            stdout_items.close()
+            if private_env:
+                with contextlib.suppress(OSError):
+                    os.remove(private_env)
+        usage = proc["usage"]
+        if usage.get("cpu_s") is not None:
+            span["child_cpu_ms"] = round(usage["cpu_s"] * 1000, 1)
+        if usage.get("peak_rss_kb"):
+            span["child_peak_rss_kb"] = usage["peak_rss_kb"]
 
     return {
         "cmd": cmd,
-        "returncode": proc.returncode,
-        "stdout": proc.stdout,
-        "stderr": proc.stderr,
+        "returncode": proc["returncode"],
+        "timed_out": proc["timed_out"],
+        "stdout": proc["stdout"],
+        "stderr": proc["stderr"],
+        "stdout_items": stdout_items,
         "report_path": out_json if os.path.exists(out_json) else None,
-        "stdout_path": out_txt if out_txt and os.path.exists(out_txt) else None
+        "stdout_path": out_txt if proc["wrote_txt"] and os.path.exists(out_txt) else None
     }
 
 # =====================================================================
-# Parser de STDOUT (CLI bonito)
+# Timeout + retentativas (só para falhas transitórias)
 # =====================================================================
-def parse_cli_stdout(stdout: str):
-    if not stdout:
-        return []
-    s = strip_ansi(stdout)
-    lines = [ln.rstrip() for ln in s.splitlines()]
-    out, cur = [], None
+_RE_TRANSIENT = re.compile(
+    r'ECONNREFUSED|ECONNRESET|ETIMEDOUT|EAI_AGAIN|ENOTFOUND|socket hang up|connection refused',
+    re.IGNORECASE,
+)
 
-    re_req = re.compile(r'^\s*→\s+(.*)$')                 # "→ Nome"
-    re_test_ok = re.compile(r'^\s*[√✓]\s+(.*)$')          # passed
-    re_test_fail = re.compile(r'^\s*[×✗]\s+(.*)$')        # failed
-    re_status = re.compile(r'\[(\d{3})\s+[^\]]+\]')       # "[200 OK, ...]"
+def retry_policy() -> dict:
+    # AUTOMATEST_JOB_TIMEOUT <= 0 desliga o limite de tempo por tentativa
+    try:
+        backoff = float(os.getenv("AUTOMATEST_RETRY_BACKOFF", "") or 5)
+    except ValueError:
+        backoff = 5.0
+    return {
+        "timeout": max(0, _env_int("AUTOMATEST_JOB_TIMEOUT", 1800)) or None,
+        "retries": max(0, _env_int("AUTOMATEST_RETRIES", 1)),
+        "backoff": max(0.0, backoff),
+        # collection travada tende a travar de novo: repetir segura o worker por mais um timeout inteiro
+        "retry_timeouts": os.getenv("AUTOMATEST_RETRY_TIMEOUTS", "false").lower() in ("1", "true", "yes", "y"),
+    }
 
-    for ln in lines:
-        m = re_req.match(ln)
-        if m:
-            if cur:
-                out.append(cur)
-            cur = {"name": m.group(1).strip(), "status_code": None, "tests": []}
-            continue
+def is_transient_failure(result: dict, retry_timeouts: bool = False) -> bool:
+    if result.get("timed_out"):
+        return retry_timeouts
+    if result.get("returncode") == 0:
+        return False
+    if not result.get("report_path"):
+        return True
+    return bool(_RE_TRANSIENT.search(result.get("stderr") or ""))
 
-        if cur:
-            m2 = re_status.search(ln)
-            if m2:
-                try:
-                    cur["status_code"] = int(m2.group(1))
-                except Exception:
-                    pass
-                continue
-            m3 = re_test_ok.match(ln.strip())
-            if m3:
-                cur["tests"].append({"name": m3.group(1).strip(), "ok": True})
-                continue
-            m4 = re_test_fail.match(ln.strip())
-            if m4:
-                cur["tests"].append({"name": m4.group(1).strip(), "ok": False})
-                continue
+def _describe_attempt(result: dict) -> str:
+    if result.get("timed_out"):
+        return "tempo limite excedido"
+    if result.get("returncode") == 0:
+        return "ok"
+    extra = "" if result.get("report_path") else ", sem run.json"
+    return f"exit {result.get('returncode')}{extra}"
 
-    if cur:
-        out.append(cur)
-    return out
+def _archive_attempt_files(out_dir: str, attempt: int):
+    # Guarda os artefatos da tentativa anterior antes de rodar de novo
+    for name, ext in (("run", ".json"), ("cli.log", ".txt")):
+        src = os.path.join(out_dir, name + ext)
+        if os.path.exists(src):
+            os.replace(src, os.path.join(out_dir, f"{name}.attempt-{attempt}{ext}"))
+
+def run_collection_with_retry(collection_path: str, environment_path: str, out_dir: str, policy: dict = None,
+                              env_vars: dict = None, extra_args: list = None, runner=None):
+    policy = policy or retry_policy()
+    runner = runner or pick_runner(collection_path)
+    # extra_args são flags do Postman CLI: não se aplicam ao engine nativo
+    kwargs = {"extra_args": extra_args} if extra_args and runner is run_collection else {}
+    attempts = []
+    attempt = 0
+    while True:
+        attempt += 1
+        started = time.monotonic()
+        with TRACER.span(f"tentativa {attempt}", cat="attempt", engine=runner.__name__):
+            result = runner(collection_path, environment_path, out_dir, timeout=policy["timeout"],
+                            env_vars=env_vars, **kwargs)
+        transient = is_transient_failure(result, policy.get("retry_timeouts", False))
+        attempts.append({
+            "attempt": attempt,
+            "returncode": result["returncode"],
+            "timed_out": result["timed_out"],
+            "transient": transient,
+            "duration_s": round(time.monotonic() - started, 3),
+            "detail": _describe_attempt(result),
+        })
+        if not transient or attempt > policy["retries"]:
+            break
+        delay = policy["backoff"] * (2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+        print(f"[retry] {os.path.basename(collection_path)} | env={os.path.basename(environment_path)}: "
+              f"{attempts[-1]['detail']}; nova tentativa em {delay:.1f}s")
+        _archive_attempt_files(out_dir, attempt)
+        time.sleep(delay)
+    result["attempts"] = attempts
+    return result
 
 # =====================================================================
-# Resumo (JSON + fallback stdout)
+# Engine nativo (HTTP em processo, sem Node) para collections sem scripts
 # =====================================================================
-def _safe_get(d, *keys, default=None):
-    cur = d
-    for k in keys:
-        if not isinstance(cur, dict) or k not in cur:
-            return default
-        cur = cur[k]
-    return cur
+# AUTOMATEST_ENGINE=cli (padrão) | auto: "auto" roda em Python as collections
+# sem pre-request/test scripts e cai para o Postman CLI nas demais.
+_RE_VAR = re.compile(r'\{\{\s*([^{}]+?)\s*\}\}')
+# caminho -> (mtime, meta); LRU limitado: no daemon, cópias temporárias (shard, collection enxuta)
+# entram com caminho novo a cada execução
+_NATIVE_CACHE = OrderedDict()
+_NATIVE_CACHE_LOCK = threading.Lock()
+NATIVE_CACHE_MAX = 256
 
-def summarize_run(report_path: str, stdout_text: str) -> dict:
-    items = []
-    total_requests = failed_requests = total_tests = failed_tests = 0
-    reason = None
+def engine_mode() -> str:
+    mode = os.getenv("AUTOMATEST_ENGINE", "cli").strip().lower()
+    return "auto" if mode in ("auto", "native") else "cli"
 
-    data = None
-    if report_path and os.path.exists(report_path):
+def _script_lines(events) -> bool:
+    for ev in events or []:
+        exec_ = (ev.get("script") or {}).get("exec") or []
+        if isinstance(exec_, str):
+            exec_ = [exec_]
+        if any(ln.strip() for ln in exec_):
+            return True
+    return False
+
+def _native_unsupported(node: dict) -> str:
+    """Motivo para não rodar nativamente (scripts, upload de arquivo...), ou None."""
+    if _script_lines(node.get("event")):
+        return f"scripts em '{node.get('name') or 'collection'}'"
+    req = node.get("request")
+    if isinstance(req, dict):
+        body = req.get("body") or {}
+        if body.get("mode") == "file" or any(p.get("type") == "file" for p in body.get("formdata") or []):
+            return f"upload de arquivo em '{node.get('name')}'"
+        auth_type = (req.get("auth") or {}).get("type")
+        if auth_type not in (None, "noauth", "inherit", "bearer", "basic", "apikey"):
+            return f"auth '{auth_type}' em '{node.get('name')}'"
+    for child in node.get("item") or []:
+        why = _native_unsupported(child)
+        if why:
+            return why
+    return None
+
+def load_collection_meta(collection_path: str) -> dict:
+    """Collection parseada + análise de suporte nativo, em cache por caminho (relida se o mtime muda)."""
+    path = os.path.abspath(collection_path)
+    mtime = os.path.getmtime(path)
+    meta = None
+    with _NATIVE_CACHE_LOCK:
+        entry = _NATIVE_CACHE.get(path)
+        if entry is not None and entry[0] == mtime:
+            meta = entry[1]
+            _NATIVE_CACHE.move_to_end(path)
+    if meta is None:
+        with open(path, "r", encoding="utf-8") as f:
+            col = json.load(f)
+        auth_type = (col.get("auth") or {}).get("type")
+        why = _native_unsupported(col)
+        if not why and auth_type not in (None, "noauth", "bearer", "basic", "apikey"):
+            why = f"auth '{auth_type}' na collection"
+        meta = {"collection": col, "unsupported": why}
+        with _NATIVE_CACHE_LOCK:
+            _NATIVE_CACHE[path] = (mtime, meta)  # substitui a versão anterior do arquivo
+            _NATIVE_CACHE.move_to_end(path)
+            while len(_NATIVE_CACHE) > NATIVE_CACHE_MAX:
+                _NATIVE_CACHE.popitem(last=False)
+    return meta
+
+def load_environment_values(environment_path: str) -> dict:
+    with open(environment_path, "r", encoding="utf-8") as f:
+        env = json.load(f)
+    # Chaves repetidas: vale a última habilitada (mesmo comportamento do Postman)
+    return {v["key"]: v.get("value", "") for v in env.get("values") or [] if v.get("enabled", True) and "key" in v}
+
+def _dynamic_var(name: str):
+    if name == "$guid" or name == "$randomUUID":
+        return str(uuid.uuid4())
+    if name == "$timestamp":
+        return str(int(time.time()))
+    if name == "$isoTimestamp":
+        return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+    if name == "$randomInt":
+        return str(random.randint(0, 1000))
+    return None
+
+def resolve_vars(value, variables: dict):
+    if not isinstance(value, str) or "{{" not in value:
+        return value
+
+    def sub(m):
+        name = m.group(1)
+        if name in variables:
+            return str(variables[name])
+        dyn = _dynamic_var(name)
+        return dyn if dyn is not None else m.group(0)
+
+    for _ in range(5):  # variáveis que apontam para variáveis
+        new = _RE_VAR.sub(sub, value)
+        if new == value:
+            break
+        value = new
+    return value
+
+def _iter_requests(node: dict, path=(), auth=None):
+    # Percorre folders em ordem, herdando auth (inherit/ausente = auth do pai)
+    own = node.get("auth")
+    if own and own.get("type") != "inherit":
+        auth = own
+    for child in node.get("item") or []:
+        if "item" in child:
+            yield from _iter_requests(child, path + (child.get("name") or "",), auth)
+        elif isinstance(child.get("request"), (dict, str)):
+            req = child["request"]
+            if isinstance(req, str):
+                req = {"method": "GET", "url": req}
+            req_auth = req.get("auth")
+            eff = auth if not req_auth or req_auth.get("type") == "inherit" else req_auth
+            yield path, child.get("name") or "request", req, eff
+
+def _kv(entries) -> dict:
+    return {e.get("key"): e.get("value") for e in entries or [] if isinstance(e, dict)}
+
+def build_native_request(req: dict, auth: dict, variables: dict) -> dict:
+    r = lambda v: resolve_vars(v, variables)
+    url = req.get("url")
+    if isinstance(url, dict):
+        url = url.get("raw") or ""
+    url = r(url or "")
+    if "://" not in url:
+        url = "http://" + url
+    headers = [(r(h.get("key")), r(h.get("value") or "")) for h in req.get("header") or []
+               if isinstance(h, dict) and not h.get("disabled")]
+    body = None
+    b = req.get("body") or {}
+    mode = b.get("mode")
+    if mode == "raw":
+        body = r(b.get("raw") or "").encode("utf-8")
+        lang = ((b.get("options") or {}).get("raw") or {}).get("language")
+        if lang == "json" and not any(k.lower() == "content-type" for k, _ in headers):
+            headers.append(("Content-Type", "application/json"))
+    elif mode == "urlencoded":
+        pairs = [(r(p.get("key")), r(p.get("value") or "")) for p in b.get("urlencoded") or [] if not p.get("disabled")]
+        body = urllib.parse.urlencode(pairs).encode("utf-8")
+        headers.append(("Content-Type", "application/x-www-form-urlencoded"))
+    elif mode == "formdata":
+        boundary = uuid.uuid4().hex
+        parts = []
+        for p in b.get("formdata") or []:
+            if p.get("disabled"):
+                continue
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{r(p.get("key"))}"\r\n\r\n'
+                         f'{r(p.get("value") or "")}\r\n')
+        body = ("".join(parts) + f"--{boundary}--\r\n").encode("utf-8")
+        headers.append(("Content-Type", f"multipart/form-data; boundary={boundary}"))
+    elif mode == "graphql":
+        gql = b.get("graphql") or {}
+        variables_raw = r(gql.get("variables") or "") or "{}"
         try:
-            with open(report_path, "r", encoding="utf-8", errors="replace") as f:
-                data = json.load(f)
-        except Exception as e:
-            reason = f"falha ao ler run.json: {e}"
+            gql_vars = json.loads(variables_raw)
+        except ValueError:
+            gql_vars = {}
+        body = json.dumps({"query": r(gql.get("query") or ""), "variables": gql_vars}).encode("utf-8")
+        headers.append(("Content-Type", "application/json"))
 
-    if data:
-        run_info = data.get("run", {}) if isinstance(data, dict) else {}
-        # Formato novo: run.summary + run.executions[*].tests
-        summary = run_info.get("summary")
-        executions = run_info.get("executions")
-        if isinstance(summary, dict) and isinstance(executions, list):
-            total_requests = int(_safe_get(summary, "executedRequests", "executed", default=0) or 0)
-            total_tests    = int(_safe_get(summary, "tests", "executed", default=0) or 0)
-            failed_tests   = int(_safe_get(summary, "tests", "failed", default=0) or 0)
-            failed_requests = 0
-            for ex in executions:
-                req = ex.get("requestExecuted") or ex.get("request") or {}
-                name = req.get("name") or "desconhecido"
-                status_code = None
-                resp = ex.get("response") or {}
-                code = resp.get("code")
-                if isinstance(code, int):
-                    status_code = code
-                tests = []
-                for t in ex.get("tests") or []:
-                    tname = t.get("name") or "teste"
-                    ok = (t.get("status") == "passed")
-                    tests.append({"name": tname, "ok": ok})
-                    if not ok:
-                        failed_tests += 1
-                items.append({"name": name, "status_code": status_code, "tests": tests})
+    atype = (auth or {}).get("type")
+    if atype == "bearer":
+        token = r(_kv(auth.get("bearer")).get("token") or "")
+        headers.append(("Authorization", f"Bearer {token}"))
+    elif atype == "basic":
+        kv = _kv(auth.get("basic"))
+        cred = f"{r(kv.get('username') or '')}:{r(kv.get('password') or '')}".encode("utf-8")
+        headers.append(("Authorization", "Basic " + base64.b64encode(cred).decode("ascii")))
+    elif atype == "apikey":
+        kv = _kv(auth.get("apikey"))
+        k, v = r(kv.get("key") or ""), r(kv.get("value") or "")
+        if kv.get("in") == "query":
+            url += ("&" if "?" in url else "?") + urllib.parse.urlencode({k: v})
         else:
-            # Formato antigo: run.stats + run.executions[*].assertions
-            stats = run_info.get("stats", {})
-            total_requests = int(_safe_get(stats, "requests", "total", default=0) or 0)
-            failed_requests = int(_safe_get(stats, "requests", "failed", default=0) or 0)
-            total_tests = int(_safe_get(stats, "tests", "total", default=0) or 0)
-            failed_tests = int(_safe_get(stats, "tests", "failed", default=0) or 0)
-            for ex in run_info.get("executions") or []:
-                item = ex.get("item", {}) or {}
-                name = item.get("name") or "desconhecido"
-                status_code = None
-                resp = (ex.get("response") or {})
-                if isinstance(resp, dict):
-                    try:
-                        status_code = int(resp.get("code"))
-                    except Exception:
-                        status_code = None
-                tests = []
-                for a in ex.get("assertions") or []:
-                    tname = a.get("assertion") or "teste"
-                    ok = not bool(a.get("error"))
-                    tests.append({"name": tname, "ok": ok})
-                items.append({"name": name, "status_code": status_code, "tests": tests})
+            headers.append((k, v))
+    return {"method": (req.get("method") or "GET").upper(), "url": url, "headers": headers, "body": body}
 
-    # Completa com stdout (nome, status e testes bonitos)
-    stdout_items = parse_cli_stdout(stdout_text or "")
-    if stdout_items:
-        by_name = {it["name"]: it for it in items if it.get("name")}
-        for s in stdout_items:
-            base = by_name.get(s["name"])
-            if base:
-                if base.get("status_code") is None and s.get("status_code") is not None:
-                    base["status_code"] = s["status_code"]
-                already = {t["name"] for t in base.get("tests", [])}
-                for t in s.get("tests", []):
-                    if t["name"] not in already:
-                        base.setdefault("tests", []).append(t)
-            else:
-                items.append(s)
+# Métodos que podem ser reenviados com segurança se a conexão cair no meio (RFC 9110 §9.2.2)
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
 
-    if items:
-        total_requests = max(total_requests, len(items))
-        if total_tests == 0:
-            total_tests = sum(len(i.get("tests", [])) for i in items)
-        if failed_tests == 0:
-            failed_tests = sum(1 for i in items for t in i.get("tests", []) if not t.get("ok", False))
+class HttpPool:
+    """Conexões keep-alive por (esquema, host, porta); uma instância por thread."""
 
-    ok = (failed_requests == 0 and failed_tests == 0 and total_requests > 0 and total_tests >= 0)
-    return {
-        "ok": ok,
-        "reason": reason or (None if total_requests > 0 else "sem requests contabilizados"),
-        "total_requests": total_requests,
-        "failed_requests": failed_requests,
-        "total_tests": total_tests,
-        "failed_tests": failed_tests,
-        "items": items
-    }
+    def __init__(self, timeout: float = 30.0, insecure: bool = False):
+        self.timeout = timeout
+        self.context = ssl._create_unverified_context() if insecure else ssl.create_default_context()
+        self.conns = {}
 
-# =====================================================================
-# Texto e HTML do relatório
-# =====================================================================
-def style_block_collection_text(title: str, summary: dict) -> str:
-    status = "✅ OK" if summary.get("ok") else "❌ PROBLEMA"
-    lines = [f"#### {title} — {status}"]
-    lines.append(f"- Requests: {summary.get('total_requests',0)}")
-    lines.append(f"- Tests: {summary.get('total_tests',0)} (falhas: {summary.get('failed_tests',0)})")
-    if summary.get("reason"):
-        lines.append(f"- Observação: {summary['reason']}")
-    if summary.get("items"):
-        lines.append("- Requisições e testes:")
-        for it in summary["items"]:
-            sc = it.get("status_code")
-            sc_str = f"HTTP {sc}" if sc is not None else ""
-            nm = it.get("name") or ""
-            lines.append(f"  •  {nm} {sc_str}".rstrip())
-            if it.get("tests"):
-                for t in it["tests"]:
-                    mark = "✓" if t.get("ok") else "✗"
-                    lines.append(f"    {mark} {t.get('name')}")
+    def _conn(self, scheme, host, port):
+        key = (scheme, host, port)
+        conn = self.conns.get(key)
+        if conn is None:
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.context)
             else:
-                lines.append("    (sem testes definidos)")
-    return "\n".join(lines)
+                conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+            self.conns[key] = conn
+        return key, conn
 
-def build_human_report(grouped_results: dict) -> str:
-    lines = ["# Relatório de Execução (Postman CLI)", ""]
-    for proj, envs in sorted(grouped_results.items()):
-        lines.append(f"## {proj}")
-        for env_label, items in sorted(envs.items()):
-            lines.append(f"### Environment: {env_label}")
-            for it in items:
-                title = it["collection_name"]
-                lines.append(style_block_collection_text(title, it["summary"]))
-                lines.append("")
-            lines.append("")
-        lines.append("")
-    lines.extend([
-        "---",
-        "### Dicas rápidas",
-        "- Se **nenhum request** foi contado, confirme AUTH/ENV (tokens, URLs) e se a coleção não está filtrada por folder.",
-        "- Se houver **exit code ≠ 0**, veja as últimas linhas do stderr acima para pistas imediatas.",
-        "- Falhas de teste listam o *assert* que quebrou; ajuste o pre-request/headers/body ou o teste conforme necessário."
-    ])
-    return "\n".join(lines)
+    def request(self, method: str, url: str, headers: list, body: bytes = None):
+        status, reason, data, _ = self.exchange(method, url, headers, body)
+        return status, reason, data
 
-def _badge(ok: bool) -> str:
-    color = "#16a34a" if ok else "#dc2626"
-    text  = "OK" if ok else "FALHA"
-    return f'<span style="display:inline-block;padding:2px 8px;border-radius:9999px;background:{color};color:#fff;font:12px/1.4 system-ui,Segoe UI,Arial">{text}</span>'
+    def exchange(self, method: str, url: str, headers: list, body: bytes = None):
+        """Como request(), mais os cabeçalhos da resposta: (status, reason, corpo, [(nome, valor)])."""
+        u = urllib.parse.urlsplit(url)
+        scheme = u.scheme.lower() or "http"
+        port = u.port or (443 if scheme == "https" else 80)
+        target = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        retry_safe = method.upper() in IDEMPOTENT_METHODS
+        for attempt in (1, 2):
+            key, conn = self._conn(scheme, u.hostname, port)
+            sent = False
+            try:
+                conn.putrequest(method, target, skip_accept_encoding=True)
+                for k, v in headers:
+                    conn.putheader(k, v)
+                if body is not None:
+                    conn.putheader("Content-Length", str(len(body)))
+                conn.endheaders(body)
+                sent = True
+                resp = conn.getresponse()
+                data = resp.read()
+                if resp.will_close:
+                    conn.close()
+                    self.conns.pop(key, None)
+                return resp.status, resp.reason, data, resp.getheaders()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # Conexão ociosa fechada pelo servidor: reabre uma vez. Se o pedido já foi
+                # escrito, só reenvia métodos idempotentes (um POST pode ter sido processado)
+                conn.close()
+                self.conns.pop(key, None)
+                if attempt == 2 or (sent and not retry_safe):
+                    raise
+            except Exception:
+                conn.close()
+                self.conns.pop(key, None)
+                raise
 
-def build_html_report(grouped_results: dict) -> str:
-    html = [
-        '<div style="font-family:system-ui,Segoe UI,Arial;font-size:14px;color:#0f172a">',
-        '<h2 style="margin:0 0 12px">Relatório de Execução (Postman CLI)</h2>'
-    ]
-    for proj, envs in sorted(grouped_results.items()):
-        html.append(f'<h3 style="margin:18px 0 6px">{escape(proj)}</h3>')
-        for env_label, items in sorted(envs.items()):
-            html.append(f'<h4 style="margin:12px 0 6px">Environment: {escape(env_label)}</h4>')
-            for it in items:
-                summ = it["summary"]
-                ok = bool(summ.get("ok"))
-                html.append('<div style="border:1px solid #e5e7eb;border-radius:12px;padding:12px;margin:8px 0">')
-                html.append(f'<div style="display:flex;justify-content:space-between;align-items:center;gap:12px;margin-bottom:6px">'
-                            f'<div style="font-weight:600">{escape(it["collection_name"])}</div>{_badge(ok)}</div>')
-                html.append('<div style="color:#334155;margin-bottom:8px">')
-                html.append(f'<div>Requests: <b>{summ.get("total_requests",0)}</b></div>')
-                html.append(f'<div>Tests: <b>{summ.get("total_tests",0)}</b> (falhas: <b>{summ.get("failed_tests",0)}</b>)</div>')
-                reason = summ.get("reason")
-                if reason:
-                    html.append(f'<div>Obs.: {escape(reason)}</div>')
-                html.append('</div>')
-                html.append('<table style="width:100%;border-collapse:collapse;border:1px solid #e5e7eb">'
-                            '<thead><tr>'
-                            '<th style="text-align:left;padding:6px;border-bottom:1px solid #e5e7eb;background:#f8fafc">Request</th>'
-                            '<th style="text-align:left;padding:6px;border-bottom:1px solid #e5e7eb;background:#f8fafc">HTTP</th>'
-                            '<th style="text-align:left;padding:6px;border-bottom:1px solid #e5e7eb;background:#f8fafc">Testes</th>'
-                            '</tr></thead><tbody>')
-                for it2 in summ.get("items", []):
-                    nm  = escape(it2.get("name") or "")
-                    sc  = it2.get("status_code")
-                    scs = str(sc) if sc is not None else "-"
-                    tests = it2.get("tests") or []
-                    if tests:
-                        tests_html = "<ul style='margin:6px 0;padding-left:18px'>"
-                        for t in tests:
-                            li_badge = _badge(bool(t.get("ok")))
-                            tests_html += f"<li>{li_badge} {escape(t.get('name') or '')}</li>"
-                        tests_html += "</ul>"
-                    else:
-                        tests_html = "<em>(sem testes definidos)</em>"
-                    html.append(f"<tr>"
-                                f"<td style='vertical-align:top;padding:6px;border-bottom:1px solid #f1f5f9'>{nm}</td>"
-                                f"<td style='vertical-align:top;padding:6px;border-bottom:1px solid #f1f5f9'>{scs}</td>"
-                                f"<td style='vertical-align:top;padding:6px;border-bottom:1px solid #f1f5f9'>{tests_html}</td>"
-                                f"</tr>")
-                html.append('</tbody></table>')
-                html.append('</div>')
-    html.append('<p style="margin-top:12px;color:#64748b">Gerado automaticamente.</p>')
-    html.append('</div>')
-    return "".join(html)
+    def close(self):
+        for conn in self.conns.values():
+            conn.close()
+        self.conns.clear()
 
-# =====================================================================
-# E-mail (SSL 465 ou STARTTLS) — destinatários SOMENTE constants.EMAIL_RECIPIENTS
-# =====================================================================
-def send_mail(subject: str, body_md: str, body_html: str, attachments: list, cfg: dict) -> bool:
-    must = ("SMTP_HOST","SMTP_USER","SMTP_PASS","MAIL_FROM")
-    if not all(cfg.get(k) for k in must):
-        print("E-mail: configuração SMTP incompleta.")
-        return False
+_HTTP_POOLS = threading.local()
 
-    recipients = EMAIL_RECIPIENTS or []
-    if not recipients:
-        print("E-mail: nenhum destinatário definido em constants.EMAIL_RECIPIENTS.")
-        return False
+def http_pool() -> HttpPool:
+    pool = getattr(_HTTP_POOLS, "pool", None)
+    if pool is None:
+        try:
+            timeout = float(os.getenv("AUTOMATEST_HTTP_TIMEOUT", "") or 30)
+        except ValueError:
+            timeout = 30.0
+        insecure = os.getenv("AUTOMATEST_HTTP_INSECURE", "").lower() in ("1", "true", "yes")
+        pool = _HTTP_POOLS.pool = HttpPool(timeout, insecure)
+    return pool
 
-    msg = EmailMessage()
-    msg["From"] = cfg["MAIL_FROM"]
-    msg["To"] = ", ".join(recipients)
-    msg["Subject"] = subject
-    msg["Reply-To"] = cfg["MAIL_FROM"]
-    msg["X-Automation"] = "Automatest-Postman-CLI"
-    msg.set_content(body_md or "Relatório em HTML anexo.")
-    if body_html:
-        msg.add_alternative(body_html, subtype="html")
+def _fmt_size(n: int) -> str:
+    return f"{n}B" if n < 1000 else f"{n / 1000:.1f}kB"
 
-    for path in attachments or []:
-        if path and os.path.exists(path):
-            with open(path, "rb") as f:
-                data = f.read()
-            fname = os.path.basename(path)
-            if fname.endswith(".json"):
-                maintype, subtype = "application", "json"
-            elif fname.endswith(".txt"):
-                maintype, subtype = "text", "plain"
-            else:
-                maintype, subtype = "application", "octet-stream"
-            msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=fname)
+def run_native(collection_path: str, environment_path: str, out_dir: str, timeout: float = None,
+               iterations: int = 1, env_vars: dict = None):
+    """
+    Executa a collection em processo. Devolve o mesmo formato de run_collection
+    (sem run.json; os itens vão em stdout_items).
+    """
+    meta = load_collection_meta(collection_path)
+    col = meta["collection"]
+    out_dir_abs = os.path.abspath(out_dir)
+    ensure_dir(out_dir_abs)
+    out_txt = os.path.join(out_dir_abs, "cli.log.txt")
+    base_vars = {**_kv(col.get("variable")), **load_environment_values(environment_path), **(env_vars or {})}
+    deadline = time.monotonic() + timeout if timeout else None
+    pool = http_pool()
+    items, tail = [], deque(maxlen=STDOUT_TAIL_LINES)
+    timed_out = False
+    errors = 0
+    with open(out_txt, "w", encoding="utf-8", errors="replace") as f:
+        def emit(line):
+            f.write(line + "\n")
+            tail.append(line)
+
+        emit(f"automatest (engine nativo)\n\n{(col.get('info') or {}).get('name') or ''}")
+        for it_i in range(max(1, iterations)):
+            if iterations > 1:
+                emit(f"\nIteration {it_i + 1}/{iterations}")
+            for path, name, req, auth in _iter_requests(col):
+                if deadline and time.monotonic() >= deadline:
+                    timed_out = True
+                    break
+                prepared = build_native_request(req, auth, base_vars)
+                emit(f"\n→ {name}")
+                item = {"name": name, "status_code": None, "tests": [],
+                        "folder": " / ".join(path) or None, "iteration": it_i,
+                        "started_at": datetime.datetime.now().isoformat(timespec="milliseconds")}
+                t0 = time.perf_counter()
+                try:
+                    status, reason, data = pool.request(prepared["method"], prepared["url"],
+                                                        prepared["headers"], prepared["body"])
+                    item["response_time_ms"] = (time.perf_counter() - t0) * 1000
+                    item["status_code"] = status
+                    item["response_size"] = len(data)
+                    emit(f"  {prepared['method']} {prepared['url']} [{status} {reason}, "
+                         f"{_fmt_size(len(data))}, {item['response_time_ms']:.0f}ms]")
+                except Exception as e:
+                    errors += 1
+                    item["tests"].append({"name": f"erro de rede: {e}", "ok": False})
+                    emit(f"  {prepared['method']} {prepared['url']} [erro: {e}]")
+                items.append(item)
+            if timed_out:
+                break
+    return {
+        "cmd": f"native {os.path.basename(collection_path)}",
+        "returncode": 1 if errors else 0,
+        "timed_out": timed_out,
+        "stdout": "\n".join(tail),
+        "stderr": "",
+        "stdout_items": items,
+        "report_path": None,
+        "stdout_path": out_txt,
+    }
 
-    host = cfg["SMTP_HOST"]; port = int(cfg.get("SMTP_PORT","465"))
+def pick_runner(collection_path: str):
+    """run_native quando o engine permite e a collection não tem scripts; senão run_collection."""
+    if engine_mode() == "cli":
+        return run_collection
     try:
-        if port == 465:
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(host, port, context=context) as server:
-                server.login(cfg["SMTP_USER"], cfg["SMTP_PASS"])
-                resp = server.send_message(msg)
-        else:
-            with smtplib.SMTP(host, port, timeout=30) as server:
-                if str(cfg.get("SMTP_USE_TLS","true")).lower() in ("1","true","yes","y"):
-                    server.starttls(context=ssl.create_default_context())
-                server.login(cfg["SMTP_USER"], cfg["SMTP_PASS"])
-                resp = server.send_message(msg)
-
-        if resp:  # dicionário de rejeitados
-            print("E-mail: destinatários rejeitados:", resp)
-            return False
-        return True
-    except Exception as e:
-        print("E-mail: erro de envio:", e)
-        return False
+        meta = load_collection_meta(collection_path)
+    except (OSError, ValueError) as e:
+        print(f"[engine] {os.path.basename(collection_path)}: falha ao ler ({e}); usando Postman CLI")
+        return run_collection
+    if meta["unsupported"]:
+        print(f"[engine] {os.path.basename(collection_path)}: {meta['unsupported']}; usando Postman CLI")
+        return run_collection
+    return run_native
 
 # =====================================================================
-# UI Terminal
+# Cache de tokens de login (por environment + credenciais)
 # =====================================================================
-def prompt_menu(options, title="Como deseja executar?"):
-    print(f"\n{title}")
-    for i, opt in enumerate(options, start=1):
-        print(f"{i}) {opt}")
-    while True:
-        sel = input("> ").strip()
-        if sel.isdigit():
-            idx = int(sel) - 1
-            if 0 <= idx < len(options):
-                return idx
-        print("Entrada inválida. Digite o número da opção.")
+# Requests de login (AUTOMATEST_AUTH_REQUESTS) rodam só no primeiro job de cada
+# environment; os tokens (AUTOMATEST_TOKEN_VARS) saem do environment final do run
+# e entram nos jobs seguintes num environment temporário (0600), com a collection sem os logins.
+_TOKEN_CACHE = {}
+_TOKEN_LOCKS = {}
+_TOKEN_LOCKS_GUARD = threading.Lock()
 
-def choose_project(root: str):
-    projects = list_projects(root)
-    if not projects:
-        print("Nenhum projeto encontrado em 'collections/'.")
-        return None
-    idx = prompt_menu(projects, "Qual projeto deseja executar?")
-    return projects[idx]
+def _csv_env(name: str, default: str = "") -> list:
+    return [p.strip() for p in (os.getenv(name, default) or "").split(",") if p.strip()]
+
+def token_cache_config() -> dict:
+    auth_requests = _csv_env("AUTOMATEST_AUTH_REQUESTS")
+    return {
+        "enabled": bool(auth_requests),
+        "auth_requests": auth_requests,
+        "token_vars": _csv_env("AUTOMATEST_TOKEN_VARS", "ACCESS_TOKEN,REFRESH_TOKEN"),
+        "default_ttl": max(0, _env_int("AUTOMATEST_TOKEN_TTL", 300)),
+        "export_flag": os.getenv("AUTOMATEST_EXPORT_ENVIRONMENT", "").lower() in ("1", "true", "yes"),
+    }
+
+def token_cache_key(environment_path: str, token_vars: list) -> str:
+    # Environment + todas as variáveis que não são token (credenciais, URLs, tenant...)
+    values = load_environment_values(environment_path)
+    creds = {k: v for k, v in values.items() if k not in token_vars}
+    raw = json.dumps([os.path.abspath(environment_path), sorted(creds.items())], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _keyed_lock(key: str):
+    with _TOKEN_LOCKS_GUARD:
+        return _TOKEN_LOCKS.setdefault(key, threading.Lock())
+
+def _jwt_exp(token: str):
+    parts = (token or "").split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(parts[1] + "=" * (-len(parts[1]) % 4)))
+        exp = payload.get("exp")
+        return float(exp) if isinstance(exp, (int, float)) else None
+    except (ValueError, TypeError):
+        return None
+
+def cached_tokens(key: str):
+    entry = _TOKEN_CACHE.get(key)
+    if entry and entry["expires_at"] > time.time():
+        return entry["values"]
+    _TOKEN_CACHE.pop(key, None)
+    return None
+
+def store_tokens(key: str, values: dict, default_ttl: int):
+    # Expiração: menor "exp" dos JWTs (com 60s de folga) ou o TTL padrão
+    now = time.time()
+    exps = [e for e in (_jwt_exp(v) for v in values.values()) if e]
+    expires_at = min(exps) - 60 if exps else now + default_ttl
+    if expires_at > now:
+        _TOKEN_CACHE[key] = {"values": values, "expires_at": expires_at}
+
+def invalidate_tokens(key: str, values: dict = None):
+    # Com `values`: só descarta se o cache ainda tem esses tokens (outro job pode ter logado de novo)
+    with _keyed_lock(key):
+        entry = _TOKEN_CACHE.get(key)
+        if entry and (values is None or entry["values"] is values):
+            _TOKEN_CACHE.pop(key, None)
+
+def read_run_environment(report_path: str = None, exported_path: str = None) -> dict:
+    """Valores finais do environment: arquivo do --export-environment ou a chave "environment" do run.json."""
+    if exported_path and os.path.exists(exported_path):
+        try:
+            return load_environment_values(exported_path)
+        except (OSError, ValueError):
+            pass
+    if not report_path or not os.path.exists(report_path):
+        return {}
+    if ijson is not None:
+        f = open(report_path, "rb")
+        events = ijson.parse(f)
+    else:
+        f = open(report_path, "r", encoding="utf-8", errors="replace")
+        events = _json_events_py(f)
+    with f:
+        events = iter(events)
+        for p, ev, val in events:
+            if p == "environment.values" and ev == "start_array":
+                values = _build_json_value(events, ev, val, p)
+                return {v["key"]: v.get("value") for v in values
+                        if isinstance(v, dict) and v.get("enabled", True) and "key" in v}
+            if p == "run" and ev == "start_map":
+                # O Postman/newman escreve o environment antes de "run": não há mais o que achar
+                return {}
+    return {}
+
+def collection_without_requests(collection_path: str, names: list, out_path: str) -> str:
+    """Grava uma cópia da collection sem os requests de login (em qualquer folder)."""
+    col = load_collection_meta(collection_path)["collection"]
+    wanted = set(names)
+
+    def prune(node):
+        out = dict(node)
+        if "item" in node:
+            out["item"] = [prune(ch) for ch in node["item"] if ("item" in ch or ch.get("name") not in wanted)]
+        return out
+
+    ensure_dir(os.path.dirname(os.path.abspath(out_path)))
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(prune(col), f, ensure_ascii=False)
+    return out_path
+
+def _login_ok(items: list, names: list) -> bool:
+    login = [it for it in items if it.get("name") in names]
+    return bool(login) and all(
+        it.get("status_code") is not None and it["status_code"] < 400 and all(t.get("ok") for t in it.get("tests", []))
+        for it in login
+    )
+
+def run_with_token_cache(collection_path: str, environment_path: str, out_dir: str, cfg: dict = None):
+    """
+    Roda o job usando/alimentando o cache de tokens. Devolve (result, nota) — a nota
+    explica no relatório se o login veio do cache.
+    """
+    cfg = cfg or token_cache_config()
+    try:
+        key = token_cache_key(environment_path, cfg["token_vars"])
+    except (OSError, ValueError):
+        return run_collection_with_retry(collection_path, environment_path, out_dir), None
+
+    # A trava só cobre a leitura do cache e o primeiro login (quem chega junto espera o token
+    # em vez de logar de novo); com token em mãos os jobs rodam em paralelo, fora dela.
+    with _keyed_lock(key):
+        tokens = cached_tokens(key)
+        if not tokens:
+            # --export-environment só com AUTOMATEST_EXPORT_ENVIRONMENT=1 (depende da versão do CLI);
+            # sem ele, os valores finais vêm da chave "environment" do run.json
+            exported = os.path.join(os.path.abspath(out_dir), "environment.out.json")
+            extra = ["--export-environment", exported] if cfg["export_flag"] else None
+            result = run_collection_with_retry(collection_path, environment_path, out_dir, extra_args=extra)
+            if _login_ok(result.get("stdout_items") or [], cfg["auth_requests"]):
+                final_env = read_run_environment(result.get("report_path"), exported)
+                values = {k: final_env[k] for k in cfg["token_vars"] if final_env.get(k)}
+                if values:
+                    store_tokens(key, values, cfg["default_ttl"])
+            return result, None
+
+    pruned = collection_without_requests(
+        collection_path, cfg["auth_requests"], os.path.join(out_dir, "collection.cached-auth.json"))
+    result = run_collection_with_retry(pruned, environment_path, out_dir, env_vars=tokens)
+    # 401 com token do cache: descarta para o próximo job logar de novo
+    if any(it.get("status_code") == 401 for it in result.get("stdout_items") or []):
+        invalidate_tokens(key, tokens)
+    return result, f"tokens em cache ({', '.join(cfg['auth_requests'])} não executados)"
+
+# =====================================================================
+# Agendador (pool de workers com limites por projeto/environment)
+# =====================================================================
+def scheduler_config(jobs: int = None) -> dict:
+    # --jobs tem prioridade sobre AUTOMATEST_WORKERS; limites <= 0 = sem limite
+    workers = jobs if jobs else _env_int("AUTOMATEST_WORKERS", 1)
+    return {
+        "workers": max(1, workers),
+        "max_per_project": _env_int("AUTOMATEST_MAX_PER_PROJECT", 0),
+        "max_per_env": _env_int("AUTOMATEST_MAX_PER_ENV", 1),
+    }
+
+def job_out_dir(base_log_dir: str, job: dict) -> str:
+    # Uma pasta por collection (e por shard): jobs paralelos não sobrescrevem run.json
+    col_label = os.path.splitext(os.path.basename(job["collection"]))[0]
+    out = os.path.join(base_log_dir, job["project"], env_label_from_path(job["environment"]), col_label)
+    if job.get("shard"):
+        out = os.path.join(out, f"shard-{job['shard']['index'] + 1:02d}")
+    elif job.get("data"):
+        out = os.path.join(out, f"data-{job['data']['index'] + 1:04d}")
+    return out
+
+def execute_job(job: dict, base_log_dir: str) -> dict:
+    shard = job.get("shard")
+    name = f"{job['project']} / {env_label_from_path(job['environment'])} / {os.path.basename(job['collection'])}"
+    t = time.perf_counter()
+    with TRACER.span(name, cat="job", shard=f"{shard['index'] + 1}/{shard['count']}" if shard else None):
+        res = _execute_job(job, base_log_dir)
+    res["duration_s"] = round(time.perf_counter() - t, 3)  # alimenta o custo estimado (ordem dos jobs)
+    return res
+
+def _execute_job(job: dict, base_log_dir: str) -> dict:
+    proj = job["project"]
+    col = job["collection"]
+    env = job["environment"]
+    out_dir = job_out_dir(base_log_dir, job)
+
+    shard = job.get("shard")
+    data = job.get("data")
+    shard_str = f" | shard {shard['index'] + 1}/{shard['count']} ({', '.join(shard['folders'])})" if shard else ""
+    if data:
+        shard_str = (f" | dados {os.path.basename(data['path'])} bloco {data['index'] + 1}/{data['count']} "
+                     f"(linhas {data['first_row'] + 1}-{data['first_row'] + data['rows']})")
+    print(f"\n=== Executando: {proj} | env={os.path.basename(env)} | col={os.path.basename(col)}{shard_str}")
+    stub = None
+    if job.get("cassette"):
+        # Gravação/replay: o environment usado aponta as URLs base para o stub local (mesmo label)
+        stub, env, why = start_cassette(job, out_dir)
+        if why:
+            print(f"[cassette] {os.path.basename(col)}: {why}")
+            return failed_job_result(job, f"{job['cassette']}: {why}")
+        job = {**job, "environment": env}
+    auth_note = None
+    setup = None
+    token_cfg = token_cache_config()
+    try:
+        if shard:
+            setup = shared_setup(job, base_log_dir)
+            shard_col = collection_subset(col, shard["folders"], os.path.join(out_dir, "collection.shard.json"))
+            result = run_collection_with_retry(shard_col, env, out_dir, env_vars=setup["vars"] or None)
+        elif data:
+            chunk = write_data_chunk(data, os.path.join(out_dir, "data.chunk"))
+            # -d é flag do Postman CLI: blocos de dados nunca vão para o engine nativo
+            result = run_collection_with_retry(col, env, out_dir, extra_args=["-d", chunk], runner=run_collection)
+        elif token_cfg["enabled"]:
+            result, auth_note = run_with_token_cache(col, env, out_dir, token_cfg)
+        else:
+            result = run_collection_with_retry(col, env, out_dir)
+    finally:
+        if stub:
+            stub.close()
+
+    # Anexos do e-mail
+    attachments = [p for p in (result.get("report_path"), result.get("stdout_path")) if p]
+
+    # Resumo (JSON + fallback no stdout)
+    with TRACER.span("resumo", cat="parse"):
+        summary = summarize_run(result.get("report_path"), result.get("stdout"), result.get("stdout_items"),
+                                attempts=result.get("attempts"))
+    if auth_note:
+        summary["auth_note"] = auth_note
+    if stub:
+        summary["cassette_note"] = stub.note()
+        if stub.misses:
+            summary["ok"] = False
+            summary["reason"] = "; ".join(filter(None, (summary.get("reason"),
+                                                        f"replay: {stub.misses} request(s) sem gravação")))
+    if data:
+        rebase_data_items(summary, data)  # compactados só depois do on_result (compact_result)
+
+    return {
+        "project": proj,
+        "env_label": env_label_from_path(env),
+        "collection_name": os.path.basename(col),
+        "summary": summary,
+        "attachments": attachments,
+        "shard": shard,
+        "data": data,
+        "latency_samples": None,
+        "setup": setup,
+        "exec_meta": {
+            "returncode": result["returncode"],
+            "timed_out": result["timed_out"],
+            "attempts": result["attempts"],
+            "stderr": result["stderr"],
+            "stdout": result["stdout"],
+            "cmd": result["cmd"]
+        }
+    }
+
+def run_plan(exec_plan: list, base_log_dir: str, workers: int = 1,
+             max_per_project: int = 0, max_per_env: int = 1, on_result=None) -> list:
+    """
+    Executa os jobs do plano num pool limitado de threads.
+    - Nunca roda mais que `max_per_project` jobs do mesmo projeto nem `max_per_env`
+      jobs contra o mesmo environment ao mesmo tempo (<= 0 = sem limite).
+    - Retorna os resultados na MESMA ordem de `exec_plan` (determinístico).
+    """
+    results = [None] * len(exec_plan)
+    pending = list(range(len(exec_plan)))
+    # running_env: env -> {unidade: jobs}; shards da mesma collection contam como uma unidade
+    running_proj, running_env = {}, {}
+    cond = threading.Condition()
+    errors = []
+
+    def keys(idx):
+        job = exec_plan[idx]
+        unit = job.get("shard_group") or f"job-{idx}"
+        return job["project"], os.path.abspath(job["environment"]), unit
+
+    def can_start(idx):
+        proj, env, unit = keys(idx)
+        if max_per_project > 0 and running_proj.get(proj, 0) >= max_per_project:
+            return False
+        units = running_env.get(env, {})
+        if max_per_env > 0 and unit not in units and len(units) >= max_per_env:
+            return False
+        return True
+
+    def worker():
+        while True:
+            with cond:
+                idx = None
+                while idx is None:
+                    if not pending or errors:
+                        return
+                    idx = next((i for i in pending if can_start(i)), None)
+                    if idx is None:
+                        cond.wait()
+                pending.remove(idx)
+                proj, env, unit = keys(idx)
+                running_proj[proj] = running_proj.get(proj, 0) + 1
+                units = running_env.setdefault(env, {})
+                units[unit] = units.get(unit, 0) + 1
+            try:
+                results[idx] = execute_job(exec_plan[idx], base_log_dir)
+                if on_result:
+                    on_result(exec_plan[idx], results[idx])
+                compact_result(results[idx])
+            except BaseException as e:
+                with cond:
+                    errors.append(e)
+            finally:
+                with cond:
+                    running_proj[proj] -= 1
+                    units = running_env[env]
+                    units[unit] -= 1
+                    if not units[unit]:
+                        del units[unit]
+                    cond.notify_all()
+
+    n = max(1, min(workers, len(exec_plan)))
+    if n == 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=worker, name=f"automatest-worker-{i}", daemon=True) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+def group_results(results: list) -> dict:
+    grouped = {}
+    for res in results:
+        if not res:
+            continue
+        grouped.setdefault(res["project"], {}).setdefault(res["env_label"], []).append(res)
+    return grouped
+
+# =====================================================================
+# Sharding: uma collection dividida por folder de primeiro nível
+# =====================================================================
+# Requests soltos no topo (ex.: Auth) são o "setup": rodam uma vez por
+# collection/environment e as variáveis que eles definem vão para cada shard.
+# Anotações na descrição do item:
+#   @automatest setup           -> folder de topo que também é setup
+#   @automatest depends: A, B   -> folder que precisa rodar junto (mesmo shard) de A e B
+#   @automatest no-shard        -> na descrição da collection: nunca dividir
+_RE_ANNOT_DEPENDS = re.compile(r'@automatest\s+depends:\s*([^\n\r]+)', re.IGNORECASE)
+_SHARD_SETUPS = {}
+
+def sharding_enabled(flag: bool = False) -> bool:
+    return flag or os.getenv("AUTOMATEST_SHARD", "").lower() in ("1", "true", "yes")
+
+def _description(node: dict) -> str:
+    desc = node.get("description") or (node.get("info") or {}).get("description") or ""
+    if isinstance(desc, dict):
+        desc = desc.get("content") or ""
+    return desc if isinstance(desc, str) else ""
+
+def plan_shards(collection: dict):
+    """(nomes do setup, [[folders do shard], ...]) — menos de 2 shards = não dividir."""
+    if "@automatest no-shard" in _description(collection).lower():
+        return [], []
+    setup, folders, depends = [], [], {}
+    for it in collection.get("item") or []:
+        name = it.get("name") or ""
+        desc = _description(it).lower()
+        if "item" not in it or "@automatest setup" in desc:
+            setup.append(name)
+            continue
+        folders.append(name)
+        m = _RE_ANNOT_DEPENDS.search(_description(it))
+        if m:
+            depends[name] = [d.strip() for d in m.group(1).split(",") if d.strip()]
+
+    # Union-find: folders com dependência entre si caem no mesmo shard
+    parent = {f: f for f in folders}
+
+    def find(f):
+        while parent[f] != f:
+            parent[f] = parent[parent[f]]
+            f = parent[f]
+        return f
+
+    for f, deps in depends.items():
+        for d in deps:
+            if d in parent:
+                parent[find(f)] = find(d)
+    groups = {}
+    for f in folders:
+        groups.setdefault(find(f), []).append(f)
+    shards = list(groups.values())
+    return (setup, shards) if len(shards) >= 2 else ([], [])
+
+def shard_plan(exec_plan: list) -> list:
+    """Expande cada job em shards (quando dá); todo job ganha "parent" = índice no plano original."""
+    out = []
+    for idx, job in enumerate(exec_plan):
+        try:
+            setup, shards = plan_shards(load_collection_meta(job["collection"])["collection"])
+        except (OSError, ValueError):
+            setup, shards = [], []
+        if not shards:
+            out.append({**job, "parent": idx})
+            continue
+        group = f"{os.path.abspath(job['collection'])}|{os.path.abspath(job['environment'])}"
+        for i, folders in enumerate(shards):
+            out.append({**job, "parent": idx, "shard_group": group,
+                        "shard": {"index": i, "count": len(shards), "folders": folders, "setup": setup}})
+    return out
+
+def collection_subset(collection_path: str, names: list, out_path: str) -> str:
+    """Cópia da collection só com os itens de topo em `names` (auth/variáveis/eventos mantidos)."""
+    col = load_collection_meta(collection_path)["collection"]
+    wanted = set(names)
+    sub = dict(col)
+    sub["item"] = [it for it in col.get("item") or [] if it.get("name") in wanted]
+    ensure_dir(os.path.dirname(os.path.abspath(out_path)))
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(sub, f, ensure_ascii=False)
+    return out_path
+
+def shared_setup(job: dict, base_log_dir: str) -> dict:
+    """Roda o setup da collection uma única vez por execução; os outros shards esperam e reaproveitam."""
+    col, env = job["collection"], job["environment"]
+    key = f"setup|{base_log_dir}|{job['shard_group']}"
+    with _keyed_lock(key):
+        if key in _SHARD_SETUPS:
+            return _SHARD_SETUPS[key]
+        names = job["shard"]["setup"]
+        entry = {"vars": {}, "summary": None, "attachments": []}
+        if names:
+            # com workers distribuídos cada um roda o próprio setup: pastas separadas
+            setup_dir = f"_setup-{_WORKER_NAME}" if _WORKER_NAME else "_setup"
+            out_dir = os.path.join(os.path.dirname(job_out_dir(base_log_dir, job)), setup_dir)
+            sub = collection_subset(col, names, os.path.join(out_dir, "collection.setup.json"))
+            exported = os.path.join(os.path.abspath(out_dir), "environment.out.json")
+            extra = ["--export-environment", exported] if token_cache_config()["export_flag"] else None
+            print(f"[shard] setup de {os.path.basename(col)} | env={os.path.basename(env)}: {', '.join(names)}")
+            result = run_collection_with_retry(sub, env, out_dir, extra_args=extra)
+            original = load_environment_values(env)
+            final_env = read_run_environment(result.get("report_path"), exported)
+            entry["vars"] = {k: v for k, v in final_env.items() if v not in (None, "") and v != original.get(k)}
+            entry["summary"] = summarize_run(result.get("report_path"), result.get("stdout"),
+                                             result.get("stdout_items"), attempts=result.get("attempts"))
+            entry["attachments"] = [p for p in (result.get("report_path"), result.get("stdout_path")) if p]
+        _SHARD_SETUPS[key] = entry
+        return entry
+
+def merge_shard_results(exec_plan: list, run_jobs: list, results: list) -> list:
+    """Junta os resultados dos shards (e do setup) num resultado por job do plano original."""
+    merged = [None] * len(exec_plan)
+    parts = {}
+    for job, res in zip(run_jobs, results):
+        if res is None:
+            continue
+        if not (job.get("shard") or job.get("data")):
+            merged[job["parent"]] = res
+        else:
+            parts.setdefault(job["parent"], []).append(res)
+    for parent, shard_results in parts.items():
+        shard_results.sort(key=lambda r: (r.get("shard") or r.get("data"))["index"])
+        setup = shard_results[0].get("setup") or {}
+        summaries = ([setup["summary"]] if setup.get("summary") else []) + [r["summary"] for r in shard_results]
+        items = [it for summ in summaries for it in summ.get("items", [])]
+        reasons = [summ["reason"] for summ in summaries if summ.get("reason")]
+        ok = all(summ.get("ok") for summ in summaries)
+        summary = {
+            "ok": ok,
+            "flaky": ok and any(summ.get("flaky") for summ in summaries),
+            "reason": "; ".join(dict.fromkeys(reasons)) or None,
+            "total_requests": sum(summ.get("total_requests", 0) for summ in summaries),
+            "failed_requests": sum(summ.get("failed_requests", 0) for summ in summaries),
+            "total_tests": sum(summ.get("total_tests", 0) for summ in summaries),
+            "failed_tests": sum(summ.get("failed_tests", 0) for summ in summaries),
+            "attempts": [],
+            "latency": None,
+            "shards": len(shard_results),
+            "items": items,
+        }
+        samples = None
+        if shard_results[0].get("data"):
+            # blocos de dados: latência de todas as iterações (os itens foram compactados)
+            samples = {}
+            for r in shard_results:
+                for name, vals in (r.get("latency_samples") or {}).items():
+                    samples.setdefault(name, array("d")).extend(vals)
+            summary["data"] = {"file": os.path.basename(shard_results[0]["data"]["path"]),
+                               "rows": shard_results[0]["data"]["total_rows"], "chunks": len(shard_results)}
+            del summary["shards"]
+        summary["latency"] = latency_stats(items, samples=samples)
+        first = shard_results[0]
+        merged[parent] = {
+            **{k: first[k] for k in ("project", "env_label", "collection_name")},
+            "summary": summary,
+            "attachments": list(setup.get("attachments") or []) + [p for r in shard_results for p in r["attachments"]],
+            "exec_meta": {
+                "returncode": max(r["exec_meta"]["returncode"] or 0 for r in shard_results),
+                "timed_out": any(r["exec_meta"]["timed_out"] for r in shard_results),
+                "attempts": [a for r in shard_results for a in r["exec_meta"]["attempts"]],
+                "stderr": "\n".join(r["exec_meta"]["stderr"] for r in shard_results if r["exec_meta"]["stderr"]),
+                "stdout": "",
+                "cmd": "; ".join(r["exec_meta"]["cmd"] for r in shard_results),
+            },
+        }
+    return merged
+
+# =====================================================================
+# Massa de dados (collections/<proj>/data/): iterações em blocos paralelos
+# =====================================================================
+DATA_EXTENSIONS = (".csv", ".ndjson", ".jsonl")
+_DATASET_INDEX = {}
+_DATASET_INDEX_LOCK = threading.Lock()
+
+def data_config() -> dict:
+    return {
+        "enabled": os.getenv("AUTOMATEST_DATA", "true").lower() in ("1", "true", "yes", "y"),
+        "chunk_rows": max(1, _env_int("AUTOMATEST_DATA_CHUNK_ROWS", 1000)),
+        "max_failed_items": max(0, _env_int("AUTOMATEST_DATA_MAX_FAILED_ITEMS", 200)),
+    }
+
+def collection_stem(collection_path: str) -> str:
+    """Nome da collection sem .postman_collection.json / .json (ex.: MinhaCollection)."""
+    stem = os.path.basename(collection_path).split(".postman_collection")[0]
+    return os.path.splitext(stem)[0] if stem.lower().endswith(".json") else stem
+
+def find_dataset(collection_path: str):
+    """collections/<proj>/data/<collection>.csv|.ndjson|.jsonl (mesmo nome da collection, sem .postman_collection)."""
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(collection_path))), "data")
+    if not os.path.isdir(data_dir):
+        return None
+    stem = collection_stem(collection_path)
+    for ext in DATA_EXTENSIONS:
+        p = os.path.join(data_dir, stem + ext)
+        if os.path.isfile(p):
+            return p
+    return None
+
+def _csv_record_offsets(f):
+    """Offset (bytes) do início de cada registro CSV; campos entre aspas com quebra de linha contam como um."""
+    pos = [f.tell()]
+
+    def lines():
+        for raw in f:
+            pos[0] += len(raw)
+            yield raw.decode("utf-8", errors="replace")
+
+    start = pos[0]
+    for row in csv.reader(lines()):
+        if row:
+            yield start
+        start = pos[0]
+
+def _ndjson_record_offsets(f):
+    pos = f.tell()
+    for raw in f:
+        if raw.strip():
+            yield pos
+        pos += len(raw)
+
+def dataset_index(path: str, chunk_rows: int) -> dict:
+    """
+    Uma leitura em stream do arquivo: guarda só o offset do início de cada bloco de `chunk_rows`
+    registros (e o cabeçalho do CSV). Memorizado por caminho/mtime/tamanho.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size, chunk_rows)
+    with _DATASET_INDEX_LOCK:
+        if key in _DATASET_INDEX:
+            return _DATASET_INDEX[key]
+    fmt = "csv" if path.lower().endswith(".csv") else "ndjson"
+    header, offsets, rows = b"", [], 0
+    with open(path, "rb") as f:
+        records = _csv_record_offsets(f) if fmt == "csv" else _ndjson_record_offsets(f)
+        if fmt == "csv":
+            first = next(records, None)
+            second = next(records, None)
+            if second is None:
+                records = iter(())
+            else:
+                with open(path, "rb") as h:
+                    h.seek(first or 0)
+                    header = h.read(second - (first or 0))
+                if not header.endswith(b"\n"):
+                    header += b"\n"
+                records = _chain_first(second, records)
+        for off in records:
+            if rows % chunk_rows == 0:
+                offsets.append(off)
+            rows += 1
+    idx = {"path": os.path.abspath(path), "format": fmt, "header": header, "offsets": offsets,
+           "rows": rows, "size": st.st_size}
+    with _DATASET_INDEX_LOCK:
+        _DATASET_INDEX[key] = idx
+    return idx
+
+def _chain_first(first, rest):
+    yield first
+    yield from rest
+
+def data_plan(run_jobs: list) -> list:
+    """Troca cada job (não shard) que tem massa de dados por um job por bloco de linhas."""
+    cfg = data_config()
+    if not cfg["enabled"]:
+        return run_jobs
+    out = []
+    for job in run_jobs:
+        dataset = None if job.get("shard") else find_dataset(job["collection"])
+        idx = None
+        if dataset:
+            try:
+                idx = dataset_index(dataset, cfg["chunk_rows"])
+            except OSError as e:
+                print(f"[dados] {os.path.basename(dataset)}: falha ao ler ({e}); rodando sem massa de dados")
+        if not idx or not idx["rows"]:
+            out.append(job)
+            continue
+        group = f"{os.path.abspath(job['collection'])}|{os.path.abspath(job['environment'])}|data"
+        n = len(idx["offsets"])
+        for i, start in enumerate(idx["offsets"]):
+            end = idx["offsets"][i + 1] if i + 1 < n else idx["size"]
+            first_row = i * cfg["chunk_rows"]
+            out.append({**job, "shard_group": group, "data": {
+                "path": idx["path"], "format": idx["format"], "index": i, "count": n,
+                "start": start, "end": end, "first_row": first_row,
+                "rows": min(cfg["chunk_rows"], idx["rows"] - first_row), "total_rows": idx["rows"],
+            }})
+    return out
+
+def write_data_chunk(data: dict, out_base: str) -> str:
+    """Copia o intervalo de bytes do bloco para um arquivo que o `-d` aceita (CSV com cabeçalho ou array JSON)."""
+    ensure_dir(os.path.dirname(out_base))
+    idx = dataset_index(data["path"], data_config()["chunk_rows"])
+    remaining = data["end"] - data["start"]
+    with open(data["path"], "rb") as src:
+        src.seek(data["start"])
+        if data["format"] == "csv":
+            out = out_base + ".csv"
+            with open(out, "wb") as dst:
+                dst.write(idx["header"])
+                while remaining > 0:
+                    buf = src.read(min(ATTACH_CHUNK, remaining))
+                    if not buf:
+                        break
+                    dst.write(buf)
+                    remaining -= len(buf)
+            return out
+        out = out_base + ".json"
+        with open(out, "wb") as dst:
+            dst.write(b"[")
+            first = True
+            while remaining > 0:
+                raw = src.readline(remaining)
+                if not raw:
+                    break
+                remaining -= len(raw)
+                line = raw.strip()
+                if line:
+                    dst.write((b"" if first else b",\n") + line)
+                    first = False
+            dst.write(b"]\n")
+        return out
+
+def rebase_data_items(summary: dict, data: dict):
+    """Ajusta as iterações do bloco para a linha global da massa de dados."""
+    for it in summary.get("items", []):
+        it["iteration"] = data["first_row"] + (it.get("iteration") or 0)
+        it["data_row"] = it["iteration"] + 1
+
+def compact_data_items(summary: dict) -> dict:
+    """
+    Enxuga os itens de um bloco de dados: ficam as execuções com falha (até
+    AUTOMATEST_DATA_MAX_FAILED_ITEMS) e uma execução de cada request.
+    Os totais do resumo não mudam; devolve os tempos de resposta para a latência agregada.
+    """
+    items = summary.get("items", [])
+    samples = latency_samples(items)
+    cap = data_config()["max_failed_items"]
+    kept, seen, failed = [], set(), 0
+    for it in items:
+        key = (it.get("folder"), it.get("name"))
+        if _item_failed(it):
+            if failed < cap:
+                kept.append(it)
+            failed += 1
+        elif key not in seen:
+            kept.append(it)
+        seen.add(key)
+    summary["items"] = kept
+    return samples
+
+def compact_result(res: dict) -> dict:
+    """
+    Depois do on_result (results.ndjson, junit.xml e JSONL já receberam todas as iterações),
+    enxuga o que fica em memória para o relatório de um bloco de dados.
+    """
+    if res.get("data") and res.get("latency_samples") is None:
+        res["latency_samples"] = compact_data_items(res["summary"])
+    return res
+
+# =====================================================================
+# Gravação e replay (cassettes): stub HTTP local no lugar das URLs base
+# =====================================================================
+CASSETTE_MODES = ("record", "replay")
+# Dependem da conexão/momento (ou são refeitos pelo stub): não entram na gravação
+_CASSETTE_DROP_HEADERS = frozenset(("connection", "keep-alive", "proxy-connection", "transfer-encoding",
+                                    "content-length", "date", "host", "accept-encoding"))
+_RE_BASE_URL = re.compile(r"^https?://[^\s/{}?#]+(/[^\s{}?#]*)?$", re.IGNORECASE)
+_RE_STUB_ROUTE = re.compile(r"^/_(\d+)(?=/|\?|$)(.*)$", re.DOTALL)
+
+def cassette_mode(flag: str = None):
+    mode = (flag or os.getenv("AUTOMATEST_CASSETTE", "")).lower()
+    return mode if mode in CASSETTE_MODES else None
+
+def cassette_dir(job: dict) -> str:
+    """collections/<proj>/cassettes/<collection>/<environment>/ (corpos ficam em cassettes/blobs/, sem duplicatas)."""
+    proj_dir = os.path.dirname(os.path.dirname(os.path.abspath(job["collection"])))
+    return os.path.join(proj_dir, "cassettes", collection_stem(job["collection"]),
+                        env_label_from_path(job["environment"]))
+
+def cassette_bases(collection_path: str, environment_path: str) -> dict:
+    """Variáveis com URL base (environment por cima das variáveis da collection): {nome: url}."""
+    return base_urls({**_kv(load_collection_meta(collection_path)["collection"].get("variable")),
+                      **load_environment_values(environment_path)}, _env_list("AUTOMATEST_CASSETTE_VARS"))
+
+def cassette_key(method: str, var: str, target: str, body: bytes) -> str:
+    """
+    Endereço do request na cassette: método + variável base + caminho + query ordenada + hash do corpo.
+    Parâmetros de query em AUTOMATEST_CASSETTE_IGNORE_PARAMS (ex.: timestamp, nonce) ficam de fora.
+    """
+    ignore = {p.strip() for p in os.getenv("AUTOMATEST_CASSETTE_IGNORE_PARAMS", "").split(",") if p.strip()}
+    u = urllib.parse.urlsplit(target)
+    query = urllib.parse.urlencode(sorted((k, v) for k, v in urllib.parse.parse_qsl(u.query, keep_blank_values=True)
+                                          if k not in ignore))
+    raw = "\n".join((method.upper(), var, u.path or "/", query, hashlib.sha256(body or b"").hexdigest()))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+def _blob_put(blobs_dir: str, data: bytes) -> str:
+    sha = hashlib.sha256(data).hexdigest()
+    path = os.path.join(blobs_dir, sha[:2], sha)
+    if not os.path.exists(path):
+        ensure_dir(os.path.dirname(path))
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(zlib.compress(data, 6))
+        os.replace(tmp, path)
+    return sha
+
+def _blob_get(blobs_dir: str, sha: str) -> bytes:
+    with open(os.path.join(blobs_dir, sha[:2], sha), "rb") as f:
+        return zlib.decompress(f.read())
+
+class CassetteStub:
+    """
+    Servidor HTTP em 127.0.0.1 (porta livre) que responde no lugar das URLs base do environment:
+    /_<n>/<caminho> = <URL base n>/<caminho>.
+    - record: repassa ao backend real (HttpPool) e grava status, cabeçalhos e corpo de cada par;
+    - replay: responde só com o que foi gravado; o mesmo request repetido recebe as respostas na
+      ordem em que foram gravadas (a última se repete). Request sem gravação = 404 e conta como falha.
+    """
+
+    def __init__(self, mode: str, directory: str, bases: dict):
+        self.mode = mode
+        self.dir = directory
+        self.blobs = os.path.join(os.path.dirname(os.path.dirname(directory)), "blobs")
+        self.vars = sorted(bases)
+        self.bases = bases
+        self.index = self._load_index() if mode == "replay" else {}
+        self.recorded, self.requests, self.served = {}, {}, {}
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _cassette_handler(self))
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def _load_index(self) -> dict:
+        try:
+            with open(os.path.join(self.dir, "index.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def env_values(self) -> dict:
+        return {var: f"{self.url}/_{i}" for i, var in enumerate(self.vars)}
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="automatest-cassette", daemon=True).start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.mode == "record" and self.recorded:
+            self.save()
+
+    def save(self):
+        """Junta o que foi gravado no index.json (shards/blocos da mesma collection gravam em paralelo)."""
+        with _keyed_lock(f"cassette|{self.dir}"):
+            index = self._load_index()
+            index.setdefault("entries", {}).update(self.recorded)
+            index.setdefault("requests", {}).update(self.requests)
+            index["recorded_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+            index["bases"] = {**index.get("bases", {}), **self.bases}
+            ensure_dir(self.dir)
+            tmp = os.path.join(self.dir, f"index.json.{uuid.uuid4().hex[:8]}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp, os.path.join(self.dir, "index.json"))
+
+    def handle(self, method: str, path: str, headers: list, body: bytes):
+        m = _RE_STUB_ROUTE.match(path)
+        if not m or int(m.group(1)) >= len(self.vars):
+            return 404, [("Content-Type", "application/json")], b'{"error": "rota fora do stub"}'
+        var = self.vars[int(m.group(1))]
+        target = m.group(2) or "/"
+        key = cassette_key(method, var, target, body)
+        if self.mode == "replay":
+            return self._replay(key, method, var, target)
+        return self._record(key, method, var, target, headers, body)
+
+    def _replay(self, key: str, method: str, var: str, target: str):
+        with self.lock:
+            entries = (self.index.get("entries") or {}).get(key)
+            if not entries:
+                self.misses += 1
+                return 404, [("Content-Type", "application/json"), ("X-Automatest-Cassette", "miss")], json.dumps(
+                    {"error": "request sem gravação", "method": method, "base": var, "path": target},
+                    ensure_ascii=False).encode("utf-8")
+            n = self.served.get(key, 0)
+            self.served[key] = n + 1
+            self.hits += 1
+        e = entries[min(n, len(entries) - 1)]
+        return e["status"], [tuple(h) for h in e["headers"]], _blob_get(self.blobs, e["body"])
+
+    def _record(self, key: str, method: str, var: str, target: str, headers: list, body: bytes):
+        base = self.bases[var]
+        fwd = [(k, v) for k, v in headers if k.lower() not in _CASSETTE_DROP_HEADERS]
+        t = time.perf_counter()
+        try:
+            status, _, data, resp_headers = http_pool().exchange(method, base + target, fwd, body or None)
+        except Exception as e:
+            return 502, [("Content-Type", "text/plain; charset=utf-8")], f"backend indisponível: {e}".encode("utf-8")
+        ms = (time.perf_counter() - t) * 1000
+        out = []
+        for k, v in resp_headers:
+            if k.lower() in _CASSETTE_DROP_HEADERS:
+                continue
+            if k.lower() == "location" and v.startswith(base):
+                v = f"{self.url}/_{self.vars.index(var)}{v[len(base):]}"
+            out.append((k, v))
+        entry = {"status": status, "headers": out, "body": _blob_put(self.blobs, data), "ms": round(ms, 1)}
+        with self.lock:
+            self.recorded.setdefault(key, []).append(entry)
+            self.requests[key] = {"method": method, "base": var, "path": target}
+            self.hits += 1
+        return status, out, data
+
+    def note(self) -> str:
+        rel = os.path.relpath(self.dir)
+        if self.mode == "record":
+            return f"gravadas {self.hits} resposta(s) em {rel}"
+        note = f"replay de {rel} (gravação de {self.index.get('recorded_at') or '?'}): {self.hits} resposta(s)"
+        return note + (f", {self.misses} request(s) sem gravação" if self.misses else "")
+
+def _cassette_handler(stub: CassetteStub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive com o CLI: uma conexão (e uma thread) por worker do run
+        disable_nagle_algorithm = True  # cabeçalho e corpo saem em writes separados: sem isso, ~40 ms por resposta
+
+        def _serve(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            status, headers, data = stub.handle(self.command, self.path, list(self.headers.items()), body)
+            self.send_response(status)
+            for k, v in headers:
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = _serve
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+def start_cassette(job: dict, out_dir: str):
+    """
+    Sobe o stub do job e grava uma cópia do environment com as URLs base apontando para ele
+    (mesmo nome de arquivo: o label do environment não muda). Devolve (stub, environment, erro).
+    """
+    directory = cassette_dir(job)
+    bases = cassette_bases(job["collection"], job["environment"])
+    if not bases:
+        return None, job["environment"], "nenhuma variável com URL base no environment/collection"
+    if job["cassette"] == "replay" and not os.path.exists(os.path.join(directory, "index.json")):
+        return None, job["environment"], f"sem gravação em {os.path.relpath(directory)} (rode antes com --record)"
+    stub = CassetteStub(job["cassette"], directory, bases).start()
+    with open(job["environment"], "r", encoding="utf-8") as f:
+        env = json.load(f)
+    overrides = stub.env_values()
+    values = [v for v in env.get("values") or [] if v.get("key") not in overrides]
+    env["values"] = values + [{"key": k, "value": v, "type": "default", "enabled": True} for k, v in overrides.items()]
+    path = os.path.join(out_dir, "_cassette", os.path.basename(job["environment"]))
+    ensure_dir(os.path.dirname(path))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(env, f, ensure_ascii=False)
+    return stub, path, None
+
+# =====================================================================
+# Modo incremental (só o que mudou, falhou ou está velho)
+# =====================================================================
+def incremental_config(enabled: bool = False) -> dict:
+    try:
+        max_age_h = float(os.getenv("AUTOMATEST_MAX_AGE_HOURS", "") or 24)
+    except ValueError:
+        max_age_h = 24.0
+    return {
+        "enabled": enabled or os.getenv("AUTOMATEST_INCREMENTAL", "").lower() in ("1", "true", "yes"),
+        "state_file": os.getenv("AUTOMATEST_STATE_FILE", os.path.join("logs", ".incremental-state.json")),
+        "max_age_s": max(0.0, max_age_h) * 3600,
+    }
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def job_key(job: dict) -> str:
+    return f"{job['project']}|{os.path.basename(job['collection'])}|{os.path.basename(job['environment'])}"
+
+def job_fingerprint(job: dict) -> str:
+    dataset = find_dataset(job["collection"])
+    data_sha = file_sha256(dataset) if dataset else ""
+    return hashlib.sha256(
+        (file_sha256(job["collection"]) + file_sha256(job["environment"]) + data_sha).encode("ascii")).hexdigest()
+
+def load_json_state(path: str) -> dict:
+    """Estado JSON entre execuções (incremental, custo dos jobs); ausente ou corrompido = {}."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_json_state(path: str, obj: dict):
+    # grava ao lado e troca: uma execução interrompida não deixa o arquivo pela metade
+    ensure_dir(os.path.dirname(os.path.abspath(path)))
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def split_incremental(exec_plan: list, state: dict, max_age_s: float):
+    """
+    Separa o plano em (índices a rodar, {índice: resultado em cache}). Roda de novo quando
+    os arquivos mudaram, quando a última execução falhou ou quando ela passou de max_age_s.
+    """
+    now = time.time()
+    to_run, cached = [], {}
+    for idx, job in enumerate(exec_plan):
+        prev = state.get(job_key(job))
+        fresh = (
+            prev
+            and prev.get("fingerprint") == job_fingerprint(job)
+            and prev.get("ok")
+            and (not max_age_s or now - prev.get("finished_at", 0) <= max_age_s)
+        )
+        if not fresh:
+            to_run.append(idx)
+            continue
+        entry = dict(prev["entry"])
+        entry["summary"] = {**entry["summary"], "cached": True,
+                            "cached_at": datetime.datetime.fromtimestamp(prev["finished_at"]).isoformat(timespec="seconds")}
+        entry["attachments"] = []
+        cached[idx] = entry
+    return to_run, cached
+
+def update_incremental_state(state: dict, exec_plan: list, results: list):
+    for job, res in zip(exec_plan, results):
+        if not res or res["summary"].get("cached"):
+            continue
+        state[job_key(job)] = {
+            "fingerprint": job_fingerprint(job),
+            "ok": bool(res["summary"].get("ok")),
+            "finished_at": time.time(),
+            "entry": {k: res[k] for k in ("project", "env_label", "collection_name", "summary")},
+        }
+
+# =====================================================================
+# Planejamento: custo estimado dos jobs e health check dos environments
+# =====================================================================
+def planner_config() -> dict:
+    try:
+        alpha = float(os.getenv("AUTOMATEST_COST_ALPHA", "") or 0.3)
+    except ValueError:
+        alpha = 0.3
+    try:
+        probe_timeout = float(os.getenv("AUTOMATEST_PROBE_TIMEOUT", "") or 5)
+    except ValueError:
+        probe_timeout = 5.0
+    return {
+        "cost_file": os.getenv("AUTOMATEST_COST_FILE", os.path.join("logs", ".job-costs.json")),
+        "order": os.getenv("AUTOMATEST_ORDER", "cost").lower(),  # cost | name
+        "alpha": min(1.0, max(0.01, alpha)),
+        "probe": os.getenv("AUTOMATEST_PROBE", "true").lower() in ("1", "true", "yes", "y"),
+        "probe_timeout": probe_timeout,
+        "probe_vars": _env_list("AUTOMATEST_PROBE_VARS"),  # vazio = todas as variáveis com URL
+    }
+
+def cost_key(job: dict) -> str:
+    # Shards pelo conjunto de folders; blocos de dados têm custo parecido e dividem uma chave
+    if job.get("shard"):
+        return f"{job_key(job)}|shard:{','.join(job['shard']['folders'])}"
+    if job.get("data"):
+        return f"{job_key(job)}|data"
+    return job_key(job)
+
+def _job_request_count(job: dict) -> int:
+    col = load_collection_meta(job["collection"])["collection"]
+    folders = set(job["shard"]["folders"]) if job.get("shard") else None
+    n = sum(1 for path, *_ in _iter_requests(col) if folders is None or (path and path[0] in folders))
+    return max(1, n) * (job["data"]["rows"] if job.get("data") else 1)
+
+def estimate_costs(jobs: list, costs: dict) -> list:
+    """
+    Segundos estimados por job: média móvel das execuções anteriores; job sem histórico =
+    nº de requests x mediana de segundos por request dos jobs conhecidos (0.5s sem nenhum).
+    """
+    per_request = [c["s"] / c["requests"] for c in costs.values() if c.get("requests")]
+    sec_per_req = statistics.median(per_request) if per_request else 0.5
+    out = []
+    for job in jobs:
+        known = costs.get(cost_key(job))
+        try:
+            out.append(known["s"] if known else _job_request_count(job) * sec_per_req)
+        except (OSError, ValueError):
+            out.append(sec_per_req)
+    return out
+
+def order_by_cost(jobs: list, costs: dict) -> list:
+    """
+    Mais longos primeiro (LPT): com N workers, o job mais demorado não fica para o fim esticando a
+    execução. Os limites por projeto/environment continuam valendo no run_plan.
+    """
+    est = estimate_costs(jobs, costs)
+    order = sorted(range(len(jobs)), key=lambda i: -est[i])
+    if jobs:
+        total = sum(est)
+        top = jobs[order[0]]
+        print(f"Ordem por custo: ~{total:.1f}s somados; primeiro {top['project']} / "
+              f"{os.path.basename(top['collection'])} (~{est[order[0]]:.1f}s).")
+    return [jobs[i] for i in order]
+
+def record_job_costs(costs: dict, jobs: list, results: list, alpha: float):
+    for job, res in zip(jobs, results):
+        if not res or res.get("duration_s") is None:
+            continue
+        key = cost_key(job)
+        prev = costs.get(key)
+        s = res["duration_s"] if not prev else alpha * res["duration_s"] + (1 - alpha) * prev["s"]
+        try:
+            requests = _job_request_count(job)
+        except (OSError, ValueError):
+            requests = None
+        costs[key] = {"s": round(s, 3), "requests": requests, "runs": (prev or {}).get("runs", 0) + 1,
+                      "updated_at": time.time()}
+
+def _env_list(name: str) -> list:
+    return [v.strip() for v in os.getenv(name, "").split(",") if v.strip()]
+
+def base_urls(values: dict, wanted: list = None) -> dict:
+    """Variáveis cujo valor é uma URL base (http(s)://host[/caminho]); `wanted` restringe os nomes."""
+    return {k: str(v).rstrip("/") for k, v in values.items()
+            if (k in wanted if wanted else True) and _RE_BASE_URL.match(str(v or ""))}
+
+def probe_origin(origin: str, timeout: float):
+    """None se o host respondeu (qualquer HTTP que não seja 502/503/504); senão o motivo."""
+    pool = HttpPool(timeout, os.getenv("AUTOMATEST_HTTP_INSECURE", "").lower() in ("1", "true", "yes"))
+    host = urllib.parse.urlsplit(origin).netloc
+    try:
+        status, reason, _ = pool.request("HEAD", origin + "/", [("User-Agent", "automatest-probe")])
+    except Exception as e:
+        return f"{host}: {str(e) or type(e).__name__}"
+    finally:
+        pool.close()
+    return f"{host}: HTTP {status} {reason}" if status in (502, 503, 504) else None
+
+def probe_environments(jobs: list, timeout: float, wanted: list = None) -> dict:
+    """
+    Um HEAD por origem (esquema://host:porta) das URLs base de cada environment do plano, tudo em
+    paralelo. Environment fica indisponível quando nenhuma origem responde: {caminho absoluto: motivo}.
+    """
+    urls = {}
+    for job in jobs:
+        env = os.path.abspath(job["environment"])
+        if env not in urls:
+            try:
+                values = base_urls(load_environment_values(env), wanted).values()
+            except (OSError, ValueError):
+                values = []
+            urls[env] = sorted({"{0.scheme}://{0.netloc}".format(urllib.parse.urlsplit(v)) for v in values})
+    targets = sorted({u for us in urls.values() for u in us})
+    if not targets:
+        return {}
+    with TRACER.span("health check", urls=len(targets)):
+        outcome = {}
+        threads = [threading.Thread(target=lambda u=u: outcome.__setitem__(u, probe_origin(u, timeout)), daemon=True)
+                   for u in targets]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout + 5)
+    down = {}
+    for env, us in urls.items():
+        if us and all(outcome.get(u, "sem resposta") for u in us):
+            down[env] = "; ".join(outcome.get(u) or f"{u}: sem resposta" for u in us)
+            proj = os.path.basename(os.path.dirname(os.path.dirname(env)))
+            print(f"[health] {proj} / {env_label_from_path(env)} indisponível ({down[env]}): jobs pulados")
+    return down
+
+# =====================================================================
+# Parser de STDOUT (CLI bonito)
+# =====================================================================
+_RE_REQ = re.compile(r'^\s*→\s+(.*)$')                 # "→ Nome"
+_RE_TEST_OK = re.compile(r'^\s*[√✓]\s+(.*)$')          # passed
+_RE_TEST_FAIL = re.compile(r'^\s*[×✗]\s+(.*)$')        # failed
+_RE_STATUS = re.compile(r'\[(\d{3})\s+([^\]]+)\]')     # "[200 OK, 1.2kB, 345ms]"
+_RE_STATUS_MS = re.compile(r'(\d+(?:\.\d+)?)\s*ms\b')
+_RE_STATUS_SIZE = re.compile(r'(\d+(?:\.\d+)?)\s*(B|kB|KB|MB|GB)\b')
+_RE_FOLDER = re.compile(r'^\s*❏\s+(.*)$')                 # "❏ Folder / Subfolder"
+_RE_ITERATION = re.compile(r'^\s*Iteration\s+(\d+)/\d+')  # "Iteration 2/10"
+_SIZE_UNITS = {"B": 1, "kB": 1000, "KB": 1024, "MB": 1000 ** 2, "GB": 1000 ** 3}
+
+class CliStdoutParser:
+    """
+    Máquina de estados do stdout do CLI, alimentada linha a linha (sem ANSI). Com `on_item`, cada
+    request fechado vai para o callback em vez de acumular em `items`.
+    """
+
+    def __init__(self, on_item=None):
+        self.items = []
+        self.on_item = on_item or self.items.append
+        self.cur = None
+        self.folder = None
+        self.iteration = 0
+
+    def feed(self, ln: str):
+        ln = ln.rstrip()
+        m = _RE_REQ.match(ln)
+        if m:
+            if self.cur:
+                self.on_item(self.cur)
+            self.cur = {"name": m.group(1).strip(), "status_code": None, "tests": [],
+                        "folder": self.folder, "iteration": self.iteration}
+            return
+        m = _RE_FOLDER.match(ln)
+        if m:
+            self.folder = m.group(1).strip()
+            return
+        m = _RE_ITERATION.match(ln)
+        if m:
+            self.iteration = int(m.group(1)) - 1
+            self.folder = None
+            return
+
+        cur = self.cur
+        if cur:
+            m2 = _RE_STATUS.search(ln)
+            if m2:
+                try:
+                    cur["status_code"] = int(m2.group(1))
+                except Exception:
+                    pass
+                ms = _RE_STATUS_MS.search(m2.group(2))
+                if ms:
+                    cur["response_time_ms"] = float(ms.group(1))
+                size = _RE_STATUS_SIZE.search(m2.group(2))
+                if size:
+                    cur["response_size"] = int(float(size.group(1)) * _SIZE_UNITS[size.group(2)])
+                return
+            m3 = _RE_TEST_OK.match(ln.strip())
+            if m3:
+                cur["tests"].append({"name": m3.group(1).strip(), "ok": True})
+                return
+            m4 = _RE_TEST_FAIL.match(ln.strip())
+            if m4:
+                cur["tests"].append({"name": m4.group(1).strip(), "ok": False})
+                return
+
+    def finish(self) -> list:
+        if self.cur:
+            self.on_item(self.cur)
+            self.cur = None
+        return self.items
+
+class StdoutItems:
+    """
+    Itens do stdout gravados em NDJSON conforme o CLI roda: a memória não cresce com a saída.
+    Iterável quantas vezes for preciso (relê o arquivo); len() = nº de itens.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._f = open(path, "w", encoding="utf-8")
+
+    def add(self, item: dict):
+        self._f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self):
+        self._f.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        if not self.count:
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+def parse_cli_stdout(stdout: str):
+    if not stdout:
+        return []
+    parser = CliStdoutParser()
+    for ln in strip_ansi(stdout).splitlines():
+        parser.feed(ln)
+    return parser.finish()
+
+# =====================================================================
+# Leitura incremental do run.json (ijson ou parser de eventos puro Python)
+# =====================================================================
+JSON_READ_CHUNK = 256 * 1024
+
+_RE_JSON_TOKEN = re.compile(
+    r'[ \t\r\n]*(?:'
+    r'(\[[ \t\r\n]*-?\d+(?:[ \t\r\n]*,[ \t\r\n]*-?\d+)*[ \t\r\n]*\])'  # array só de inteiros
+    r'|([{}\[\]:,])'                                 # pontuação
+    r'|("[^"\\]*(?:\\.[^"\\]*)*")'                   # string
+    r'|(-?\d+)(?![.eE\d])'                           # inteiro
+    r'|(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)'           # número real
+    r'|(true|false|null)'                            # literais
+    r')'
+)
+_RE_JSON_WS_END = re.compile(r'[ \t\r\n]*\Z')
+_JSON_DELIMS = frozenset(" \t\r\n,:]}")
+_JSON_T_FLAT, _JSON_T_PUNCT, _JSON_T_STR, _JSON_T_INT, _JSON_T_REAL, _JSON_T_LIT = range(1, 7)
+
+def _json_tokens(f):
+    buf, pos, eof = "", 0, False
+    chunk = JSON_READ_CHUNK
+    while True:
+        m = _RE_JSON_TOKEN.match(buf, pos)
+        kind = m.lastindex if m else None
+        # Número/literal só fecha num delimitador; colado no fim do buffer pode estar incompleto
+        if m is None or (not eof and kind >= _JSON_T_INT
+                         and (m.end() == len(buf) or buf[m.end()] not in _JSON_DELIMS)):
+            if eof:
+                if _RE_JSON_WS_END.match(buf, pos):
+                    return
+                raise ValueError(f"JSON inválido perto de: {buf[pos:pos + 40]!r}")
+            data = f.read(max(chunk, len(buf) - pos))
+            if not data:
+                eof = True
+            buf = buf[pos:] + data
+            pos = 0
+            continue
+        pos = m.end()
+        tok = m.group(kind)
+        if kind == _JSON_T_STR:
+            body = tok[1:-1]
+            yield kind, (json.loads(tok) if "\\" in body else body)
+        elif kind == _JSON_T_INT:
+            yield kind, int(tok)
+        elif kind == _JSON_T_REAL:
+            yield kind, float(tok)
+        elif kind == _JSON_T_FLAT:
+            yield kind, json.loads(tok)
+        else:
+            yield kind, tok
+
+def _json_events_py(f):
+    """
+    Mesmo formato de ijson.parse: (prefixo, evento, valor). Arrays só de inteiros
+    (ex.: response.stream.data) saem num único evento "flat_array" com a lista pronta.
+    """
+    stack = []  # ["map", prefixo, chave_atual, esperando_chave] | ["array", prefixo]
+
+    def value_prefix():
+        if not stack:
+            return ""
+        top = stack[-1]
+        if top[0] == "array":
+            return f"{top[1]}.item" if top[1] else "item"
+        return f"{top[1]}.{top[2]}" if top[1] else top[2]
+
+    literals = {"true": ("boolean", True), "false": ("boolean", False), "null": ("null", None)}
+    for kind, tok in _json_tokens(f):
+        if kind == _JSON_T_PUNCT:
+            if tok == "{":
+                p = value_prefix()
+                yield p, "start_map", None
+                stack.append(["map", p, None, True])
+            elif tok == "[":
+                p = value_prefix()
+                yield p, "start_array", None
+                stack.append(["array", p])
+            elif tok == "}":
+                yield stack.pop()[1], "end_map", None
+            elif tok == "]":
+                yield stack.pop()[1], "end_array", None
+            elif tok == "," and stack and stack[-1][0] == "map":
+                stack[-1][3] = True
+        elif kind == _JSON_T_STR:
+            top = stack[-1] if stack else None
+            if top and top[0] == "map" and top[3]:
+                top[2], top[3] = tok, False
+                yield top[1], "map_key", tok
+            else:
+                yield value_prefix(), "string", tok
+        elif kind == _JSON_T_INT or kind == _JSON_T_REAL:
+            yield value_prefix(), "number", tok
+        elif kind == _JSON_T_FLAT:
+            yield value_prefix(), "flat_array", tok
+        else:
+            yield (value_prefix(),) + literals[tok]
+
+def _json_scalar(value):
+    # ijson devolve Decimal para números não inteiros
+    if value is not None and not isinstance(value, (str, int, float, bool)):
+        return float(value)
+    return value
+
+def _skip_json_value(events, event):
+    if event not in ("start_map", "start_array"):
+        return
+    depth = 1
+    for _, ev, _ in events:
+        if ev in ("start_map", "start_array"):
+            depth += 1
+        elif ev in ("end_map", "end_array"):
+            depth -= 1
+            if depth == 0:
+                return
+
+def _build_json_value(events, event, value, base: str, allowed=None):
+    """
+    Monta o valor que começa em `event`, mantendo só os caminhos (relativos a `base`)
+    presentes em `allowed`; o resto é consumido sem ser materializado.
+    """
+    if event == "start_map":
+        obj = {}
+        for _, ev, key in events:
+            if ev == "end_map":
+                return obj
+            p, ev2, val2 = next(events)
+            rel = p[len(base) + 1:]
+            if allowed is None or rel in allowed:
+                obj[key] = _build_json_value(events, ev2, val2, base, allowed)
+            else:
+                _skip_json_value(events, ev2)
+        return obj
+    if event == "start_array":
+        arr = []
+        for p, ev, val in events:
+            if ev == "end_array":
+                return arr
+            rel = p[len(base) + 1:]
+            if allowed is None or rel in allowed:
+                arr.append(_build_json_value(events, ev, val, base, allowed))
+            else:
+                _skip_json_value(events, ev)
+        return arr
+    if event == "flat_array":
+        return value
+    return _json_scalar(value)
+
+def _allowed_paths(fields) -> frozenset:
+    # "a.b.c" libera também "a" e "a.b" (os contêineres no caminho)
+    out = set()
+    for f in fields:
+        parts = f.split(".")
+        for i in range(1, len(parts) + 1):
+            out.add(".".join(parts[:i]))
+    return frozenset(out)
+
+# Campos de run.executions[*] que o resumo usa (formatos novo e antigo)
+RUN_EXECUTION_FIELDS = _allowed_paths((
+    "id",
+    "requestExecuted.name", "request.name", "item.name", "item.id",
+    "response.code", "response.status", "response.responseTime", "response.responseSize",
+    "startedAt", "timestamp", "response.timestamp", "iteration", "cursor.iteration",
+    "tests.item.name", "tests.item.status", "tests.item.error.message",
+    "assertions.item.assertion", "assertions.item.error.message",
+))
+RUN_META_KEYS = ("run.summary", "run.stats")
+
+def iter_run_report(path: str):
+    """
+    Percorre o run.json como stream. Gera ("layout", "new" | "old") uma vez, antes da primeira
+    execução; ("execution", dict enxuto) para cada item de run.executions e, no fim, ("meta",
+    {"summary", "stats", "has_executions"}). O formato vem do relatório, não de cada execução:
+    run.summary = novo, run.stats = antigo (vale o que aparecer primeiro). Execuções que vierem
+    antes dos dois esperam a decisão (sem nenhum, formato antigo).
+    """
+    meta = {"summary": None, "stats": None, "has_executions": False}
+    layout, waiting = None, []
+    if ijson is not None:
+        f = open(path, "rb")
+        events = ijson.parse(f)
+    else:
+        f = open(path, "r", encoding="utf-8", errors="replace")
+        events = _json_events_py(f)
+    with f:
+        events = iter(events)
+        for p, ev, val in events:
+            if p == "run.executions.item" and ev == "start_map":
+                ex = _build_json_value(events, ev, val, p, RUN_EXECUTION_FIELDS)
+                if layout is None:
+                    waiting.append(ex)
+                else:
+                    yield "execution", ex
+            elif p == "run.executions" and ev == "start_array":
+                meta["has_executions"] = True
+            elif p in RUN_META_KEYS and ev == "start_map":
+                meta[p.split(".", 1)[1]] = _build_json_value(events, ev, val, p)
+                if layout is None:
+                    layout = "new" if p == "run.summary" else "old"
+                    yield "layout", layout
+                    yield from (("execution", ex) for ex in waiting)
+                    waiting = []
+    if layout is None:
+        yield "layout", "old"
+        yield from (("execution", ex) for ex in waiting)
+    yield "meta", meta
+
+# =====================================================================
+# Resumo (JSON + fallback stdout)
+# =====================================================================
+def _safe_get(d, *keys, default=None):
+    cur = d
+    for k in keys:
+        if not isinstance(cur, dict) or k not in cur:
+            return default
+        cur = cur[k]
+    return cur
+
+def _test_entry(name, ok: bool, error) -> dict:
+    t = {"name": name or "teste", "ok": ok}
+    if not ok and error:
+        msg = error.get("message") if isinstance(error, dict) else error
+        if msg:
+            t["error"] = str(msg)
+    return t
+
+def _execution_item(ex: dict, layout: str = "new") -> dict:
+    if layout == "new":
+        # Formato novo: requestExecuted/request + tests[*].status
+        req = ex.get("requestExecuted") or ex.get("request") or {}
+        name = req.get("name") or "desconhecido"
+        code = (ex.get("response") or {}).get("code")
+        status_code = code if isinstance(code, int) else None
+        tests = [_test_entry(t.get("name"), t.get("status") == "passed", t.get("error"))
+                 for t in ex.get("tests") or []]
+    else:
+        # Formato antigo: item + assertions[*].error
+        item = ex.get("item", {}) or {}
+        name = item.get("name") or "desconhecido"
+        status_code = None
+        resp = ex.get("response") or {}
+        if isinstance(resp, dict):
+            try:
+                status_code = int(resp.get("code"))
+            except Exception:
+                status_code = None
+        tests = [_test_entry(a.get("assertion"), not bool(a.get("error")), a.get("error"))
+                 for a in ex.get("assertions") or []]
+    item = {"name": name, "status_code": status_code, "tests": tests}
+    resp = ex.get("response") if isinstance(ex.get("response"), dict) else {}
+    if isinstance(resp.get("responseTime"), (int, float)):
+        item["response_time_ms"] = float(resp["responseTime"])
+    if isinstance(resp.get("responseSize"), (int, float)):
+        item["response_size"] = int(resp["responseSize"])
+    started = ex.get("startedAt") or ex.get("timestamp") or resp.get("timestamp")
+    if started is not None:
+        item["started_at"] = started
+    iteration = ex.get("iteration", _safe_get(ex, "cursor", "iteration"))
+    if isinstance(iteration, int):
+        item["iteration"] = iteration
+    return item
+
+def execution_keys(items, by_iteration: bool = True):
+    """
+    Chave estável de cada execução, na ordem em que rodou: (iteração, nome, n-ésima ocorrência do
+    nome na iteração). run.json e stdout listam as execuções na mesma ordem, então o mesmo request
+    repetido em iterações diferentes casa com a ocorrência certa, sem depender de nomes únicos; uma
+    execução a mais ou a menos só desalinha a própria iteração. O folder não entra na chave (o
+    run.json nem sempre traz o caminho): requests de mesmo nome em folders diferentes se distinguem
+    só pela ordem em que rodaram.
+    Com `by_iteration=False` a contagem vale para a lista inteira (iteração None).
+    """
+    seen = {}
+    for it in items:
+        key = ((it.get("iteration") or 0) if by_iteration else None, it.get("name"))
+        n = seen.get(key, 0)
+        seen[key] = n + 1
+        yield (*key, n)
+
+def _merge_stdout_item(base: dict, s: dict):
+    if base.get("status_code") is None and s.get("status_code") is not None:
+        base["status_code"] = s["status_code"]
+    for k in ("response_time_ms", "response_size", "folder", "iteration"):
+        if base.get(k) is None and s.get(k) is not None:
+            base[k] = s[k]
+    if not base["tests"]:
+        base["tests"] = s.get("tests", [])
+    elif s.get("tests"):
+        already = {t["name"] for t in base["tests"]}
+        base["tests"].extend(t for t in s["tests"] if t["name"] not in already)
+
+def merge_stdout_items(items: list, stdout_items: list) -> list:
+    """
+    Completa os itens do run.json com os do stdout numa passada linear por cada lista.
+    As duas vêm na ordem de execução: enquanto os nomes batem posição a posição, casa direto
+    (sem montar chaves); da primeira divergência em diante, casa pelo execution_keys.
+    """
+    std = iter(stdout_items)  # pode ser um StdoutItems (lido do disco): uma passada só
+    i = 0
+    for s in std:
+        if i < len(items) and items[i].get("name") == s.get("name"):
+            _merge_stdout_item(items[i], s)
+            i += 1
+            continue
+        rest_std = [s, *std]
+        break
+    else:
+        return items
+    # a partir daqui as contagens recomeçam nos dois lados (o trecho casado é idêntico)
+    rest = items[i:]
+    # O stdout numera as iterações a partir de 0; run.json sem número ou com outra numeração (um
+    # conjunto de iterações não contém o outro) não casa por iteração: a contagem vale para a lista inteira
+    by_iteration = False
+    if any(it.get("iteration") is not None for it in rest):
+        ours = {it.get("iteration") or 0 for it in rest}
+        theirs = {s.get("iteration") or 0 for s in rest_std}
+        by_iteration = ours <= theirs or theirs <= ours
+    by_key = dict(zip(execution_keys(rest, by_iteration), rest))
+    for key, s in zip(execution_keys(rest_std, by_iteration), rest_std):
+        base = by_key.get(key)
+        if base is None:
+            items.append(s)
+        else:
+            _merge_stdout_item(base, s)
+    return items
+
+def summarize_run(report_path: str, stdout_text: str, stdout_items: list = None, attempts: list = None) -> dict:
+    items = []
+    total_requests = failed_requests = total_tests = failed_tests = 0
+    reason = None
+
+    # run.json lido como stream: só nome, HTTP e testes de cada execução ficam em memória
+    meta = layout = None
+    exec_failed_tests = 0
+    if report_path and os.path.exists(report_path):
+        try:
+            for kind, obj in iter_run_report(report_path):
+                if kind == "layout":
+                    layout = obj
+                    continue
+                if kind == "meta":
+                    meta = obj
+                    continue
+                item = _execution_item(obj, layout)
+                exec_failed_tests += sum(1 for t in item["tests"] if not t["ok"])
+                items.append(item)
+        except Exception as e:
+            reason = f"falha ao ler run.json: {e}"
+
+    if meta:
+        summary = meta.get("summary")
+        if layout == "new" and isinstance(summary, dict) and meta.get("has_executions"):
+            # Formato novo: run.summary + run.executions[*].tests
+            total_requests = int(_safe_get(summary, "executedRequests", "executed", default=0) or 0)
+            total_tests    = int(_safe_get(summary, "tests", "executed", default=0) or 0)
+            failed_tests   = int(_safe_get(summary, "tests", "failed", default=0) or 0) + exec_failed_tests
+            failed_requests = 0
+        else:
+            # Formato antigo: run.stats + run.executions[*].assertions
+            stats = meta.get("stats") or {}
+            total_requests = int(_safe_get(stats, "requests", "total", default=0) or 0)
+            failed_requests = int(_safe_get(stats, "requests", "failed", default=0) or 0)
+            total_tests = int(_safe_get(stats, "tests", "total", default=0) or 0)
+            failed_tests = int(_safe_get(stats, "tests", "failed", default=0) or 0)
+
+    # Completa com stdout (nome, status e testes bonitos)
+    if stdout_items is None:
+        stdout_items = parse_cli_stdout(stdout_text or "")
+    if stdout_items:
+        merge_stdout_items(items, stdout_items)
+
+    if items:
+        total_requests = max(total_requests, len(items))
+        if total_tests == 0:
+            total_tests = sum(len(i.get("tests", [])) for i in items)
+        if failed_tests == 0:
+            failed_tests = sum(1 for i in items for t in i.get("tests", []) if not t.get("ok", False))
+
+    ok = (failed_requests == 0 and failed_tests == 0 and total_requests > 0 and total_tests >= 0)
+    # Tentativas: a última manda; sucesso depois de falha transitória = "instável"
+    attempts = attempts or []
+    last = attempts[-1] if attempts else {}
+    if last.get("timed_out"):
+        ok = False
+        reason = reason or ("tempo limite excedido (processo finalizado; timeouts não são repetidos, "
+                            "ver AUTOMATEST_RETRY_TIMEOUTS)" if not last.get("transient") else
+                            f"tempo limite excedido nas {len(attempts)} tentativa(s) (processo finalizado)")
+    flaky = ok and len(attempts) > 1
+    return {
+        "ok": ok,
+        "flaky": flaky,
+        "reason": reason or (None if total_requests > 0 else "sem requests contabilizados"),
+        "total_requests": total_requests,
+        "failed_requests": failed_requests,
+        "total_tests": total_tests,
+        "failed_tests": failed_tests,
+        "attempts": attempts,
+        "latency": latency_stats(items),
+        "items": items
+    }
+
+def summary_status(summary: dict) -> str:
+    if not summary.get("ok"):
+        return "failed"
+    return "flaky" if summary.get("flaky") else "ok"
+
+def _attempts_line(summary: dict) -> str:
+    attempts = summary.get("attempts") or []
+    if len(attempts) < 2:
+        return ""
+    parts = [f"{a['attempt']}ª: {a['detail']}" for a in attempts]
+    return f"{len(attempts)} ({'; '.join(parts)})"
+
+# =====================================================================
+# Teste de carga (--load): N usuários virtuais contra uma collection
+# =====================================================================
+def file_matches(path: str, wanted: str) -> bool:
+    """Nome de arquivo com ou sem .json / .postman_*, sem diferenciar caixa."""
+    base, w = os.path.basename(path).lower(), wanted.lower()
+    return w in (base, os.path.splitext(base)[0], base.split(".postman_")[0])
+
+def resolve_pair(root: str, project: str, collection: str, environment: str):
+    """Acha collection/environment do projeto pelo nome do arquivo (com ou sem .json, sem diferenciar caixa)."""
+    def pick(paths, wanted, what):
+        if not wanted and len(paths) == 1:
+            return paths[0]
+        for p in paths:
+            if file_matches(p, wanted or ""):
+                return p
+        opts = ", ".join(os.path.basename(p) for p in paths) or "nenhum"
+        raise ValueError(f"{what} '{wanted}' não encontrado em '{project}' (opções: {opts})")
+
+    base = os.path.join(root, project)
+    if not os.path.isdir(base):
+        raise ValueError(f"projeto '{project}' não encontrado em '{root}'")
+    col = pick(list_jsons(os.path.join(base, "requests")), collection, "collection")
+    env = pick(list_jsons(os.path.join(base, "enviroment")), environment, "environment")
+    return col, env
+
+def _load_virtual_user(vu: int, col: str, env: str, out_dir: str, deadline: float,
+                       iterations: int, batch: int, sink: list, lock):
+    # Cada processo do CLI roda `batch` iterações (-n); no modo duração o último lote
+    # é cortado no deadline e aproveita o que já saiu no stdout.
+    runner = pick_runner(col)
+    done = 0
+    n_batch = 0
+    while True:
+        if iterations:
+            if done >= iterations:
+                return
+            n = min(batch, iterations - done)
+            timeout = None
+        else:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            n = batch
+            timeout = remaining
+        n_batch += 1
+        batch_dir = os.path.join(out_dir, f"vu-{vu:03d}", f"batch-{n_batch:04d}")
+        if runner is run_native:
+            res = run_native(col, env, batch_dir, timeout=timeout, iterations=n)
+        else:
+            res = run_collection(col, env, batch_dir, timeout=timeout, extra_args=["-n", str(n)])
+        summ = summarize_run(res.get("report_path"), res.get("stdout"), res.get("stdout_items"))
+        done += n
+        with lock:
+            sink.extend(summ["items"])
+
+def load_stats(items: list, elapsed_s: float) -> dict:
+    # Erro = sem resposta HTTP ou HTTP >= 400
+    per_req = {}
+    for it in items:
+        st = per_req.setdefault(it.get("name") or "", [0, 0])
+        st[0] += 1
+        sc = it.get("status_code")
+        if sc is None or sc >= 400:
+            st[1] += 1
+    total = sum(c for c, _ in per_req.values())
+    errors = sum(e for _, e in per_req.values())
+    elapsed = max(elapsed_s, 1e-9)
+    return {
+        "elapsed_s": elapsed_s,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": total / elapsed,
+        "error_rate": errors / total if total else 0.0,
+        "per_request": {
+            name: {"count": c, "errors": e, "throughput_rps": c / elapsed, "error_rate": e / c if c else 0.0}
+            for name, (c, e) in per_req.items()
+        },
+    }
+
+def run_load_test(root: str, opts: dict, base_log_dir: str) -> dict:
+    col, env = resolve_pair(root, opts["project"], opts.get("collection"), opts.get("environment"))
+    vus = max(1, int(opts.get("vus") or 1))
+    iterations = int(opts.get("iterations") or 0)
+    duration = float(opts.get("duration") or 0)
+    if not iterations and not duration:
+        duration = 60.0
+    batch = max(1, _env_int("AUTOMATEST_LOAD_BATCH", 10))
+    out_dir = os.path.join(base_log_dir, "load", opts["project"], env_label_from_path(env))
+    # No modo iterações, o total é dividido entre os VUs
+    shares = [iterations // vus + (1 if i < iterations % vus else 0) for i in range(vus)] if iterations else [0] * vus
+
+    print(f"\n=== Carga: {opts['project']} | env={os.path.basename(env)} | col={os.path.basename(col)} | "
+          f"{vus} VU(s) | " + (f"{iterations} iterações" if iterations else f"{duration:g}s"))
+    items, lock = [], threading.Lock()
+    started = time.monotonic()
+    deadline = started + duration
+    threads = [
+        threading.Thread(target=_load_virtual_user, name=f"automatest-vu-{i}", daemon=True,
+                         args=(i + 1, col, env, out_dir, deadline, shares[i], batch, items, lock))
+        for i in range(vus) if shares[i] or not iterations
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    tests = [t for it in items for t in it.get("tests", [])]
+    failed_tests = sum(1 for t in tests if not t.get("ok"))
+    stats = load_stats(items, elapsed)
+    summary = {
+        "ok": stats["requests"] > 0 and stats["errors"] == 0 and failed_tests == 0,
+        "flaky": False,
+        "reason": None if stats["requests"] else "sem requests contabilizados",
+        "total_requests": stats["requests"],
+        "failed_requests": stats["errors"],
+        "total_tests": len(tests),
+        "failed_tests": failed_tests,
+        "attempts": [],
+        "latency": latency_stats(items),
+        "load": {**stats, "vus": vus, "iterations": iterations, "duration_s": duration},
+        # A lista por execução fica nos logs; o relatório mostra os agregados
+        "items": [],
+    }
+    return {
+        "project": opts["project"],
+        "env_label": env_label_from_path(env),
+        "collection_name": os.path.basename(col),
+        "summary": summary,
+        "attachments": [],
+        "exec_meta": {"returncode": 0, "stderr": "", "stdout": "", "cmd": "load"},
+    }
+
+def _load_lines(load: dict) -> list:
+    mode = f"{load['iterations']} iterações" if load["iterations"] else f"{load['duration_s']:g}s"
+    lines = [f"- Carga: {load['vus']} VU(s), {mode}, {load['elapsed_s']:.1f}s reais — "
+             f"{load['throughput_rps']:.2f} req/s, erros {load['errors']}/{load['requests']} "
+             f"({load['error_rate'] * 100:.1f}%)"]
+    for name, r in load["per_request"].items():
+        lines.append(f"  •  {name}: {r['count']} req, {r['throughput_rps']:.2f} req/s, "
+                     f"erros {r['error_rate'] * 100:.1f}%")
+    return lines
+
+# =====================================================================
+# Latência (percentis por request e por collection)
+# =====================================================================
+def latency_budget_ms() -> float:
+    # AUTOMATEST_LATENCY_BUDGET_MS <= 0 desliga a marcação
+    try:
+        return max(0.0, float(os.getenv("AUTOMATEST_LATENCY_BUDGET_MS", "") or 0))
+    except ValueError:
+        return 0.0
+
+def _percentile(sorted_vals: list, p: float) -> float:
+    # Interpolação linear entre os vizinhos (igual ao numpy "linear")
+    if not sorted_vals:
+        return None
+    k = (len(sorted_vals) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+def _latency_block(values: list, budget: float) -> dict:
+    vals = sorted(values)
+    return {
+        "n": len(vals),
+        "p50": _percentile(vals, 50),
+        "p90": _percentile(vals, 90),
+        "p99": _percentile(vals, 99),
+        "max": vals[-1],
+        "over_budget": sum(1 for v in vals if v > budget) if budget else 0,
+    }
+
+def latency_samples(items: list) -> dict:
+    """Tempos de resposta por request em arrays compactos (dá para somar entre blocos antes dos percentis)."""
+    per_request = {}
+    for it in items:
+        ms = it.get("response_time_ms")
+        if ms is not None:
+            per_request.setdefault(it.get("name") or "", array("d")).append(ms)
+    return per_request
+
+def latency_stats(items: list, budget: float = None, samples: dict = None) -> dict:
+    budget = latency_budget_ms() if budget is None else budget
+    per_request = latency_samples(items) if samples is None else samples
+    if not per_request:
+        return {}
+    all_vals = [v for vals in per_request.values() for v in vals]
+    return {
+        "budget_ms": budget,
+        "collection": _latency_block(all_vals, budget),
+        "requests": {name: _latency_block(vals, budget) for name, vals in per_request.items()},
+    }
+
+def _fmt_ms(v) -> str:
+    return "-" if v is None else f"{v:.0f}"
+
+# =====================================================================
+# Histórico (SQLite) + detecção de regressões
+# =====================================================================
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id          INTEGER PRIMARY KEY,
+    started_at  TEXT NOT NULL,
+    log_dir     TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    project      TEXT NOT NULL,
+    environment  TEXT NOT NULL,
+    collection   TEXT NOT NULL,
+    request      TEXT NOT NULL,  -- '' = agregado da collection
+    run_id       INTEGER NOT NULL REFERENCES runs(id),
+    status       TEXT,
+    executions   INTEGER NOT NULL,
+    failed_tests INTEGER NOT NULL,
+    total_tests  INTEGER NOT NULL,
+    p50 REAL, p90 REAL, p99 REAL, max REAL,
+    PRIMARY KEY (project, environment, collection, request, run_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_runs_started ON runs(started_at);
+"""
+
+def history_config() -> dict:
+    path = os.getenv("AUTOMATEST_HISTORY_DB", os.path.join("logs", "history.sqlite"))
+    try:
+        min_pct = float(os.getenv("AUTOMATEST_REGRESSION_MIN_PCT", "") or 20)
+    except ValueError:
+        min_pct = 20.0
+    return {
+        "path": None if path.lower() in ("", "0", "off", "false") else path,
+        "baseline_runs": max(1, _env_int("AUTOMATEST_BASELINE_RUNS", 14)),
+        "min_samples": max(2, _env_int("AUTOMATEST_BASELINE_MIN_SAMPLES", 5)),
+        "min_pct": min_pct,
+    }
+
+def history_open(path: str):
+    ensure_dir(os.path.dirname(os.path.abspath(path)))
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(HISTORY_SCHEMA)
+    return conn
+
+def _history_rows(grouped: dict):
+    """Linhas normalizadas (1 por request + 1 agregada por collection) a partir dos resumos."""
+    for proj, envs in grouped.items():
+        for env_label, entries in envs.items():
+            for res in entries:
+                summ = res["summary"]
+                if summ.get("cached"):
+                    continue
+                lat = summ.get("latency") or {}
+                col = lat.get("collection") or {}
+                yield {
+                    "project": proj, "environment": env_label, "collection": res["collection_name"],
+                    "request": "", "status": summary_status(summ),
+                    "executions": summ.get("total_requests", 0),
+                    "failed_tests": summ.get("failed_tests", 0), "total_tests": summ.get("total_tests", 0),
+                    "p50": col.get("p50"), "p90": col.get("p90"), "p99": col.get("p99"), "max": col.get("max"),
+                }
+                per_req = {}
+                for it in summ.get("items", []):
+                    agg = per_req.setdefault(it.get("name") or "", [0, 0, 0])
+                    agg[0] += 1
+                    agg[1] += sum(1 for t in it.get("tests", []) if not t.get("ok"))
+                    agg[2] += len(it.get("tests", []))
+                for name, (n, failed, total) in per_req.items():
+                    r = (lat.get("requests") or {}).get(name) or {}
+                    yield {
+                        "project": proj, "environment": env_label, "collection": res["collection_name"],
+                        "request": name, "status": "failed" if failed else "ok",
+                        "executions": n, "failed_tests": failed, "total_tests": total,
+                        "p50": r.get("p50"), "p90": r.get("p90"), "p99": r.get("p99"), "max": r.get("max"),
+                    }
+
+def history_record(conn, started_at: str, log_dir: str, grouped: dict) -> int:
+    with conn:
+        run_id = conn.execute("INSERT INTO runs (started_at, log_dir) VALUES (?, ?)",
+                              (started_at, log_dir)).lastrowid
+        conn.executemany(
+            "INSERT OR REPLACE INTO results (project, environment, collection, request, run_id, status, "
+            "executions, failed_tests, total_tests, p50, p90, p99, max) VALUES "
+            "(:project, :environment, :collection, :request, :run_id, :status, "
+            ":executions, :failed_tests, :total_tests, :p50, :p90, :p99, :max)",
+            ({**row, "run_id": run_id} for row in _history_rows(grouped)),
+        )
+    return run_id
+
+def _baseline(conn, row: dict, limit: int) -> list:
+    # Usa a PK (project, environment, collection, request, run_id): busca por faixa no índice
+    return conn.execute(
+        "SELECT p50, failed_tests FROM results "
+        "WHERE project=? AND environment=? AND collection=? AND request=? "
+        "ORDER BY run_id DESC LIMIT ?",
+        (row["project"], row["environment"], row["collection"], row["request"], limit),
+    ).fetchall()
+
+def history_compare(conn, grouped: dict, cfg: dict = None) -> list:
+    """
+    Compara a execução atual com as últimas N do histórico (antes de gravá-la).
+    Latência: regressão quando o p50 fica acima da mediana do baseline em mais de
+    `min_pct`% E o z-score robusto (mediana/MAD) passa de 3.
+    Falhas: request que falhou hoje mas quase nunca falha (< 10% das execuções do baseline).
+    """
+    cfg = cfg or history_config()
+    out = []
+    for row in _history_rows(grouped):
+        base = _baseline(conn, row, cfg["baseline_runs"])
+        if len(base) < cfg["min_samples"]:
+            continue
+        where = " / ".join(p for p in (row["project"], row["environment"], row["collection"], row["request"]) if p)
+        p50s = [b[0] for b in base if b[0] is not None]
+        if row["p50"] is not None and len(p50s) >= cfg["min_samples"]:
+            med = statistics.median(p50s)
+            mad = statistics.median(abs(v - med) for v in p50s) * 1.4826
+            pct = (row["p50"] - med) / med * 100 if med else 0.0
+            z = (row["p50"] - med) / mad if mad else float("inf")
+            if pct > cfg["min_pct"] and z > 3:
+                out.append({
+                    "kind": "latency", "where": where, "current": row["p50"], "baseline": med,
+                    "pct": pct, "z": z, "samples": len(p50s),
+                })
+        if row["failed_tests"] and row["request"]:
+            fail_rate = sum(1 for b in base if b[1]) / len(base)
+            if fail_rate < 0.1:
+                out.append({
+                    "kind": "failure", "where": where, "failed_tests": row["failed_tests"],
+                    "fail_rate": fail_rate, "samples": len(base),
+                })
+    return out
+
+def _regression_lines(regressions: list) -> list:
+    lines = []
+    for r in regressions:
+        if r["kind"] == "latency":
+            z = "∞" if r["z"] == float("inf") else f"{r['z']:.1f}"
+            lines.append(f"{r['where']}: p50 {_fmt_ms(r['current'])} ms vs. baseline {_fmt_ms(r['baseline'])} ms "
+                         f"(+{r['pct']:.0f}%, z={z}, n={r['samples']})")
+        else:
+            lines.append(f"{r['where']}: {r['failed_tests']} teste(s) falhando — falhou em "
+                         f"{r['fail_rate'] * 100:.0f}% das últimas {r['samples']} execuções")
+    return lines
+
+# =====================================================================
+# Arquivo de logs: compactação em segmentos, índice (SQLite) e retenção
+# =====================================================================
+RUN_DIR_RE = re.compile(r"^\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}$")
+# Gravado no fim do execute_plan: a execução terminou e pode ser compactada
+RUN_DONE_MARKER = ".done"
+# Outra execução pode estar gravando no mesmo logs/: só mexe em diretórios parados há tanto tempo
+# (sem marcador = execução interrompida ou ainda rodando, espera bem mais)
+ARCHIVE_MIN_IDLE_S = 10 * 60
+ARCHIVE_STALE_S = 24 * 3600
+# artifacts.zip e cli.items.ndjson só repetem run.json/cli.log.txt, que já vão para o segmento
+ARCHIVE_SKIP_FILES = ("artifacts.zip", RUN_DONE_MARKER, STDOUT_ITEMS_FILE)
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run          TEXT PRIMARY KEY,   -- nome do diretório logs/<timestamp>
+    day          TEXT NOT NULL,
+    segment      TEXT NOT NULL,
+    raw_bytes    INTEGER NOT NULL,
+    stored_bytes INTEGER NOT NULL,
+    archived_at  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    id          INTEGER PRIMARY KEY,
+    run         TEXT NOT NULL REFERENCES runs(run),
+    path        TEXT NOT NULL,       -- relativo a logs/<timestamp>
+    project     TEXT,
+    environment TEXT,
+    collection  TEXT,
+    part        TEXT,                -- shard-NN / data-NNNN
+    segment     TEXT NOT NULL,
+    offset      INTEGER NOT NULL,
+    length      INTEGER NOT NULL,
+    size        INTEGER NOT NULL,
+    crc32       INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS executions (
+    file_id      INTEGER NOT NULL REFERENCES files(id),
+    request      TEXT NOT NULL,
+    seq          INTEGER NOT NULL,   -- n-ésima ocorrência do nome no run.json
+    run          TEXT NOT NULL,
+    project      TEXT,
+    environment  TEXT,
+    collection   TEXT,
+    iteration    INTEGER,
+    status_code  INTEGER,
+    ok           INTEGER NOT NULL,
+    failed_tests INTEGER NOT NULL,
+    response_time_ms REAL,
+    PRIMARY KEY (file_id, request, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_files_run ON files(run);
+CREATE INDEX IF NOT EXISTS idx_exec_lookup ON executions(project, environment, request, run);
+CREATE INDEX IF NOT EXISTS idx_exec_run ON executions(run);
+"""
+
+def archive_config() -> dict:
+    path = os.getenv("AUTOMATEST_ARCHIVE_DIR", os.path.join("logs", "archive"))
+    return {
+        "dir": None if path.lower() in ("", "0", "off", "false") else path,
+        "after_days": max(0, _env_int("AUTOMATEST_ARCHIVE_AFTER_DAYS", 7)),
+        "retention_days": max(0, _env_int("AUTOMATEST_LOG_RETENTION_DAYS", 90)),
+        "level": min(9, max(1, _env_int("AUTOMATEST_ARCHIVE_LEVEL", 6))),
+    }
+
+def archive_open(archive_dir: str):
+    ensure_dir(os.path.join(archive_dir, "segments"))
+    # isolation_level=None: as transações são abertas à mão (BEGIN IMMEDIATE serve de trava entre processos)
+    conn = sqlite3.connect(os.path.join(archive_dir, "index.sqlite"), timeout=120, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(ARCHIVE_SCHEMA)
+    return conn
+
+def _run_day(run: str) -> datetime.date:
+    return datetime.datetime.strptime(run[:10], "%Y-%m-%d").date()
+
+def _segment_append(seg, path: str, level: int):
+    """Acrescenta o arquivo como um stream zlib independente; devolve (offset, tamanho gravado, tamanho, crc32)."""
+    offset = seg.tell()
+    comp = zlib.compressobj(level)
+    size = crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(ATTACH_CHUNK), b""):
+            size += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            seg.write(comp.compress(chunk))
+    seg.write(comp.flush())
+    return offset, seg.tell() - offset, size, crc
+
+def segment_read(archive_dir: str, segment: str, offset: int, length: int, out):
+    """Descompacta um único arquivo do segmento (lê só o intervalo dele) para o arquivo `out`."""
+    dec = zlib.decompressobj()
+    with open(os.path.join(archive_dir, "segments", segment), "rb") as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            buf = f.read(min(ATTACH_CHUNK, remaining))
+            if not buf:
+                raise OSError(f"segmento {segment} truncado")
+            remaining -= len(buf)
+            out.write(dec.decompress(buf))
+    out.write(dec.flush())
+
+def _archive_location(rel: str):
+    """<proj>/<env>/<collection>[/shard-NN|data-NNNN]/<arquivo> -> (projeto, env, collection, parte)."""
+    parts = rel.split(os.sep)
+    if len(parts) < 4:
+        return None, None, None, None
+    return parts[0], parts[1], parts[2], (parts[3] if len(parts) >= 5 else None)
+
+def _archive_executions(path: str, file_id: int, run: str, loc: tuple):
+    project, environment, collection, _ = loc
+    items = []
+    try:
+        layout = None
+        for kind, obj in iter_run_report(path):
+            if kind == "layout":
+                layout = obj
+            elif kind == "execution":
+                items.append(_execution_item(obj, layout))
+    except Exception as e:
+        print(f"[logs] {run}: run.json ilegível ({e}); arquivado sem índice de requests")
+    # seq conta na lista inteira: é o que execution_detail procura ao reler o run.json
+    for (_, name, seq), it in zip(execution_keys(items, by_iteration=False), items):
+        failed = sum(1 for t in it["tests"] if not t["ok"])
+        yield (file_id, name, seq, run, project, environment, collection, it.get("iteration"),
+               it.get("status_code"), int(not failed), failed, it.get("response_time_ms"))
+
+def _last_write(path: str) -> float:
+    latest = os.path.getmtime(path)
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            with contextlib.suppress(OSError):
+                latest = max(latest, os.path.getmtime(os.path.join(dirpath, name)))
+    return latest
+
+def run_settled(logs_root: str, run: str, keep: str = None) -> bool:
+    """
+    Pode compactar/apagar logs/<run>? Nunca a execução atual (`keep`) nem as iniciadas depois dela;
+    as demais só sem escrita há ARCHIVE_MIN_IDLE_S (com marcador de fim) ou ARCHIVE_STALE_S (sem).
+    """
+    path = os.path.join(logs_root, run)
+    if not RUN_DIR_RE.match(run) or not os.path.isdir(path) or (keep and run >= keep):
+        return False
+    try:
+        idle = time.time() - _last_write(path)
+    except OSError:
+        return False
+    done = os.path.exists(os.path.join(path, RUN_DONE_MARKER))
+    return idle >= (ARCHIVE_MIN_IDLE_S if done else ARCHIVE_STALE_S)
+
+def archive_run(conn, archive_dir: str, logs_root: str, run: str, level: int) -> tuple:
+    """Compacta logs/<run> no segmento do dia e indexa arquivos e execuções; remove o diretório no fim."""
+    run_dir = os.path.join(logs_root, run)
+    segment = f"{run[:10]}.seg"
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM runs WHERE run=?", (run,)).fetchone():
+            conn.execute("ROLLBACK")
+            shutil.rmtree(run_dir, ignore_errors=True)  # já indexada: sobrou só o diretório
+            return 0, 0
+        raw = stored = 0
+        with open(os.path.join(archive_dir, "segments", segment), "ab") as seg:
+            for dirpath, dirnames, filenames in os.walk(run_dir):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name in ARCHIVE_SKIP_FILES:
+                        continue
+                    path = os.path.join(dirpath, name)
+                    rel = os.path.relpath(path, run_dir)
+                    loc = _archive_location(rel)
+                    offset, length, size, crc = _segment_append(seg, path, level)
+                    raw += size
+                    stored += length
+                    file_id = conn.execute(
+                        "INSERT INTO files (run, path, project, environment, collection, part, segment, offset, "
+                        "length, size, crc32) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (run, rel, *loc, segment, offset, length, size, crc)).lastrowid
+                    if name == "run.json":
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO executions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            _archive_executions(path, file_id, run, loc))
+            seg.flush()
+            os.fsync(seg.fileno())
+        conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+                     (run, run[:10], segment, raw, stored, datetime.datetime.now().isoformat(timespec="seconds")))
+        conn.execute("COMMIT")
+    except BaseException:
+        # bytes que sobrarem no fim do segmento ficam órfãos (o índice não aponta para eles)
+        conn.execute("ROLLBACK")
+        raise
+    shutil.rmtree(run_dir, ignore_errors=True)
+    return raw, stored
+
+def apply_retention(conn, archive_dir: str, logs_root: str, cutoff: datetime.date, keep: str = None) -> tuple:
+    """Apaga segmentos e diretórios de execução anteriores a `cutoff`. Devolve (segmentos, diretórios)."""
+    segs = dirs = 0
+    if archive_dir:
+        for (segment,) in conn.execute("SELECT DISTINCT segment FROM runs WHERE day < ?",
+                                       (cutoff.isoformat(),)).fetchall():
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                runs = [r for (r,) in conn.execute("SELECT run FROM runs WHERE segment=?", (segment,))]
+                for run in runs:
+                    conn.execute("DELETE FROM executions WHERE run=?", (run,))
+                    conn.execute("DELETE FROM files WHERE run=?", (run,))
+                conn.execute("DELETE FROM runs WHERE segment=?", (segment,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(archive_dir, "segments", segment))
+            segs += 1
+    for run in os.listdir(logs_root):
+        if RUN_DIR_RE.match(run) and _run_day(run) < cutoff and run_settled(logs_root, run, keep):
+            shutil.rmtree(os.path.join(logs_root, run), ignore_errors=True)
+            dirs += 1
+    return segs, dirs
+
+def compact_logs(logs_root: str = "logs", keep: str = None, cfg: dict = None) -> dict:
+    """
+    Compacta as execuções com mais de `after_days` dias e aplica a retenção; `keep` (a execução
+    atual), as posteriores a ela e as que ainda recebem escrita ficam de fora (ver run_settled).
+    Pode rodar ao mesmo tempo em dois processos: o BEGIN IMMEDIATE serializa cada execução.
+    """
+    cfg = cfg or archive_config()
+    out = {"runs": 0, "raw_bytes": 0, "stored_bytes": 0, "segments_removed": 0, "dirs_removed": 0}
+    if not os.path.isdir(logs_root):
+        return out
+    today = datetime.date.today()
+    conn = archive_open(cfg["dir"]) if cfg["dir"] else None
+    try:
+        if conn is not None:
+            limit = today - datetime.timedelta(days=cfg["after_days"])
+            for run in sorted(os.listdir(logs_root)):
+                if not RUN_DIR_RE.match(run) or (cfg["after_days"] and _run_day(run) > limit):
+                    continue
+                if not run_settled(logs_root, run, keep):
+                    continue
+                raw, stored = archive_run(conn, cfg["dir"], logs_root, run, cfg["level"])
+                out["runs"] += 1
+                out["raw_bytes"] += raw
+                out["stored_bytes"] += stored
+        if cfg["retention_days"]:
+            out["segments_removed"], out["dirs_removed"] = apply_retention(
+                conn, cfg["dir"], logs_root, today - datetime.timedelta(days=cfg["retention_days"]), keep)
+    finally:
+        if conn is not None:
+            conn.close()
+    return out
+
+def query_logs(cfg: dict, project: str = None, environment: str = None, collection: str = None,
+               request: str = None, run: str = None, failed: bool = False, limit: int = 20) -> list:
+    """Busca execuções no índice (nada é descompactado aqui)."""
+    where, params = [], []
+    for col, val in (("e.project", project), ("e.request", request)):
+        if val:
+            where.append(f"{col} = ?")
+            params.append(val)
+    # environment/collection/run aceitam prefixo: "1.Dev", "MinhaCollection", "2026-10-01"
+    for col, val in (("e.environment", environment), ("e.collection", collection), ("e.run", run)):
+        if val:
+            where.append(f"{col} >= ? AND {col} < ?")
+            params += [val, val + "\uffff"]
+    if failed:
+        where.append("e.ok = 0")
+    sql = ("SELECT e.run, e.project, e.environment, e.collection, f.part, e.request, e.seq, e.iteration, "
+           "e.status_code, e.ok, e.failed_tests, e.response_time_ms, f.segment, f.offset, f.length "
+           "FROM executions e JOIN files f ON f.id = e.file_id"
+           + (" WHERE " + " AND ".join(where) if where else "")
+           + " ORDER BY e.run DESC, e.project, e.environment, e.collection, f.part, e.request, e.seq LIMIT ?")
+    conn = archive_open(cfg["dir"])
+    try:
+        cols = ("run", "project", "environment", "collection", "part", "request", "seq", "iteration",
+                "status_code", "ok", "failed_tests", "response_time_ms", "segment", "offset", "length")
+        return [dict(zip(cols, row)) for row in conn.execute(sql, params + [limit])]
+    finally:
+        conn.close()
+
+def execution_detail(cfg: dict, row: dict) -> dict:
+    """Descompacta só o run.json da execução encontrada e devolve o item completo (testes e erros)."""
+    tmp = os.path.join(cfg["dir"], f".query-{uuid.uuid4().hex[:8]}.json")
+    try:
+        with open(tmp, "wb") as out:
+            segment_read(cfg["dir"], row["segment"], row["offset"], row["length"], out)
+        n, layout = 0, None
+        for kind, obj in iter_run_report(tmp):
+            if kind == "layout":
+                layout = obj
+            if kind != "execution":
+                continue
+            item = _execution_item(obj, layout)
+            if item["name"] == row["request"]:
+                if n == row["seq"]:
+                    return item
+                n += 1
+        return {}
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+
+def logs_command(args) -> int:
+    """--compact-logs / --query-logs (não precisa do Postman CLI)."""
+    load_dotenv()
+    cfg = archive_config()
+    if args.compact_logs:
+        res = compact_logs(cfg=cfg)
+        ratio = (f" ({res['raw_bytes'] / 1048576:.1f} MB → {res['stored_bytes'] / 1048576:.1f} MB)"
+                 if res["runs"] else "")
+        print(f"Logs: {res['runs']} execução(ões) compactada(s){ratio}; retenção removeu "
+              f"{res['segments_removed']} segmento(s) e {res['dirs_removed']} diretório(s).")
+    if args.query_logs:
+        if not cfg["dir"] or not os.path.exists(os.path.join(cfg["dir"], "index.sqlite")):
+            print("Sem arquivo de logs para consultar (AUTOMATEST_ARCHIVE_DIR).")
+            return 1
+        rows = query_logs(cfg, args.project, args.environment, args.collection, args.request,
+                          args.run, args.failed, args.limit)
+        for row in rows:
+            where = " / ".join(p for p in (row["project"], row["environment"], row["collection"], row["part"]) if p)
+            it = "" if row["iteration"] is None else f" iteração {row['iteration'] + 1}"
+            ms = "" if row["response_time_ms"] is None else f" {_fmt_ms(row['response_time_ms'])} ms"
+            status = "OK" if row["ok"] else f"FALHA ({row['failed_tests']} teste(s))"
+            print(f"{row['run']} | {where} | {row['request']} #{row['seq'] + 1}{it} | "
+                  f"HTTP {row['status_code'] or '-'}{ms} | {status}")
+            if args.show:
+                print(json.dumps(execution_detail(cfg, row), ensure_ascii=False, indent=2))
+        if not rows:
+            print("Nenhuma execução encontrada.")
+    return 0
+
+# =====================================================================
+# Texto e HTML do relatório
+# =====================================================================
+def style_block_collection_text(title: str, summary: dict) -> str:
+    status = {"ok": "✅ OK", "flaky": "⚠️ INSTÁVEL", "failed": "❌ PROBLEMA"}[summary_status(summary)]
+    lines = [f"#### {title} — {status}"]
+    lines.append(f"- Requests: {summary.get('total_requests',0)}")
+    lines.append(f"- Tests: {summary.get('total_tests',0)} (falhas: {summary.get('failed_tests',0)})")
+    if summary.get("reason"):
+        lines.append(f"- Observação: {summary['reason']}")
+    attempts = _attempts_line(summary)
+    if attempts:
+        lines.append(f"- Tentativas: {attempts}")
+    if summary.get("shards"):
+        lines.append(f"- Executada em {summary['shards']} shard(s) em paralelo")
+    if summary.get("data"):
+        d = summary["data"]
+        lines.append(f"- Massa de dados {d['file']}: {d['rows']} linha(s) em {d['chunks']} bloco(s) em paralelo")
+    if summary.get("cached"):
+        lines.append(f"- Resultado reaproveitado de {summary.get('cached_at')} (arquivos sem mudança)")
+    if summary.get("auth_note"):
+        lines.append(f"- Login: {summary['auth_note']}")
+    if summary.get("cassette_note"):
+        lines.append(f"- Cassette: {summary['cassette_note']}")
+    if summary.get("load"):
+        lines.extend(_load_lines(summary["load"]))
+    if summary.get("items"):
+        lines.append("- Requisições e testes:")
+        for it in summary["items"]:
+            sc = it.get("status_code")
+            sc_str = f"HTTP {sc}" if sc is not None else ""
+            ms = it.get("response_time_ms")
+            ms_str = f"({_fmt_ms(ms)} ms)" if ms is not None else ""
+            nm = it.get("name") or ""
+            lines.append(f"  •  {nm} {sc_str} {ms_str}".rstrip())
+            if it.get("tests"):
+                for t in it["tests"]:
+                    mark = "✓" if t.get("ok") else "✗"
+                    lines.append(f"    {mark} {t.get('name')}")
+            else:
+                lines.append("    (sem testes definidos)")
+    lat = summary.get("latency") or {}
+    if lat:
+        c = lat["collection"]
+        lines.append(f"- Latência (ms): p50={_fmt_ms(c['p50'])} p90={_fmt_ms(c['p90'])} "
+                     f"p99={_fmt_ms(c['p99'])} max={_fmt_ms(c['max'])} (n={c['n']})")
+        for name, r in lat["requests"].items():
+            flag = f" ⏱ {r['over_budget']}x acima de {_fmt_ms(lat['budget_ms'])} ms" if r["over_budget"] else ""
+            lines.append(f"  •  {name}: p50={_fmt_ms(r['p50'])} p90={_fmt_ms(r['p90'])} "
+                         f"p99={_fmt_ms(r['p99'])} max={_fmt_ms(r['max'])} (n={r['n']}){flag}")
+    return "\n".join(lines)
+
+def build_human_report(grouped_results: dict, regressions: list = None) -> str:
+    lines = ["# Relatório de Execução (Postman CLI)", ""]
+    if regressions:
+        lines.append("## ⚠️ Regressões em relação ao histórico")
+        lines.extend(f"- {ln}" for ln in _regression_lines(regressions))
+        lines.append("")
+    for proj, envs in sorted(grouped_results.items()):
+        lines.append(f"## {proj}")
+        for env_label, items in sorted(envs.items()):
+            lines.append(f"### Environment: {env_label}")
+            for it in items:
+                title = it["collection_name"]
+                lines.append(style_block_collection_text(title, it["summary"]))
+                lines.append("")
+            lines.append("")
+        lines.append("")
+    lines.extend([
+        "---",
+        "### Dicas rápidas",
+        "- Se **nenhum request** foi contado, confirme AUTH/ENV (tokens, URLs) e se a coleção não está filtrada por folder.",
+        "- Se houver **exit code ≠ 0**, veja as últimas linhas do stderr acima para pistas imediatas.",
+        "- Falhas de teste listam o *assert* que quebrou; ajuste o pre-request/headers/body ou o teste conforme necessário."
+    ])
+    return "\n".join(lines)
+
+# HTML: templates pré-compilados + classes CSS compartilhadas (sem estilo inline por linha)
+REPORT_CSS = (
+    ".r{font-family:system-ui,Segoe UI,Arial;font-size:14px;color:#0f172a}"
+    ".r h2{margin:0 0 12px}.r h3{margin:18px 0 6px}.r h4{margin:12px 0 6px}"
+    ".card{border:1px solid #e5e7eb;border-radius:12px;padding:12px;margin:8px 0}"
+    ".warn{border-color:#fcd34d;background:#fffbeb}"
+    ".hd{display:flex;justify-content:space-between;align-items:center;gap:12px;margin-bottom:6px}"
+    ".tt{font-weight:600}.meta{color:#334155;margin-bottom:8px}"
+    ".b{display:inline-block;padding:2px 8px;border-radius:9999px;color:#fff;font:12px/1.4 system-ui,Segoe UI,Arial}"
+    ".b.ok{background:#16a34a}.b.fail{background:#dc2626}.b.flaky{background:#d97706}"
+    "table.t{width:100%;border-collapse:collapse;border:1px solid #e5e7eb;margin-top:8px}"
+    ".t th{text-align:left;padding:6px;border-bottom:1px solid #e5e7eb;background:#f8fafc}"
+    ".t td{vertical-align:top;padding:6px;border-bottom:1px solid #f1f5f9}"
+    ".t .n{text-align:right}.t .bad{color:#dc2626;font-weight:600}.t .fold{color:#64748b;font-style:italic}"
+    ".t ul,.card ul{margin:6px 0;padding-left:18px}.foot{margin-top:12px;color:#64748b}"
+)
+_BADGES = {
+    "ok": '<span class="b ok">OK</span>',
+    "failed": '<span class="b fail">FALHA</span>',
+    "flaky": '<span class="b flaky">INSTÁVEL</span>',
+}
+_T_PAGE_HEAD = string.Template(
+    '<!DOCTYPE html><html><head><meta charset="utf-8"><style>$css</style></head>'
+    '<body><div class="r"><h2>Relatório de Execução (Postman CLI)</h2>')
+_T_PAGE_FOOT = '<p class="foot">Gerado automaticamente.</p></div></body></html>'
+_T_CARD_HEAD = string.Template(
+    '<div class="card"><div class="hd"><div class="tt">$title</div>$badge</div><div class="meta">'
+    '<div>Requests: <b>$requests</b></div><div>Tests: <b>$tests</b> (falhas: <b>$failed</b>)</div>$notes</div>')
+_T_REQ_TABLE = ('<table class="t"><thead><tr><th>Request</th><th>HTTP</th><th>ms</th><th>Testes</th>'
+                '</tr></thead><tbody>')
+_T_REQ_ROW = string.Template('<tr><td>$name</td><td>$http</td><td>$ms</td><td>$tests</td></tr>')
+_T_FOLD_ROW = string.Template('<tr><td class="fold" colspan="4">✓ $n request(s) OK — todos os testes passaram</td></tr>')
+_T_NUM_TABLE = string.Template('<table class="t"><thead><tr><th>$title</th>$heads</tr></thead><tbody>$rows</tbody></table>')
+_T_NUM_ROW = string.Template('<tr><td$cls>$label</td>$cells</tr>')
+
+def html_render_config() -> dict:
+    return {
+        "max_bytes": max(0, _env_int("AUTOMATEST_HTML_MAX_BYTES", 400_000)),
+        "fold_tests": max(0, _env_int("AUTOMATEST_HTML_FOLD_TESTS", 5)),
+        "fold_rows": max(0, _env_int("AUTOMATEST_HTML_FOLD_ROWS", 20)),
+    }
+
+def _badge(ok: bool, flaky: bool = False) -> str:
+    return _BADGES["failed" if not ok else ("flaky" if flaky else "ok")]
+
+def _num_table(title: str, heads: tuple, rows: list) -> str:
+    # rows: (rótulo já escapado, destacar?, valores)
+    return _T_NUM_TABLE.substitute(
+        title=title,
+        heads="".join(f'<th class="n">{h}</th>' for h in heads),
+        rows="".join(_T_NUM_ROW.substitute(cls=' class="bad"' if bad else "", label=label,
+                                           cells="".join(f'<td class="n">{v}</td>' for v in vals))
+                     for label, bad, vals in rows),
+    )
+
+def _latency_table_html(lat: dict) -> str:
+    if not lat:
+        return ""
+    budget = lat.get("budget_ms") or 0
+    entries = [("<b>Collection</b>", lat["collection"])] + [(escape(n), r) for n, r in lat["requests"].items()]
+    rows = []
+    for label, r in entries:
+        over = r["over_budget"]
+        flag = f" ⏱ {over}x &gt; {_fmt_ms(budget)} ms" if over else ""
+        rows.append((label + flag, bool(over),
+                     (r["n"], _fmt_ms(r["p50"]), _fmt_ms(r["p90"]), _fmt_ms(r["p99"]), _fmt_ms(r["max"]))))
+    return _num_table("Latência (ms)", ("n", "p50", "p90", "p99", "max"), rows)
+
+def _load_table_html(load: dict) -> str:
+    if not load:
+        return ""
+    rows = [(escape(name), bool(r["errors"]),
+             (r["count"], f"{r['throughput_rps']:.2f}", r["errors"], f"{r['error_rate'] * 100:.1f}"))
+            for name, r in load["per_request"].items()]
+    return _num_table("Carga", ("req", "req/s", "erros", "% erro"), rows)
+
+def _item_failed(it: dict) -> bool:
+    sc = it.get("status_code")
+    return (sc is not None and sc >= 400) or any(not t.get("ok") for t in it.get("tests") or [])
+
+def _tests_cell(tests: list, fold_tests: int) -> str:
+    if not tests:
+        return "<em>(sem testes definidos)</em>"
+    if fold_tests and len(tests) > fold_tests and all(t.get("ok") for t in tests):
+        return f'{_BADGES["ok"]} {len(tests)} testes OK'
+    return "<ul>" + "".join(f"<li>{_badge(bool(t.get('ok')))} {escape(t.get('name') or '')}</li>" for t in tests) + "</ul>"
+
+def _card_notes(summ: dict) -> str:
+    notes = []
+    if summ.get("reason"):
+        notes.append(f"Obs.: {escape(summ['reason'])}")
+    attempts = _attempts_line(summ)
+    if attempts:
+        notes.append(f"Tentativas: {escape(attempts)}")
+    if summ.get("shards"):
+        notes.append(f"Executada em {summ['shards']} shard(s) em paralelo")
+    if summ.get("data"):
+        d = summ["data"]
+        notes.append(f"Massa de dados {escape(d['file'])}: {d['rows']} linha(s) em {d['chunks']} bloco(s) em paralelo")
+    if summ.get("cached"):
+        notes.append(f"Resultado reaproveitado de {escape(str(summ.get('cached_at')))} (arquivos sem mudança)")
+    if summ.get("auth_note"):
+        notes.append(f"Login: {escape(summ['auth_note'])}")
+    if summ.get("cassette_note"):
+        notes.append(f"Cassette: {escape(summ['cassette_note'])}")
+    if summ.get("load"):
+        notes.append(escape(_load_lines(summ["load"])[0][2:]))
+    return "".join(f"<div>{n}</div>" for n in notes)
+
+def _html_card(it: dict, detail: str, cfg: dict) -> str:
+    """detail="full": tudo (com dobras de itens OK); "failures": só requests com problema."""
+    summ = it["summary"]
+    status = summary_status(summ)
+    parts = [_T_CARD_HEAD.substitute(
+        title=escape(it["collection_name"]), badge=_BADGES[status],
+        requests=summ.get("total_requests", 0), tests=summ.get("total_tests", 0),
+        failed=summ.get("failed_tests", 0), notes=_card_notes(summ))]
+    items = summ.get("items", [])
+    if detail == "failures":
+        items = [i for i in items if _item_failed(i)]
+    if items:
+        parts.append(_T_REQ_TABLE)
+        passing_run = []
+
+        def flush_passing():
+            # Sequências longas de requests 100% OK viram uma linha só
+            if cfg["fold_rows"] and len(passing_run) > cfg["fold_rows"]:
+                parts.append(_T_FOLD_ROW.substitute(n=len(passing_run)))
+            else:
+                parts.extend(_req_row(r, cfg) for r in passing_run)
+            passing_run.clear()
+
+        for it2 in items:
+            if _item_failed(it2):
+                flush_passing()
+                parts.append(_req_row(it2, cfg))
+            else:
+                passing_run.append(it2)
+        flush_passing()
+        parts.append('</tbody></table>')
+    if detail == "full":
+        parts.append(_load_table_html(summ.get("load") or {}))
+        parts.append(_latency_table_html(summ.get("latency") or {}))
+    parts.append('</div>')
+    return "".join(parts)
+
+def _req_row(it: dict, cfg: dict) -> str:
+    sc = it.get("status_code")
+    return _T_REQ_ROW.substitute(
+        name=escape(it.get("name") or ""), http=str(sc) if sc is not None else "-",
+        ms=_fmt_ms(it.get("response_time_ms")), tests=_tests_cell(it.get("tests") or [], cfg["fold_tests"]))
+
+def _html_parts(grouped_results: dict, regressions: list, detail: str, cfg: dict):
+    if regressions:
+        yield ('<div class="card warn"><div class="tt">Regressões em relação ao histórico</div><ul>'
+               + "".join(f"<li>{escape(ln)}</li>" for ln in _regression_lines(regressions)) + '</ul></div>')
+    for proj, envs in sorted(grouped_results.items()):
+        yield f'<h3>{escape(proj)}</h3>'
+        for env_label, items in sorted(envs.items()):
+            yield f'<h4>Environment: {escape(env_label)}</h4>'
+            for it in items:
+                yield _html_card(it, detail, cfg)
+
+def render_html_report(grouped_results: dict, regressions: list = None, detail: str = "full",
+                       cfg: dict = None, max_bytes: int = 0, notice: str = None,
+                       full_hint: str = "veja o anexo report.html.") -> str:
+    """Monta o HTML; com `max_bytes`, para de acrescentar blocos ao atingir o limite (e aponta `full_hint`)."""
+    cfg = cfg or html_render_config()
+    head = _T_PAGE_HEAD.substitute(css=REPORT_CSS)
+    if notice:
+        head += f'<div class="card warn">{escape(notice)}</div>'
+    out, size = [head], len(head.encode("utf-8")) + len(_T_PAGE_FOOT)
+    for part in _html_parts(grouped_results, regressions, detail, cfg):
+        n = len(part.encode("utf-8"))
+        if max_bytes and size + n > max_bytes - 200:
+            out.append('<div class="card warn">… relatório truncado pelo limite de tamanho do e-mail; '
+                       f'{escape(full_hint)}</div>')
+            break
+        out.append(part)
+        size += n
+    out.append(_T_PAGE_FOOT)
+    return "".join(out)
+
+def build_html_report(grouped_results: dict, regressions: list = None) -> str:
+    return render_html_report(grouped_results, regressions)
+
+def build_html_email(grouped_results: dict, regressions: list = None, cfg: dict = None,
+                     full_attached: bool = True, full: str = None):
+    """
+    (corpo do e-mail, relatório completo ou None). Acima de AUTOMATEST_HTML_MAX_BYTES o corpo
+    mostra só o que falhou (e, se ainda não couber, é truncado); o completo vai como anexo.
+    `full_attached=False`: o report.html ficou fora do zip e o aviso no corpo diz isso.
+    """
+    cfg = cfg or html_render_config()
+    full = full or render_html_report(grouped_results, regressions, "full", cfg)
+    if not cfg["max_bytes"] or len(full.encode("utf-8")) <= cfg["max_bytes"]:
+        return full, None
+    if full_attached:
+        where, hint = "O relatório completo está no anexo report.html.", "veja o anexo report.html."
+    else:
+        where = ("O relatório completo (report.html) passou do limite de anexos e ficou só no servidor "
+                 "(caminho no fim do e-mail).")
+        hint = "o relatório completo ficou no servidor (caminho no fim do e-mail)."
+    body = render_html_report(grouped_results, regressions, "failures", cfg, max_bytes=cfg["max_bytes"],
+                              notice="Relatório grande: aqui só os requests com problema. " + where,
+                              full_hint=hint)
+    return body, full
+
+def email_html_and_bundle(grouped_results: dict, regressions: list, attachments: list, base_log_dir: str) -> tuple:
+    """
+    Corpo HTML + zip de anexos: o relatório completo (se grande) entra como report.html e o aviso
+    no corpo segue o que foi de fato anexado. Retorna (corpo HTML, zip ou None, pointers).
+    """
+    cfg = html_render_config()
+    body_html, full_html = build_html_email(grouped_results, regressions, cfg)
+    attachments = list(attachments)
+    report_path = None
+    if full_html:
+        report_path = os.path.join(base_log_dir, "report.html")
+        ensure_dir(base_log_dir)
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(full_html)
+        attachments.insert(0, report_path)
+    bundle, pointers = bundle_attachments(attachments, base_log_dir)
+    if report_path and any(p == report_path for p, _ in pointers):
+        body_html, _ = build_html_email(grouped_results, regressions, cfg, full_attached=False, full=full_html)
+    return body_html, bundle, pointers
+
+def add_report_section(body_txt: str, body_html: str, title: str, lines: list, warn: bool = True) -> tuple:
+    """Seção extra no fim dos dois relatórios (texto e HTML), depois de montados."""
+    body_txt += f"\n\n## {title}\n" + "\n".join(f"- {ln}" for ln in lines)
+    if body_html:
+        block = (f'<div class="card{" warn" if warn else ""}"><div class="tt">{escape(title)}</div><ul>'
+                 + "".join(f"<li>{escape(ln)}</li>" for ln in lines) + '</ul></div>')
+        body_html = body_html.replace(_T_PAGE_FOOT, block + _T_PAGE_FOOT, 1)
+    return body_txt, body_html
+
+def _fmt_us(us: float) -> str:
+    return f"{us / 1e6:.1f}s"
+
+def _fmt_kb(kb: float) -> str:
+    return f"{kb / 1024:.0f} MB"
+
+def timing_lines(tracer: Tracer = None) -> list:
+    """Resumo dos spans: fases, totais dos processos filhos/parse e os jobs mais lentos."""
+    tracer = tracer or TRACER
+    lines = []
+    phases = tracer.spans("phase")
+    if phases:
+        lines.append("Fases: " + " | ".join(f"{e['name']} {_fmt_us(e['dur'])}" for e in phases))
+    child = tracer.spans("child")
+    if child:
+        cpu = sum(e["args"].get("child_cpu_ms", 0) for e in child)
+        peak = max((e["args"].get("child_peak_rss_kb", 0) for e in child), default=0)
+        lines.append(f"Postman CLI (somado): {_fmt_us(sum(e['dur'] for e in child))} em {len(child)} processo(s), "
+                     f"CPU dos filhos {cpu / 1000:.1f}s" + (f", pico de memória {_fmt_kb(peak)}" if peak else ""))
+    parse = tracer.spans("parse")
+    if parse:
+        lines.append(f"Leitura dos resultados (somado): {_fmt_us(sum(e['dur'] for e in parse))} "
+                     f"(CPU {sum(e['args']['cpu_ms'] for e in parse) / 1000:.1f}s)")
+    for job in sorted(tracer.spans("job"), key=lambda e: -e["dur"])[:5]:
+        # processos filhos do job: mesma thread, dentro da janela do span
+        inner = [e for e in child if e["tid"] == job["tid"] and job["ts"] <= e["ts"] <= job["ts"] + job["dur"]]
+        cpu = sum(e["args"].get("child_cpu_ms", 0) for e in inner)
+        peak = max((e["args"].get("child_peak_rss_kb", 0) for e in inner), default=0)
+        shard = f" (shard {job['args']['shard']})" if job["args"].get("shard") else ""
+        lines.append(f"Lento: {job['name']}{shard}: {_fmt_us(job['dur'])}"
+                     + (f" (CPU filho {cpu / 1000:.1f}s, pico {_fmt_kb(peak)})" if inner else ""))
+    if resource is not None:
+        ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+        if ru.ru_utime or ru.ru_maxrss:
+            lines.append(f"Todos os processos filhos: CPU {ru.ru_utime + ru.ru_stime:.1f}s, "
+                         f"maior pico de memória {_fmt_kb(ru.ru_maxrss)}")
+    if tracer.log_dir:
+        lines.append(f"Trace: {os.path.join(tracer.log_dir, 'trace.json')} (chrome://tracing ou ui.perfetto.dev)")
+    return lines
+
+# =====================================================================
+# Anexos: um único .zip comprimido, sem duplicatas e com teto de tamanho
+# =====================================================================
+ATTACH_CHUNK = 1 << 20
+
+def attach_config() -> dict:
+    return {"max_bytes": max(0, _env_int("AUTOMATEST_ATTACH_MAX_BYTES", 7_000_000))}
+
+def _hash_attachment(path: str) -> str:
+    """sha256 lendo o arquivo em blocos, sem carregá-lo inteiro (só para achar duplicatas)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(ATTACH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _zip_drop_last(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    """Desfaz a última entrada gravada: trunca o zip no cabeçalho dela e esquece o registro."""
+    zf.filelist.remove(info)
+    zf.NameToInfo.pop(info.filename, None)
+    zf.fp.seek(info.header_offset)
+    zf.fp.truncate()
+    zf.start_dir = info.header_offset
+
+def bundle_attachments(paths: list, base_log_dir: str, cfg: dict = None) -> tuple:
+    """
+    Junta os anexos em logs/<timestamp>/artifacts.zip. Conteúdos idênticos entram uma vez só
+    (as cópias ficam listadas no MANIFEST.txt) e o que estourar AUTOMATEST_ATTACH_MAX_BYTES
+    fica de fora, com o caminho em `pointers`. Retorna (caminho do zip ou None, pointers).
+    """
+    cfg = cfg or attach_config()
+    cap = cfg["max_bytes"]
+    seen_paths, by_hash, dups, pointers = set(), {}, [], []
+    added, budget = 0, 0
+    ensure_dir(base_log_dir)
+    bundle = os.path.join(base_log_dir, "artifacts.zip")
+    # cada arquivo é comprimido uma vez só, direto no zip; o teto é conferido com o tamanho
+    # comprimido que ficou gravado e, se estourar, a entrada é desfeita (truncando o zip)
+    with zipfile.ZipFile(bundle, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        for path in paths or []:
+            if not path or path in seen_paths or not os.path.exists(path):
+                continue
+            seen_paths.add(path)
+            arcname = os.path.relpath(path, base_log_dir).replace(os.sep, "/")
+            if arcname.startswith("../"):
+                arcname = os.path.basename(path)
+            entries = len(zf.filelist)
+            try:
+                digest = _hash_attachment(path)
+                if digest in by_hash:
+                    dups.append((arcname, by_hash[digest]))
+                    continue
+                with open(path, "rb") as src, zf.open(arcname, "w", force_zip64=True) as dst:
+                    shutil.copyfileobj(src, dst, ATTACH_CHUNK)
+            except OSError as e:
+                if len(zf.filelist) > entries:
+                    _zip_drop_last(zf, zf.filelist[-1])
+                pointers.append((path, f"erro de leitura: {e}"))
+                continue
+            info = zf.filelist[-1]
+            if cap and budget + info.compress_size > cap:
+                _zip_drop_last(zf, info)
+                pointers.append((path, f"{info.file_size} bytes, acima do limite de anexos"))
+                continue
+            by_hash[digest] = arcname
+            budget += info.compress_size
+            added += 1
+        manifest = [f"{a}\t(idêntico a {orig})" for a, orig in dups]
+        manifest += [f"{p}\t(não anexado: {why})" for p, why in pointers]
+        if manifest and added:
+            zf.writestr("MANIFEST.txt", "\n".join(manifest) + "\n")
+    if not added:
+        os.remove(bundle)
+        return None, pointers
+    return bundle, pointers
+
+def add_pointer_notes(body_txt: str, body_html: str, pointers: list) -> tuple:
+    """Acrescenta aos relatórios os caminhos dos arquivos que ficaram fora do anexo."""
+    if not pointers:
+        return body_txt, body_html
+    return add_report_section(body_txt, body_html, "Arquivos não anexados (disponíveis no servidor)",
+                              [f"{p} ({why})" for p, why in pointers])
+
+# =====================================================================
+# E-mail (SSL 465 ou STARTTLS) — destinatários SOMENTE constants.EMAIL_RECIPIENTS
+# =====================================================================
+def build_mail(subject: str, body_md: str, body_html: str, attachments: list, cfg: dict):
+    """Monta a mensagem; None se faltar configuração ou destinatário."""
+    must = ("SMTP_HOST", "MAIL_FROM")
+    if not all(cfg.get(k) for k in must):
+        print("E-mail: configuração SMTP incompleta.")
+        return None
+
+    recipients = EMAIL_RECIPIENTS or []
+    if not recipients:
+        print("E-mail: nenhum destinatário definido em constants.EMAIL_RECIPIENTS.")
+        return None
+
+    msg = EmailMessage()
+    msg["From"] = cfg["MAIL_FROM"]
+    msg["To"] = ", ".join(recipients)
+    msg["Subject"] = subject
+    msg["Reply-To"] = cfg["MAIL_FROM"]
+    msg["X-Automation"] = "Automatest-Postman-CLI"
+    msg.set_content(body_md or "Relatório em HTML anexo.")
+    if body_html:
+        msg.add_alternative(body_html, subtype="html")
+
+    for path in attachments or []:
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            fname = os.path.basename(path)
+            if fname.endswith(".json"):
+                maintype, subtype = "application", "json"
+            elif fname.endswith(".txt"):
+                maintype, subtype = "text", "plain"
+            elif fname.endswith(".html"):
+                maintype, subtype = "text", "html"
+            elif fname.endswith(".zip"):
+                maintype, subtype = "application", "zip"
+            else:
+                maintype, subtype = "application", "octet-stream"
+            msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=fname)
+    return msg
+
+def smtp_connect(cfg: dict):
+    """Abre e autentica uma conexão SMTP (SSL na 465, STARTTLS opcional nas demais, login só se houver usuário)."""
+    host = cfg["SMTP_HOST"]; port = int(cfg.get("SMTP_PORT", "465"))
+    if port == 465:
+        server = smtplib.SMTP_SSL(host, port, context=ssl.create_default_context(), timeout=30)
+    else:
+        server = smtplib.SMTP(host, port, timeout=30)
+    try:
+        if port != 465 and str(cfg.get("SMTP_USE_TLS", "true")).lower() in ("1", "true", "yes", "y"):
+            server.starttls(context=ssl.create_default_context())
+        if cfg.get("SMTP_USER"):
+            server.login(cfg["SMTP_USER"], cfg["SMTP_PASS"])
+    except Exception:
+        server.close()
+        raise
+    return server
+
+def mail_queue_config() -> dict:
+    return {
+        "outbox": os.getenv("AUTOMATEST_OUTBOX_DIR", os.path.join("logs", "outbox")),
+        "retries": max(0, _env_int("AUTOMATEST_MAIL_RETRIES", 3)),
+        "backoff": max(0, _env_int("AUTOMATEST_MAIL_BACKOFF", 5)),
+        "max_attempts": max(1, _env_int("AUTOMATEST_MAIL_MAX_ATTEMPTS", 20)),
+        "flush_timeout": max(0, _env_int("AUTOMATEST_MAIL_FLUSH_TIMEOUT", 120)),
+    }
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class MailOutbox:
+    """
+    Fila persistente em disco: cada mensagem é um .eml em logs/outbox/ (com um .json ao lado
+    contando tentativas). Sai da fila quando o envio dá certo; desiste após max_attempts
+    (vai para outbox/failed/). O que sobrar é reenviado na próxima execução.
+
+    Vários processos podem drenar o mesmo outbox: antes de enviar, cada um reivindica a
+    mensagem com um rename atômico para outbox/claimed/<host>-<pid>/; quem perde o rename
+    pula a mensagem. Reivindicações de processos mortos (ou com mais de CLAIM_STALE_S, se
+    forem de outra máquina) voltam para a fila.
+    """
+
+    CLAIM_STALE_S = 3600
+
+    def __init__(self, path: str, max_attempts: int):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.claim_dir = os.path.join(path, "claimed", f"{socket.gethostname()}-{os.getpid()}")
+        ensure_dir(path)
+
+    def put(self, msg: EmailMessage) -> str:
+        name = f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.eml"
+        dest = os.path.join(self.path, name)
+        with open(dest + ".tmp", "wb") as f:
+            f.write(msg.as_bytes(policy=email_policy.SMTP))
+        os.replace(dest + ".tmp", dest)
+        return dest
+
+    def pending(self) -> list:
+        self._recover_stale_claims()
+        return sorted(os.path.join(self.path, n) for n in os.listdir(self.path) if n.endswith(".eml"))
+
+    def claim(self, path: str):
+        """Move a mensagem para o diretório deste processo; None se outro processo já a pegou."""
+        ensure_dir(self.claim_dir)
+        claimed = os.path.join(self.claim_dir, os.path.basename(path))
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        if os.path.exists(path + ".json"):
+            os.replace(path + ".json", claimed + ".json")
+        return claimed
+
+    def release(self, claimed: str):
+        """Devolve a mensagem reivindicada para a fila (próxima drenagem tenta de novo)."""
+        for p in (claimed + ".json", claimed):
+            if os.path.exists(p):
+                os.replace(p, os.path.join(self.path, os.path.basename(p)))
+
+    def _recover_stale_claims(self):
+        root = os.path.join(self.path, "claimed")
+        if not os.path.isdir(root):
+            return
+        host = socket.gethostname()
+        for owner in os.listdir(root):
+            d = os.path.join(root, owner)
+            if d == self.claim_dir:
+                continue
+            owner_host, _, pid = owner.rpartition("-")
+            try:
+                if owner_host == host and pid.isdigit():
+                    stale = not _pid_alive(int(pid))
+                else:
+                    stale = time.time() - os.path.getmtime(d) > self.CLAIM_STALE_S
+                names = os.listdir(d)
+            except OSError:
+                continue
+            if not stale:
+                continue
+            for n in sorted(names, key=lambda n: n.endswith(".eml")):  # .json antes do .eml
+                with contextlib.suppress(OSError):
+                    os.replace(os.path.join(d, n), os.path.join(self.path, n))
+            with contextlib.suppress(OSError):
+                os.rmdir(d)
+
+    def load(self, path: str):
+        with open(path, "rb") as f:
+            return message_from_binary_file(f, policy=email_policy.default)
+
+    def done(self, path: str):
+        for p in (path, path + ".json"):
+            if os.path.exists(p):
+                os.remove(p)
+
+    def failed(self, path: str, error: str, permanent: bool = False) -> bool:
+        """Registra a falha; True se a mensagem foi abandonada."""
+        meta_path = path + ".json"
+        meta = {"attempts": 0}
+        if os.path.exists(meta_path):
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                pass
+        meta["attempts"] = int(meta.get("attempts", 0)) + 1
+        meta["last_error"] = error
+        meta["last_try"] = datetime.datetime.now().isoformat(timespec="seconds")
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        if permanent or meta["attempts"] >= self.max_attempts:
+            dead = os.path.join(self.path, "failed")
+            ensure_dir(dead)
+            for p in (path, meta_path):
+                os.replace(p, os.path.join(dead, os.path.basename(p)))
+            return True
+        return False
+
+def _smtp_permanent(e: Exception) -> bool:
+    # 5xx de dados/destinatário não melhora com nova tentativa; conexão/login/4xx sim
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(e, (smtplib.SMTPDataError, smtplib.SMTPSenderRefused)) and e.smtp_code >= 500
+
+class MailNotifier:
+    """
+    Envio em segundo plano: `submit()` grava no outbox e volta na hora; uma thread drena a
+    fila reaproveitando a mesma conexão autenticada para todas as mensagens pendentes.
+    """
+
+    def __init__(self, cfg: dict, qcfg: dict = None):
+        self.cfg = cfg
+        self.qcfg = qcfg or mail_queue_config()
+        self.outbox = MailOutbox(self.qcfg["outbox"], self.qcfg["max_attempts"])
+        self._cond = threading.Condition()
+        self._wake = True  # drena o que sobrou de execuções anteriores logo ao iniciar
+        self._busy = False
+        self._stop = False
+        self._results = {}
+        self._thread = threading.Thread(target=self._loop, name="mail-notifier", daemon=True)
+        self._thread.start()
+
+    def submit(self, msg: EmailMessage) -> str:
+        path = self.outbox.put(msg)
+        with self._cond:
+            self._wake = True
+            self._cond.notify_all()
+        return path
+
+    def wait(self, path: str, timeout: float = None) -> bool:
+        """Espera o resultado de uma mensagem; False se falhou ou o tempo acabou (fica no outbox)."""
+        with self._cond:
+            self._cond.wait_for(lambda: path in self._results, timeout=timeout)
+            return self._results.get(path, False)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Espera a fila esvaziar; True se nada ficou pendente."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._wake and not self._busy, timeout=timeout)
+        return not self.outbox.pending()
+
+    def close(self, timeout: float = None):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._wake or self._stop)
+                if not self._wake:
+                    return
+                self._wake = False
+                self._busy = True
+            try:
+                self._drain(self.outbox.pending())
+            except Exception as e:
+                print("E-mail: erro no envio em segundo plano:", e)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _drain(self, batch: list):
+        server = None
+        try:
+            for path in batch:
+                claimed = self.outbox.claim(path)
+                if claimed is None:  # outro processo reivindicou primeiro e cuida do envio
+                    with self._cond:
+                        self._results[path] = False
+                        self._cond.notify_all()
+                    continue
+                ok, error, permanent = False, "", False
+                for attempt in range(self.qcfg["retries"] + 1):
+                    if attempt:
+                        time.sleep(self.qcfg["backoff"] * (2 ** (attempt - 1)))
+                    try:
+                        if server is None:
+                            server = smtp_connect(self.cfg)
+                        refused = server.send_message(self.outbox.load(claimed))
+                        if refused:  # dicionário de rejeitados
+                            error, permanent = f"destinatários rejeitados: {refused}", True
+                        ok = not refused
+                        break
+                    except (smtplib.SMTPException, OSError) as e:
+                        error, permanent = str(e) or type(e).__name__, _smtp_permanent(e)
+                        if permanent:
+                            break
+                        if server is not None:
+                            try:
+                                server.close()
+                            finally:
+                                server = None
+                if ok:
+                    self.outbox.done(claimed)
+                else:
+                    gave_up = self.outbox.failed(claimed, error, permanent)
+                    if not gave_up:
+                        self.outbox.release(claimed)
+                    print(f"E-mail: falha ao enviar {os.path.basename(path)}: {error}"
+                          + (" (descartado em outbox/failed)" if gave_up else " (fica no outbox)"))
+                with self._cond:
+                    self._results[path] = ok
+                    self._cond.notify_all()
+        finally:
+            if server is not None:
+                try:
+                    server.quit()
+                except (smtplib.SMTPException, OSError):
+                    server.close()
+
+_NOTIFIER = None
+_NOTIFIER_LOCK = threading.Lock()
+
+def mail_notifier(cfg: dict):
+    """Notifier único do processo (None sem SMTP configurado); já começa reenviando o outbox."""
+    global _NOTIFIER
+    if not (cfg.get("SMTP_HOST") and cfg.get("MAIL_FROM")):
+        return None
+    with _NOTIFIER_LOCK:
+        if _NOTIFIER is None:
+            _NOTIFIER = MailNotifier(cfg)
+        return _NOTIFIER
+
+def send_mail(subject: str, body_md: str, body_html: str, attachments: list, cfg: dict) -> bool:
+    """Enfileira e espera até AUTOMATEST_MAIL_FLUSH_TIMEOUT; se não der, a mensagem segue no outbox."""
+    msg = build_mail(subject, body_md, body_html, attachments, cfg)
+    notifier = mail_notifier(cfg) if msg is not None else None
+    if notifier is None:
+        return False
+    path = notifier.submit(msg)
+    return notifier.wait(path, timeout=notifier.qcfg["flush_timeout"] or None)
+
+# =====================================================================
+# Resultados em tempo real (JSONL, webhook e alerta de falha por e-mail)
+# =====================================================================
+def live_config(base_log_dir: str) -> dict:
+    jsonl = os.getenv("AUTOMATEST_LIVE_JSONL", "true").strip()
+    if jsonl.lower() in ("1", "true", "yes", "y", "on"):
+        jsonl = os.path.join(base_log_dir, "live.jsonl")
+    elif jsonl.lower() in ("", "0", "false", "no", "n", "off"):
+        jsonl = None
+    return {
+        "jsonl": jsonl,
+        "webhook": os.getenv("AUTOMATEST_WEBHOOK_URL", "").strip() or None,
+        "webhook_timeout": max(1, _env_int("AUTOMATEST_WEBHOOK_TIMEOUT", 5)),
+        "alert_email": os.getenv("AUTOMATEST_ALERT_EMAIL", "false").lower() in ("1", "true", "yes", "y"),
+        "result_files": os.getenv("AUTOMATEST_RESULT_FILES", "true").lower() in ("1", "true", "yes", "y"),
+    }
+
+def result_event(job: dict, res: dict, base_log_dir: str) -> dict:
+    summ = res["summary"]
+    shard = res.get("shard")
+    return {
+        "event": "job_finished",
+        "ts": datetime.datetime.now().isoformat(timespec="seconds"),
+        "project": res["project"],
+        "environment": res["env_label"],
+        "collection": res["collection_name"],
+        "shard": f"{shard['index'] + 1}/{shard['count']}" if shard else None,
+        "data_chunk": f"{res['data']['index'] + 1}/{res['data']['count']}" if res.get("data") else None,
+        "status": summary_status(summ),
+        "reason": summ.get("reason"),
+        "total_requests": summ.get("total_requests", 0),
+        "failed_requests": summ.get("failed_requests", 0),
+        "total_tests": summ.get("total_tests", 0),
+        "failed_tests": summ.get("failed_tests", 0),
+        "failed_items": [i.get("name") for i in summ.get("items", []) if _item_failed(i)][:20],
+        "log_dir": job_out_dir(base_log_dir, job),
+    }
+
+def _post_json(url: str, payload: dict, timeout: int):
+    u = urllib.parse.urlsplit(url)
+    conn_cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+    conn = conn_cls(u.hostname, u.port, timeout=timeout)
+    try:
+        path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        conn.request("POST", path, body=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                     headers={"Content-Type": "application/json", "User-Agent": "automatest"})
+        resp = conn.getresponse()
+        resp.read()
+        if resp.status >= 400:
+            raise OSError(f"HTTP {resp.status}")
+    finally:
+        conn.close()
+
+def _alert_text(ev: dict) -> str:
+    shard = f" (shard {ev['shard']})" if ev["shard"] else ""
+    lines = [
+        f"Falha em {ev['project']} / {ev['environment']} / {ev['collection']}{shard}",
+        f"Requests: {ev['total_requests']} (falhas: {ev['failed_requests']}) | "
+        f"Tests: {ev['total_tests']} (falhas: {ev['failed_tests']})",
+    ]
+    if ev["reason"]:
+        lines.append(f"Obs.: {ev['reason']}")
+    if ev["failed_items"]:
+        lines.append("Requests com problema:")
+        lines += [f"- {n}" for n in ev["failed_items"]]
+    lines += [f"Logs: {ev['log_dir']}", "", "O relatório consolidado chega ao fim da execução."]
+    return "\n".join(lines)
+
+_RE_XML_BAD = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def _xml(text) -> str:
+    return escape(_RE_XML_BAD.sub("", str(text)))
+
+class ResultFiles:
+    """
+    Saídas para CI, gravadas por acréscimo conforme os jobs terminam (nada é reconstruído no fim):
+    - results.ndjson: uma linha por request (status HTTP, tempo, testes e mensagens de falha);
+    - junit.xml: um <testsuite> por job, um <testcase> por teste (ou pelo request, se não houver testes).
+    """
+
+    def __init__(self, ndjson_path: str = None, junit_path: str = None):
+        self.ndjson_path = ndjson_path
+        self.junit_path = junit_path
+        self._lock = threading.Lock()
+        self._suite_id = 0
+        for p in (ndjson_path, junit_path):
+            if p:
+                ensure_dir(os.path.dirname(p) or ".")
+        if junit_path:
+            with open(junit_path, "w", encoding="utf-8") as f:
+                f.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites name="automatest">\n')
+
+    def add(self, res: dict):
+        summ = res["summary"]
+        shard = res.get("shard")
+        base = {
+            "project": res["project"], "environment": res["env_label"], "collection": res["collection_name"],
+            "shard": f"{shard['index'] + 1}/{shard['count']}" if shard else None,
+        }
+        if summ.get("cached"):
+            base["cached_at"] = summ.get("cached_at")
+        with self._lock:
+            if self.ndjson_path:
+                with open(self.ndjson_path, "a", encoding="utf-8") as f:
+                    for it in summ.get("items", []):
+                        f.write(json.dumps({**base, "request": it.get("name"), "folder": it.get("folder"),
+                                            "iteration": it.get("iteration"), "status_code": it.get("status_code"),
+                                            "response_time_ms": it.get("response_time_ms"),
+                                            "ok": not _item_failed(it), "tests": it.get("tests", [])},
+                                           ensure_ascii=False) + "\n")
+                    if not summ.get("items") and not summ.get("ok"):
+                        f.write(json.dumps({**base, "request": None, "ok": False, "error": summ.get("reason")},
+                                           ensure_ascii=False) + "\n")
+            if self.junit_path:
+                self._suite_id += 1
+                with open(self.junit_path, "a", encoding="utf-8") as f:
+                    f.write(self._suite_xml(base, summ, self._suite_id))
+
+    def _suite_xml(self, base: dict, summ: dict, suite_id: int) -> str:
+        classname = ".".join(_xml(base[k]) for k in ("project", "environment", "collection"))
+        cases, failures, total_ms = [], 0, 0.0
+        for it in summ.get("items", []):
+            ms = it.get("response_time_ms") or 0.0
+            total_ms += ms
+            sc = it.get("status_code")
+            req = _xml(it.get("name") or "")
+            http_fail = sc is not None and sc >= 400
+            tests = it.get("tests") or [{"name": "request", "ok": not http_fail}]
+            for t in tests:
+                case = f'    <testcase classname="{classname}" name="{req} :: {_xml(t.get("name") or "")}" time="{ms / 1000:.3f}"'
+                if t.get("ok"):
+                    cases.append(case + "/>")
+                    continue
+                failures += 1
+                msg = t.get("error") or (f"HTTP {sc}" if http_fail else "falhou")
+                cases.append(f'{case}><failure message="{_xml(msg)}">HTTP {sc if sc is not None else "-"}'
+                             f'</failure></testcase>')
+        if not cases and not summ.get("ok"):
+            failures += 1
+            cases.append(f'    <testcase classname="{classname}" name="execução" time="0.000">'
+                         f'<failure message="{_xml(summ.get("reason") or "falha na execução")}"/></testcase>')
+        name = f'{base["project"]} / {base["environment"]} / {base["collection"]}'
+        if base["shard"]:
+            name += f' (shard {base["shard"]})'
+        return (f'  <testsuite id="{suite_id}" name="{_xml(name)}" tests="{len(cases)}" failures="{failures}" '
+                f'errors="0" time="{total_ms / 1000:.3f}">\n' + "\n".join(cases) + ("\n" if cases else "")
+                + '  </testsuite>\n')
+
+    def close(self):
+        if self.junit_path:
+            with self._lock, open(self.junit_path, "a", encoding="utf-8") as f:
+                f.write("</testsuites>\n")
+
+class ResultPublisher:
+    """
+    Callback `on_result` do run_plan: publica cada job assim que termina, sem esperar o plano
+    inteiro. O webhook roda numa thread própria para não segurar os workers; o alerta por
+    e-mail sai no máximo uma vez por projeto/environment (o resto fica no relatório final).
+    """
+
+    def __init__(self, base_log_dir: str, email_cfg: dict, cfg: dict = None):
+        self.base_log_dir = base_log_dir
+        self.email_cfg = email_cfg
+        self.cfg = cfg or live_config(base_log_dir)
+        self._lock = threading.Lock()
+        self._alerted = set()
+        self.files = None
+        if self.cfg["result_files"]:
+            self.files = ResultFiles(os.path.join(base_log_dir, "results.ndjson"),
+                                     os.path.join(base_log_dir, "junit.xml"))
+        self._webhook_q = None
+        if self.cfg["webhook"]:
+            self._webhook_q = queue.Queue()
+            self._webhook_thread = threading.Thread(target=self._webhook_loop, name="automatest-webhook", daemon=True)
+            self._webhook_thread.start()
+
+    def publish(self, ev: dict):
+        if self.cfg["jsonl"]:
+            with self._lock:
+                try:
+                    ensure_dir(os.path.dirname(self.cfg["jsonl"]) or ".")
+                    with open(self.cfg["jsonl"], "a", encoding="utf-8") as f:
+                        f.write(json.dumps(ev, ensure_ascii=False) + "\n")
+                except OSError as e:
+                    print("Resultados: falha ao gravar", self.cfg["jsonl"], "-", e)
+        if self._webhook_q is not None:
+            self._webhook_q.put(ev)
+
+    def start(self, total_jobs: int):
+        self.publish({"event": "run_started", "ts": datetime.datetime.now().isoformat(timespec="seconds"),
+                      "log_dir": self.base_log_dir, "jobs": total_jobs})
+
+    def __call__(self, job: dict, res: dict):
+        ev = result_event(job, res, self.base_log_dir)
+        self.publish(ev)
+        self._add_files(res)
+        if ev["status"] == "failed" and self.cfg["alert_email"]:
+            key = (ev["project"], ev["environment"])
+            with self._lock:
+                if key in self._alerted:
+                    return
+                self._alerted.add(key)
+            msg = build_mail(f"{self.email_cfg['MAIL_SUBJECT']} [FALHA] {ev['project']} / {ev['environment']}",
+                             _alert_text(ev), None, [], self.email_cfg)
+            notifier = mail_notifier(self.email_cfg) if msg is not None else None
+            if notifier is not None:
+                notifier.submit(msg)  # não espera: o envio segue em segundo plano
+
+    def _add_files(self, res: dict):
+        if self.files is not None:
+            try:
+                self.files.add(res)
+            except OSError as e:
+                print("Resultados: falha ao gravar results.ndjson/junit.xml -", e)
+
+    def finish(self, grouped: dict, timeout: float = 30):
+        counts = {"ok": 0, "flaky": 0, "failed": 0}
+        for envs in grouped.values():
+            for items in envs.values():
+                for it in items:
+                    counts[summary_status(it["summary"])] += 1
+                    if it["summary"].get("cached"):
+                        self._add_files(it)  # reaproveitados do incremental não passam pelo on_result
+        if self.files is not None:
+            self.files.close()
+        self.publish({"event": "run_finished", "ts": datetime.datetime.now().isoformat(timespec="seconds"),
+                      "log_dir": self.base_log_dir, **counts})
+        if self._webhook_q is not None:
+            self._webhook_q.put(None)
+            self._webhook_thread.join(timeout)
+
+    def _webhook_loop(self):
+        warned = False
+        while True:
+            ev = self._webhook_q.get()
+            if ev is None:
+                return
+            try:
+                _post_json(self.cfg["webhook"], ev, self.cfg["webhook_timeout"])
+            except (OSError, http.client.HTTPException) as e:
+                if not warned:
+                    print("Webhook: falha ao publicar resultado:", e)
+                    warned = True
+
+# =====================================================================
+# UI Terminal
+# =====================================================================
+def prompt_menu(options, title="Como deseja executar?"):
+    print(f"\n{title}")
+    for i, opt in enumerate(options, start=1):
+        print(f"{i}) {opt}")
+    while True:
+        sel = input("> ").strip()
+        if sel.isdigit():
+            idx = int(sel) - 1
+            if 0 <= idx < len(options):
+                return idx
+        print("Entrada inválida. Digite o número da opção.")
+
+def choose_project(root: str):
+    projects = list_projects(root)
+    if not projects:
+        print("Nenhum projeto encontrado em 'collections/'.")
+        return None
+    idx = prompt_menu(projects, "Qual projeto deseja executar?")
+    return projects[idx]
 
 def choose_environment(root: str, project: str):
     env_dir = os.path.join(root, project, "enviroment")
@@ -503,14 +4232,689 @@ def choose_environment(root: str, project: str):
     idx = prompt_menu(labels, "Qual environment deseja usar?")
     return envs[idx]
 
+# =====================================================================
+# Daemon: índice em memória, watch de collections/, agenda interna e endpoint HTTP
+# =====================================================================
+IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO = 0x2, 0x8, 0x40, 0x80
+IN_CREATE, IN_DELETE, IN_DELETE_SELF = 0x100, 0x200, 0x400
+_INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_INOTIFY_EVENT = struct.Struct("iIII")  # struct inotify_event sem o nome (wd, mask, cookie, len)
+
+def daemon_config() -> dict:
+    return {
+        "host": os.getenv("AUTOMATEST_DAEMON_HOST", "127.0.0.1"),
+        "port": _env_int("AUTOMATEST_DAEMON_PORT", 8787),
+        "token": os.getenv("AUTOMATEST_DAEMON_TOKEN", ""),
+        "times": [t.strip() for t in os.getenv("AUTOMATEST_DAEMON_TIMES", "07:00").split(",") if t.strip()],
+        "interval_min": max(0, _env_int("AUTOMATEST_DAEMON_INTERVAL_MIN", 0)),
+        "run_on_change": os.getenv("AUTOMATEST_DAEMON_RUN_ON_CHANGE", "false").lower() in ("1", "true", "yes", "y"),
+        "debounce_s": max(1, _env_int("AUTOMATEST_DAEMON_DEBOUNCE", 10)),
+        "poll_s": max(1, _env_int("AUTOMATEST_DAEMON_POLL", 5)),
+        "login_ttl_s": max(0, _env_int("AUTOMATEST_LOGIN_CHECK_TTL", 3600)),
+    }
+
+class CollectionIndex:
+    """Projetos, collections e environments em memória; só reescaneia o disco depois de uma mudança."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.version = 0
+        self.changed_at = None
+        self._projects = {}
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def mark_dirty(self):
+        with self._lock:
+            self._dirty = True
+            self.changed_at = time.monotonic()
+
+    def projects(self) -> dict:
+        with self._lock:
+            if self._dirty:
+                self._projects = {
+                    proj: {"collections": list_jsons(os.path.join(self.root, proj, "requests")),
+                           "environments": list_jsons(os.path.join(self.root, proj, "enviroment"))}
+                    for proj in list_projects(self.root)
+                }
+                self._dirty = False
+                self.version += 1
+            return self._projects
+
+    def pairs(self, project: str = None, environment: str = None, collection: str = None) -> list:
+        """Mesmo formato de find_all_pairs, com filtros opcionais por nome."""
+        plan = []
+        for proj, entry in sorted(self.projects().items()):
+            if project and proj.lower() != project.lower():
+                continue
+            for r in entry["collections"]:
+                if collection and not file_matches(r, collection):
+                    continue
+                for e in entry["environments"]:
+                    if environment and not file_matches(e, environment):
+                        continue
+                    plan.append({"project": proj, "collection": r, "environment": e})
+        return plan
+
+# O watch cobre só o que entra no índice: os projetos e suas pastas requests/ e enviroment/.
+# cassettes/, data/ e afins recebem escrita das próprias execuções (gravação, blocos de dados) e,
+# com AUTOMATEST_DAEMON_RUN_ON_CHANGE, disparariam execuções umas atrás das outras.
+WATCH_SUBDIRS = ("requests", "enviroment")
+
+class DirWatcher(threading.Thread):
+    """
+    Avisa `on_change` quando uma collection/environment muda sob `root`: inotify (Linux, via ctypes)
+    ou polling de mtimes.
+    """
+
+    def __init__(self, root: str, on_change, poll_s: int):
+        super().__init__(name="automatest-watch", daemon=True)
+        self.root = root
+        self.on_change = on_change
+        self.poll_s = poll_s
+        self.mode = None
+
+    def run(self):
+        try:
+            self._run_inotify()
+        except (OSError, AttributeError) as e:
+            print(f"[daemon] inotify indisponível ({e}); usando polling a cada {self.poll_s}s")
+            self._run_polling()
+
+    def _dirs(self):
+        yield self.root
+        try:
+            projects = sorted(e.path for e in os.scandir(self.root) if e.is_dir())
+        except OSError:
+            return
+        for proj in projects:
+            yield proj
+            for sub in WATCH_SUBDIRS:
+                if os.path.isdir(os.path.join(proj, sub)):
+                    yield os.path.join(proj, sub)
+
+    def _relevant(self, dirpath: str, name: str) -> bool:
+        """O evento em `dirpath`/`name` mexe no índice? (nome vazio = o próprio diretório)"""
+        if dirpath is None or not name:
+            return dirpath is not None
+        if os.path.basename(dirpath) in WATCH_SUBDIRS and os.path.dirname(dirpath) != self.root:
+            return name.lower().endswith(".json")
+        if dirpath == self.root:
+            return True  # projeto criado/removido/renomeado
+        return name in WATCH_SUBDIRS
+
+    def _run_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        try:
+            watched = {}
+
+            def add_watches():
+                # inotify não é recursivo: cada diretório tem seu watch (re-adicionar é idempotente)
+                for d in self._dirs():
+                    wd = libc.inotify_add_watch(fd, os.fsencode(d), _INOTIFY_MASK)
+                    if wd < 0:
+                        raise OSError(ctypes.get_errno(), f"inotify_add_watch({d}) falhou")
+                    watched[wd] = d
+
+            add_watches()
+            self.mode = "inotify"
+            while True:
+                select.select([fd], [], [])
+                buf = os.read(fd, 64 * 1024)
+                changed, off = False, 0
+                while off + _INOTIFY_EVENT.size <= len(buf):
+                    wd, _mask, _cookie, size = _INOTIFY_EVENT.unpack_from(buf, off)
+                    off += _INOTIFY_EVENT.size
+                    name = os.fsdecode(buf[off:off + size].rstrip(b"\0"))
+                    off += size
+                    changed = changed or self._relevant(watched.get(wd), name)
+                if changed:
+                    add_watches()
+                    self.on_change()
+        finally:
+            os.close(fd)
+
+    def _snapshot(self) -> dict:
+        snap = {}
+        for d in self._dirs():
+            try:
+                for entry in os.scandir(d):
+                    if not self._relevant(d, entry.name):
+                        continue
+                    if d == self.root:
+                        snap[entry.path] = None  # projeto: só existir importa (o mtime muda com cassettes/ etc.)
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    snap[entry.path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                continue
+        return snap
+
+    def _run_polling(self):
+        self.mode = "polling"
+        last = self._snapshot()
+        while True:
+            time.sleep(self.poll_s)
+            cur = self._snapshot()
+            if cur != last:
+                last = cur
+                self.on_change()
+
+def _next_daily(times: list, now: datetime.datetime):
+    best = None
+    for t in times:
+        try:
+            hh, mm = (int(x) for x in t.split(":", 1))
+            cand = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
+        except ValueError:
+            continue
+        if cand <= now:
+            cand += datetime.timedelta(days=1)
+        best = cand if best is None or cand < best else best
+    return best
+
+class Daemon:
+    """
+    Processo de longa duração: mantém o índice de collections/, a checagem de login e os caches
+    (metadados de collection, tokens, conexões SMTP) entre execuções. As execuções vêm da agenda
+    interna, de mudanças em collections/ (opcional) ou de POST /run, e rodam uma por vez.
+    """
+
+    def __init__(self, collections_root: str, email_cfg: dict, cfg: dict = None, jobs: int = None,
+                 shard: bool = False):
+        self.cfg = cfg or daemon_config()
+        self.email_cfg = email_cfg
+        self.jobs = jobs
+        self.shard = shard
+        self.index = CollectionIndex(collections_root)
+        self.watcher = DirWatcher(collections_root, self.on_change, self.cfg["poll_s"])
+        self.queue = queue.Queue()
+        self.state = {"running": None, "last": None, "queued": 0, "started_at": datetime.datetime.now().isoformat(timespec="seconds")}
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._change_pending = False
+        self._next = self._compute_next(datetime.datetime.now())
+
+    def _compute_next(self, now: datetime.datetime):
+        cands = [_next_daily(self.cfg["times"], now)]
+        if self.cfg["interval_min"]:
+            cands.append(now + datetime.timedelta(minutes=self.cfg["interval_min"]))
+        cands = [c for c in cands if c]
+        return min(cands) if cands else None
+
+    def on_change(self):
+        self.index.mark_dirty()
+        with self._lock:
+            self._change_pending = True
+
+    def request_run(self, reason: str, project: str = None, environment: str = None, collection: str = None,
+                    changed: bool = False) -> dict:
+        with self._lock:
+            self._seq += 1
+            req = {"id": self._seq, "reason": reason, "project": project, "environment": environment,
+                   "collection": collection, "changed": changed,
+                   "requested_at": datetime.datetime.now().isoformat(timespec="seconds")}
+            self.state["queued"] += 1
+        self.queue.put(req)
+        return req
+
+    def _runner(self):
+        global TRACER
+        while True:
+            req = self.queue.get()
+            with self._lock:
+                self.state["queued"] -= 1
+                self.state["running"] = req
+            try:
+                TRACER = Tracer()
+                _SHARD_SETUPS.clear()
+                with TRACER.span("login"):
+                    ensure_postman_login(self.cfg["login_ttl_s"])
+                plan = self.index.pairs(req["project"], req["environment"], req["collection"])
+                print(f"\n[daemon] execução #{req['id']} ({req['reason']}): {len(plan)} job(s)")
+                outcome = execute_plan(plan, self.email_cfg, jobs=self.jobs, incremental=req["changed"],
+                                       shard=self.shard) if plan else {"jobs": 0}
+            except Exception as e:
+                print(f"[daemon] execução #{req['id']} falhou: {e}")
+                outcome = {"error": str(e)}
+            with self._lock:
+                self.state["running"] = None
+                self.state["last"] = {**req, **outcome,
+                                      "finished_at": datetime.datetime.now().isoformat(timespec="seconds")}
+
+    def _scheduler(self):
+        while True:
+            time.sleep(1)
+            now = datetime.datetime.now()
+            if self._next and now >= self._next:
+                self._next = self._compute_next(now)
+                self.request_run("agenda")
+            with self._lock:
+                settle = (self._change_pending and self.index.changed_at is not None
+                          and time.monotonic() - self.index.changed_at >= self.cfg["debounce_s"])
+                if settle:
+                    self._change_pending = False
+            if settle:
+                projects = self.index.projects()  # reindexa já, fora do caminho das execuções
+                print(f"[daemon] collections/ mudou: {len(projects)} projeto(s) no índice")
+                if self.cfg["run_on_change"]:
+                    self.request_run("mudança em collections/", changed=True)
+
+    def status(self) -> dict:
+        projects = self.index.projects()
+        with self._lock:
+            return {**self.state, "next_run": self._next.isoformat(timespec="seconds") if self._next else None,
+                    "watch": self.watcher.mode, "index_version": self.index.version,
+                    "projects": len(projects),
+                    "collections": sum(len(p["collections"]) for p in projects.values()),
+                    "environments": sum(len(p["environments"]) for p in projects.values())}
+
+    def index_json(self) -> dict:
+        return {proj: {k: [os.path.basename(p) for p in paths] for k, paths in entry.items()}
+                for proj, entry in self.index.projects().items()}
+
+    def serve_forever(self):
+        self.watcher.start()
+        threading.Thread(target=self._runner, name="automatest-runner", daemon=True).start()
+        threading.Thread(target=self._scheduler, name="automatest-scheduler", daemon=True).start()
+        server = ThreadingHTTPServer((self.cfg["host"], self.cfg["port"]), _daemon_handler(self))
+        print(f"[daemon] ouvindo em http://{self.cfg['host']}:{self.cfg['port']} "
+              f"(GET /status, GET /index, POST /run); próxima execução agendada: {self.status()['next_run'] or '-'}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n[daemon] encerrando.")
+        finally:
+            server.server_close()
+
+def _daemon_handler(daemon: Daemon):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, payload: dict):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _authorized(self) -> bool:
+            token = daemon.cfg["token"]
+            if token and self.headers.get("Authorization", "") != f"Bearer {token}":
+                self._reply(401, {"error": "token inválido"})
+                return False
+            return True
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            path = urllib.parse.urlsplit(self.path).path
+            if path == "/status":
+                self._reply(200, daemon.status())
+            elif path == "/index":
+                self._reply(200, daemon.index_json())
+            else:
+                self._reply(404, {"error": "rota desconhecida"})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            u = urllib.parse.urlsplit(self.path)
+            if u.path != "/run":
+                self._reply(404, {"error": "rota desconhecida"})
+                return
+            params = {k: v[-1] for k, v in urllib.parse.parse_qs(u.query).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                try:
+                    params.update(json.loads(self.rfile.read(length) or b"{}"))
+                except ValueError:
+                    self._reply(400, {"error": "corpo JSON inválido"})
+                    return
+            filters = {k: params.get(k) or None for k in ("project", "environment", "collection")}
+            if not daemon.index.pairs(**filters):
+                self._reply(404, {"error": "nenhum par collection/environment para esses filtros", **filters})
+                return
+            changed = str(params.get("changed", "")).lower() in ("1", "true", "yes", "y")
+            self._reply(202, daemon.request_run("sob demanda", changed=changed, **filters))
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+# =====================================================================
+# Execução distribuída: coordenador publica jobs numa fila SQLite, workers alugam e rodam
+# =====================================================================
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id              TEXT PRIMARY KEY,
+    log_dir         TEXT NOT NULL,
+    created_at      REAL NOT NULL,
+    max_per_project INTEGER NOT NULL,
+    max_per_env     INTEGER NOT NULL,
+    state           TEXT NOT NULL        -- open | closed
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    batch       TEXT NOT NULL REFERENCES batches(id),
+    seq         INTEGER NOT NULL,
+    project     TEXT NOT NULL,
+    environment TEXT NOT NULL,
+    unit        TEXT NOT NULL,           -- shards/blocos da mesma collection contam como uma unidade
+    payload     TEXT NOT NULL,
+    state       TEXT NOT NULL,           -- pending | leased | done | failed
+    worker      TEXT,
+    lease_until REAL,
+    tries       INTEGER NOT NULL DEFAULT 0,
+    result      TEXT,
+    collected   INTEGER NOT NULL DEFAULT 0,
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (batch, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, batch, seq);
+"""
+# Nome do worker deste processo (None fora do --worker); separa o _setup dos shards por worker
+_WORKER_NAME = None
+
+def queue_config(enabled: bool = False) -> dict:
+    return {
+        "enabled": enabled or os.getenv("AUTOMATEST_DISTRIBUTED", "").lower() in ("1", "true", "yes"),
+        "path": os.getenv("AUTOMATEST_QUEUE_DB", os.path.join("logs", "queue.sqlite")),
+        "lease_s": max(10, _env_int("AUTOMATEST_LEASE_S", 60)),
+        "max_tries": max(1, _env_int("AUTOMATEST_QUEUE_MAX_TRIES", 3)),
+        "poll_s": max(1, _env_int("AUTOMATEST_QUEUE_POLL", 2)),
+        "idle_s": max(0, _env_int("AUTOMATEST_QUEUE_IDLE_S", 900)),
+    }
+
+class JobQueue:
+    """
+    Fila de jobs num SQLite do volume compartilhado (logs/queue.sqlite). Cada operação abre a
+    própria conexão e usa BEGIN IMMEDIATE, então coordenador e vários workers (processos ou
+    containers no mesmo host) podem usar o arquivo ao mesmo tempo.
+    Lease: o worker aluga um job por `lease_s` e renova enquanto roda; lease vencida = worker
+    morreu, o job volta para a fila (até `max_tries` vezes). `tries` também serve de fencing:
+    resultado de um lease antigo é descartado.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        ensure_dir(os.path.dirname(os.path.abspath(path)))
+        conn = sqlite3.connect(path, timeout=60)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(QUEUE_SCHEMA)
+        finally:
+            conn.close()
+
+    @contextlib.contextmanager
+    def _tx(self):
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def publish(self, batch: str, log_dir: str, jobs: list, max_per_project: int, max_per_env: int):
+        now = time.time()
+        with self._tx() as conn:
+            conn.execute("INSERT INTO batches VALUES (?, ?, ?, ?, ?, 'open')",
+                         (batch, log_dir, now, max_per_project, max_per_env))
+            conn.executemany(
+                "INSERT INTO jobs (batch, seq, project, environment, unit, payload, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)",
+                ((batch, i, job["project"], os.path.abspath(job["environment"]),
+                  job.get("shard_group") or f"job-{i}", json.dumps(job, ensure_ascii=False), now)
+                 for i, job in enumerate(jobs)))
+
+    def _reclaim(self, conn, max_tries: int):
+        now = time.time()
+        expired = conn.execute("SELECT batch, seq, tries, worker FROM jobs WHERE state='leased' AND lease_until < ?",
+                               (now,)).fetchall()
+        for batch, seq, tries, worker in expired:
+            if tries >= max_tries:
+                reason = f"worker {worker} parou de responder ({tries} tentativa(s))"
+                conn.execute("UPDATE jobs SET state='failed', result=?, updated_at=? WHERE batch=? AND seq=?",
+                             (json.dumps({"error": reason}, ensure_ascii=False), now, batch, seq))
+            else:
+                print(f"[fila] lease vencida ({worker}): job {seq} volta para a fila")
+                conn.execute("UPDATE jobs SET state='pending', worker=NULL, lease_until=NULL, updated_at=? "
+                             "WHERE batch=? AND seq=?", (now, batch, seq))
+
+    def reclaim(self, max_tries: int):
+        with self._tx() as conn:
+            self._reclaim(conn, max_tries)
+
+    def lease(self, worker: str, lease_s: int, max_tries: int):
+        """Próximo job que respeita os limites por projeto/environment do lote: (batch, seq, log_dir, job, tries)."""
+        with self._tx() as conn:
+            self._reclaim(conn, max_tries)
+            running = {}
+            for batch, proj, env, unit in conn.execute(
+                    "SELECT batch, project, environment, unit FROM jobs WHERE state='leased'"):
+                r = running.setdefault(batch, ({}, {}))
+                r[0][proj] = r[0].get(proj, 0) + 1
+                r[1].setdefault(env, set()).add(unit)
+            rows = conn.execute(
+                "SELECT j.batch, j.seq, j.project, j.environment, j.unit, j.payload, j.tries, b.log_dir, "
+                "b.max_per_project, b.max_per_env FROM jobs j JOIN batches b ON b.id = j.batch "
+                "WHERE j.state='pending' AND b.state='open' ORDER BY b.created_at, j.seq")
+            for batch, seq, proj, env, unit, payload, tries, log_dir, max_proj, max_env in rows:
+                by_proj, by_env = running.get(batch, ({}, {}))
+                if max_proj > 0 and by_proj.get(proj, 0) >= max_proj:
+                    continue
+                units = by_env.get(env, set())
+                if max_env > 0 and unit not in units and len(units) >= max_env:
+                    continue
+                conn.execute("UPDATE jobs SET state='leased', worker=?, lease_until=?, tries=tries+1, updated_at=? "
+                             "WHERE batch=? AND seq=?", (worker, time.time() + lease_s, time.time(), batch, seq))
+                return batch, seq, log_dir, json.loads(payload), tries + 1
+        return None
+
+    def renew(self, batch: str, seq: int, worker: str, tries: int, lease_s: int) -> bool:
+        with self._tx() as conn:
+            return conn.execute("UPDATE jobs SET lease_until=? WHERE batch=? AND seq=? AND state='leased' "
+                                "AND worker=? AND tries=?",
+                                (time.time() + lease_s, batch, seq, worker, tries)).rowcount == 1
+
+    def complete(self, batch: str, seq: int, worker: str, tries: int, result: str, state: str = "done") -> bool:
+        with self._tx() as conn:
+            return conn.execute("UPDATE jobs SET state=?, result=?, lease_until=NULL, updated_at=? "
+                                "WHERE batch=? AND seq=? AND state='leased' AND worker=? AND tries=?",
+                                (state, result, time.time(), batch, seq, worker, tries)).rowcount == 1
+
+    def collect(self, batch: str) -> list:
+        """Resultados novos do lote: [(seq, state, result_json)] (cada um é entregue uma vez)."""
+        with self._tx() as conn:
+            rows = conn.execute("SELECT seq, state, result FROM jobs WHERE batch=? AND collected=0 "
+                                "AND state IN ('done', 'failed')", (batch,)).fetchall()
+            conn.executemany("UPDATE jobs SET collected=1 WHERE batch=? AND seq=?", ((batch, r[0]) for r in rows))
+        return rows
+
+    def progress(self, batch: str) -> dict:
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            counts = dict(conn.execute("SELECT state, count(*) FROM jobs WHERE batch=? GROUP BY state", (batch,)))
+            last = conn.execute("SELECT max(updated_at) FROM jobs WHERE batch=?", (batch,)).fetchone()[0]
+        finally:
+            conn.close()
+        return {**{s: counts.get(s, 0) for s in ("pending", "leased", "done", "failed")}, "last_change": last or 0}
+
+    def abandon(self, batch: str, reason: str):
+        """Fecha o lote; o que não terminou vira falha (workers ignoram lotes fechados)."""
+        with self._tx() as conn:
+            conn.execute("UPDATE batches SET state='closed' WHERE id=?", (batch,))
+            conn.execute("UPDATE jobs SET state='failed', result=?, updated_at=? "
+                         "WHERE batch=? AND state IN ('pending', 'leased')",
+                         (json.dumps({"error": reason}, ensure_ascii=False), time.time(), batch))
+
+    def close(self, batch: str):
+        with self._tx() as conn:
+            conn.execute("UPDATE batches SET state='closed' WHERE id=?", (batch,))
+            conn.execute("DELETE FROM jobs WHERE batch=?", (batch,))
+
+def failed_job_result(job: dict, reason: str) -> dict:
+    """Resultado de um job que não chegou a rodar (mesmo formato de execute_job)."""
+    return {
+        "project": job["project"],
+        "env_label": env_label_from_path(job["environment"]),
+        "collection_name": os.path.basename(job["collection"]),
+        "summary": {"ok": False, "flaky": False, "reason": reason, "total_requests": 0, "failed_requests": 0,
+                    "total_tests": 0, "failed_tests": 0, "attempts": [], "latency": {}, "items": []},
+        "attachments": [],
+        "shard": job.get("shard"),
+        "data": job.get("data"),
+        "latency_samples": None,
+        "setup": None,
+        "exec_meta": {"returncode": None, "timed_out": False, "attempts": [], "stderr": reason,
+                      "stdout": "", "cmd": ""},
+    }
+
+def dispatch_plan(exec_plan: list, base_log_dir: str, workers: int = 1, max_per_project: int = 0,
+                  max_per_env: int = 1, on_result=None, cfg: dict = None) -> list:
+    """
+    Mesmo contrato de run_plan, mas os jobs rodam nos workers (`main.py --worker`): publica o lote,
+    acompanha os resultados e devolve na ordem do plano. Se nenhum worker pegar job por `idle_s`,
+    o que faltou entra no relatório como falha.
+    """
+    cfg = cfg or queue_config(True)
+    q = JobQueue(cfg["path"])
+    batch = f"{os.path.basename(base_log_dir)}-{uuid.uuid4().hex[:6]}"
+    q.publish(batch, base_log_dir, exec_plan, max_per_project, max_per_env)
+    print(f"[fila] lote {batch}: {len(exec_plan)} job(s) publicados em {cfg['path']}; aguardando workers...")
+    results = [None] * len(exec_plan)
+    remaining = len(exec_plan)
+    shown = None
+    try:
+        while remaining:
+            for seq, state, raw in q.collect(batch):
+                res = json.loads(raw) if raw else {}
+                if state == "failed":
+                    res = failed_job_result(exec_plan[seq], res.get("error") or "falha no worker")
+                results[seq] = res
+                remaining -= 1
+                if on_result:
+                    on_result(exec_plan[seq], res)
+                compact_result(res)
+            if not remaining:
+                break
+            q.reclaim(cfg["max_tries"])
+            prog = q.progress(batch)
+            line = f"[fila] {prog['done'] + prog['failed']}/{len(exec_plan)} concluído(s), {prog['leased']} em execução"
+            if line != shown:
+                print(line)
+                shown = line
+            if cfg["idle_s"] and not prog["leased"] and time.time() - prog["last_change"] > cfg["idle_s"]:
+                q.abandon(batch, f"nenhum worker pegou o job em {cfg['idle_s']}s")
+                continue
+            time.sleep(cfg["poll_s"])
+    except BaseException:
+        q.abandon(batch, "coordenador interrompido")
+        raise
+    q.close(batch)
+    return results
+
+def _queue_result_json(res: dict) -> str:
+    samples = res.get("latency_samples")
+    if samples:
+        res = {**res, "latency_samples": {k: list(v) for k, v in samples.items()}}
+    return json.dumps(res, ensure_ascii=False)
+
+def run_worker(cfg: dict = None):
+    """`main.py --worker`: aluga jobs da fila, roda e devolve o resultado (renovando o lease enquanto roda)."""
+    global TRACER, _WORKER_NAME
+    cfg = cfg or queue_config(True)
+    q = JobQueue(cfg["path"])
+    _WORKER_NAME = f"{socket.gethostname()}-{os.getpid()}"
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    print(f"[worker {_WORKER_NAME}] aguardando jobs em {cfg['path']}")
+    current_log_dir = None
+    while not stop.is_set():
+        leased = q.lease(_WORKER_NAME, cfg["lease_s"], cfg["max_tries"])
+        if not leased:
+            stop.wait(cfg["poll_s"])
+            continue
+        batch, seq, log_dir, job, tries = leased
+        if log_dir != current_log_dir:
+            TRACER = Tracer()
+            _SHARD_SETUPS.clear()
+            current_log_dir = log_dir
+        ensure_postman_login(_env_int("AUTOMATEST_LOGIN_CHECK_TTL", 3600))
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(cfg["lease_s"] / 3):
+                if not q.renew(batch, seq, _WORKER_NAME, tries, cfg["lease_s"]):
+                    print(f"[worker {_WORKER_NAME}] lease do job {seq} perdida (outro worker assumiu)")
+                    return
+
+        hb = threading.Thread(target=heartbeat, name="automatest-lease", daemon=True)
+        hb.start()
+        try:
+            res, state = _queue_result_json(execute_job(job, log_dir)), "done"
+        except Exception as e:
+            res, state = json.dumps({"error": f"erro no worker {_WORKER_NAME}: {e}"}, ensure_ascii=False), "failed"
+        finally:
+            done.set()
+            hb.join()
+        if not q.complete(batch, seq, _WORKER_NAME, tries, res, state):
+            print(f"[worker {_WORKER_NAME}] resultado do job {seq} descartado (lease vencida)")
+
 # =====================================================================
 # Main
 # =====================================================================
-def main(auto_all: bool = False):
+def email_config() -> dict:
+    return {
+        "SMTP_HOST": os.getenv("SMTP_HOST", ""),
+        "SMTP_PORT": os.getenv("SMTP_PORT", "465"),
+        "SMTP_USE_TLS": os.getenv("SMTP_USE_TLS", "false"),
+        "SMTP_USER": os.getenv("SMTP_USER", ""),
+        "SMTP_PASS": os.getenv("SMTP_PASS", ""),
+        # MAIL_FROM cai para SMTP_USER se vazio
+        "MAIL_FROM": os.getenv("MAIL_FROM", "") or os.getenv("SMTP_USER", ""),
+        "MAIL_SUBJECT": os.getenv("MAIL_SUBJECT", "[AUTOMATEST] Relatório de coleções Postman"),
+    }
+
+def run_load_mode(collections_root: str, load: dict, email_cfg: dict):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    base_log_dir = os.path.join("logs", timestamp)
+    try:
+        res = run_load_test(collections_root, load, base_log_dir)
+    except ValueError as e:
+        print("ERRO:", e)
+        raise SystemExit(2)
+    grouped = group_results([res])
+    body_txt = build_human_report(grouped)
+    body_html, bundle, pointers = email_html_and_bundle(grouped, None, [], base_log_dir)
+    body_txt, body_html = add_pointer_notes(body_txt, body_html, pointers)
+    print("\n" + body_txt)
+    ok_send = send_mail(f"{email_cfg['MAIL_SUBJECT']} [carga]", body_txt, body_html,
+                        [bundle] if bundle else [], email_cfg)
+    print("E-mail enviado." if ok_send else "E-mail NÃO enviado (ver console; pendentes ficam em logs/outbox).")
+
+def main(auto_all: bool = False, jobs: int = None, load: dict = None, incremental: bool = False,
+         shard: bool = False, daemon: bool = False, distributed: bool = False, worker: bool = False,
+         cassette: str = None):
     """
     Executa o runner.
     - Quando `auto_all=True` (ou AUTOTEST_MODE=ALL/TRUE/1 no ambiente), roda SEM interação a opção "TUDO".
     - Caso contrário, apresenta o menu interativo.
+    - `jobs` (ou AUTOMATEST_WORKERS) define quantos jobs rodam em paralelo.
+    - `load` (dict do --load) roda o teste de carga em vez do plano normal.
+    - `incremental` (ou AUTOMATEST_INCREMENTAL) só roda pares alterados, com falha ou velhos.
+    - `shard` (ou AUTOMATEST_SHARD) divide collections por folder de primeiro nível.
+    - `daemon` fica rodando com agenda interna e endpoint HTTP (ver AUTOMATEST_DAEMON_*).
+    - `distributed` (ou AUTOMATEST_DISTRIBUTED) publica os jobs na fila e espera os workers.
+    - `worker` roda jobs da fila até receber SIGTERM (ver AUTOMATEST_QUEUE_*).
+    - `cassette` ("record"/"replay", ou AUTOMATEST_CASSETTE) grava ou reproduz as respostas via stub local.
     """
     load_dotenv()  # SMTP + POSTMAN_API_KEY (destinatários NUNCA estão aqui)
 
@@ -522,20 +4926,25 @@ def main(auto_all: bool = False):
         print("ERRO: Postman CLI não encontrado no PATH. Instale-o e garanta o comando 'postman'.")
         raise SystemExit(2)
 
-    postman_login_if_needed()
+    with TRACER.span("login"):
+        ensure_postman_login(0)  # registra a checagem (o daemon reaproveita até AUTOMATEST_LOGIN_CHECK_TTL)
+
+    if worker:
+        run_worker()
+        return
 
     # Configurações gerais
     collections_root = os.getenv("COLLECTIONS_ROOT", "collections")
-    email_cfg = {
-        "SMTP_HOST": os.getenv("SMTP_HOST", ""),
-        "SMTP_PORT": os.getenv("SMTP_PORT", "465"),
-        "SMTP_USE_TLS": os.getenv("SMTP_USE_TLS", "false"),
-        "SMTP_USER": os.getenv("SMTP_USER", ""),
-        "SMTP_PASS": os.getenv("SMTP_PASS", ""),
-        # MAIL_FROM cai para SMTP_USER se vazio
-        "MAIL_FROM": os.getenv("MAIL_FROM", "") or os.getenv("SMTP_USER", ""),
-        "MAIL_SUBJECT": os.getenv("MAIL_SUBJECT", "[AUTOMATEST] Relatório de coleções Postman"),
-    }
+    email_cfg = email_config()
+    mail_notifier(email_cfg)  # reenvia em segundo plano o que ficou no outbox
+
+    if load:
+        run_load_mode(collections_root, load, email_cfg)
+        return
+
+    if daemon:
+        Daemon(collections_root, email_cfg, jobs=jobs, shard=shard).serve_forever()
+        return
 
     # Plano de execução
     if auto_all:
@@ -563,59 +4972,198 @@ def main(auto_all: bool = False):
         print("Nada para executar: verifique a pasta 'collections/'.")
         return
 
+    execute_plan(exec_plan, email_cfg, jobs=jobs, incremental=incremental, shard=shard, distributed=distributed,
+                 cassette=cassette)
+
+
+def execute_plan(exec_plan: list, email_cfg: dict, jobs: int = None, incremental: bool = False,
+                 shard: bool = False, distributed: bool = False, cassette: str = None) -> dict:
+    """Uma execução completa do plano: jobs, histórico, relatórios e e-mail."""
     # Diretório de logs
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     base_log_dir = os.path.join("logs", timestamp)
+    TRACER.log_dir = base_log_dir
 
-    grouped = {}
-    attachments = []
-
-    # Execução
-    for job in exec_plan:
-        proj = job["project"]
-        col = job["collection"]
-        env = job["environment"]
-        env_label = env_label_from_path(env)
-        out_dir = os.path.join(base_log_dir, proj, env_label)
-
-        print(f"\n=== Executando: {proj} | env={os.path.basename(env)} | col={os.path.basename(col)}")
-        result = run_collection(col, env, out_dir)
-
-        # Anexos do e-mail
-        if result.get("report_path"):
-            attachments.append(result["report_path"])
-        if result.get("stdout_path"):
-            attachments.append(result["stdout_path"])
-
-        # Resumo (JSON + fallback no stdout)
-        summary = summarize_run(result.get("report_path"), result.get("stdout"))
-
-        grouped.setdefault(proj, {})
-        grouped[proj].setdefault(env_label, [])
-        grouped[proj][env_label].append({
-            "collection_name": os.path.basename(col),
-            "summary": summary,
-            "exec_meta": {
-                "returncode": result["returncode"],
-                "stderr": result["stderr"],
-                "stdout": result["stdout"],
-                "cmd": result["cmd"]
-            }
-        })
+    # Incremental: reaproveita resultados de pares sem mudança
+    inc = incremental_config(incremental)
+    inc_state, cached = {}, {}
+    to_run = list(range(len(exec_plan)))
+    if inc["enabled"]:
+        inc_state = load_json_state(inc["state_file"])
+        to_run, cached = split_incremental(exec_plan, inc_state, inc["max_age_s"])
+        print(f"Modo incremental: {len(to_run)} job(s) para rodar, {len(cached)} reaproveitado(s) do cache.")
 
-    # Relatórios (texto e HTML)
-    body_txt = build_human_report(grouped)
-    body_html = build_html_report(grouped)
+    # Health check: environment fora do ar não recebe jobs (cada um vira falha na hora)
+    planner = planner_config()
+    mode = cassette_mode(cassette)
+    skipped = {}
+    if planner["probe"] and mode != "replay" and to_run:
+        down = probe_environments([exec_plan[i] for i in to_run], planner["probe_timeout"], planner["probe_vars"])
+        for i in to_run:
+            reason = down.get(os.path.abspath(exec_plan[i]["environment"]))
+            if reason:
+                skipped[i] = failed_job_result(exec_plan[i], f"environment indisponível ({reason})")
+        to_run = [i for i in to_run if i not in skipped]
+
+    # Execução (paralela quando AUTOMATEST_WORKERS/--jobs > 1)
+    sched = scheduler_config(jobs)
+    queue_cfg = queue_config(distributed)
+    if queue_cfg["enabled"]:
+        print(f"Modo distribuído: {len(to_run)} job(s) vão para a fila {queue_cfg['path']}.")
+    elif sched["workers"] > 1:
+        print(f"Executando {len(to_run)} job(s) com {sched['workers']} worker(s) "
+              f"(máx. por projeto: {sched['max_per_project'] or '∞'}, por environment: {sched['max_per_env'] or '∞'}).")
+    sub_plan = [exec_plan[i] for i in to_run]
+    run_jobs = shard_plan(sub_plan) if sharding_enabled(shard) else [{**job, "parent": i} for i, job in enumerate(sub_plan)]
+    run_jobs = data_plan(run_jobs)
+    if mode:
+        # vai no job (e não só no ambiente) para valer também nos workers distribuídos
+        print(f"Cassettes: modo {mode} (collections/<projeto>/cassettes/).")
+        run_jobs = [{**job, "cassette": mode} for job in run_jobs]
+    costs = load_json_state(planner["cost_file"])
+    if planner["order"] == "cost":
+        run_jobs = order_by_cost(run_jobs, costs)
+    publisher = ResultPublisher(base_log_dir, email_cfg)
+    publisher.start(len(run_jobs) + len(skipped))
+    for i, res in skipped.items():
+        publisher(exec_plan[i], res)
+    with TRACER.span("jobs"):
+        if queue_cfg["enabled"]:
+            raw = dispatch_plan(run_jobs, base_log_dir, on_result=publisher, cfg=queue_cfg, **sched)
+        else:
+            raw = run_plan(run_jobs, base_log_dir, on_result=publisher, **sched)
+        ran = merge_shard_results(sub_plan, run_jobs, raw)
+    if mode != "replay":  # replay não mede o backend
+        record_job_costs(costs, run_jobs, raw, planner["alpha"])
+        save_json_state(planner["cost_file"], costs)
+    results = [cached.get(i) or skipped.get(i) for i in range(len(exec_plan))]
+    for i, res in zip(to_run, ran):
+        results[i] = res
+
+    if inc["enabled"] and mode != "replay":  # replay não diz nada sobre o backend real
+        update_incremental_state(inc_state, exec_plan, results)
+        save_json_state(inc["state_file"], inc_state)
+
+    grouped = group_results(results)
+    publisher.finish(grouped)
+    attachments = [p for res in results if res for p in res["attachments"]]
+
+    # Histórico: compara com as execuções anteriores e grava a de hoje
+    regressions = []
+    hist_cfg = history_config()
+    if hist_cfg["path"] and mode != "replay":  # latência de replay distorceria o baseline
+        try:
+            with TRACER.span("histórico"):
+                conn = history_open(hist_cfg["path"])
+                try:
+                    regressions = history_compare(conn, grouped, hist_cfg)
+                    history_record(conn, datetime.datetime.now().isoformat(timespec="seconds"), base_log_dir, grouped)
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            print("Histórico: falha ao acessar", hist_cfg["path"], "-", e)
+
+    # Relatórios (texto e HTML); HTML grande vai completo como anexo
+    with TRACER.span("relatório"):
+        body_txt = build_human_report(grouped, regressions)
+        body_html, bundle, pointers = email_html_and_bundle(grouped, regressions, attachments, base_log_dir)
+        body_txt, body_html = add_report_section(body_txt, body_html, "Tempo de execução", timing_lines(), warn=False)
+        body_txt, body_html = add_pointer_notes(body_txt, body_html, pointers)
 
     # Eco no console
     print("\n" + body_txt)
 
     # Envio de e-mail (destinatários vêm de constants.EMAIL_RECIPIENTS)
-    ok_send = send_mail(email_cfg["MAIL_SUBJECT"], body_txt, body_html, attachments, email_cfg)
-    print("E-mail enviado." if ok_send else "E-mail NÃO enviado (ver console).")
+    with TRACER.span("e-mail"):
+        ok_send = send_mail(email_cfg["MAIL_SUBJECT"], body_txt, body_html, [bundle] if bundle else [], email_cfg)
+    print("E-mail enviado." if ok_send else "E-mail NÃO enviado (ver console; pendentes ficam em logs/outbox).")
+    TRACER.write(os.path.join(base_log_dir, "trace.json"))
+    with contextlib.suppress(OSError), open(os.path.join(base_log_dir, RUN_DONE_MARKER), "w") as f:
+        f.write(datetime.datetime.now().isoformat(timespec="seconds") + "\n")
+
+    # Arquivo de logs: execuções antigas viram segmentos compactados; retenção apaga o que passou do prazo
+    try:
+        arch = compact_logs(os.path.dirname(base_log_dir), keep=os.path.basename(base_log_dir))
+        if arch["runs"] or arch["segments_removed"] or arch["dirs_removed"]:
+            print(f"Logs: {arch['runs']} execução(ões) compactada(s), {arch['segments_removed']} segmento(s) e "
+                  f"{arch['dirs_removed']} diretório(s) removido(s) pela retenção.")
+    except (OSError, sqlite3.Error) as e:
+        print("Logs: falha na compactação/retenção -", e)
+    counts = {"ok": 0, "flaky": 0, "failed": 0}
+    for res in results:
+        if res:
+            counts[summary_status(res["summary"])] += 1
+    return {"log_dir": base_log_dir, "jobs": len(exec_plan), "email_sent": ok_send, **counts}
+
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Runner de coleções Postman (CLI).")
+    parser.add_argument("--all", "-A", dest="auto_all", action="store_true",
+                        help="executa TUDO sem menu interativo")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="número de jobs em paralelo (padrão: AUTOMATEST_WORKERS ou 1)")
+    parser.add_argument("--changed", dest="incremental", action="store_true",
+                        help="só roda pares com arquivos alterados, falha anterior ou resultado velho")
+    parser.add_argument("--shard", action="store_true",
+                        help="divide cada collection em jobs por folder de primeiro nível")
+    parser.add_argument("--daemon", action="store_true",
+                        help="fica rodando: agenda interna, watch de collections/ e POST /run no endpoint local")
+    parser.add_argument("--coordinator", dest="distributed", action="store_true",
+                        help="publica os jobs na fila compartilhada e monta o relatório com o que os workers devolverem")
+    parser.add_argument("--worker", action="store_true",
+                        help="roda jobs da fila compartilhada (escale com docker compose up --scale automatest-worker=N)")
+    rec = parser.add_mutually_exclusive_group()
+    rec.add_argument("--record", dest="cassette", action="store_const", const="record",
+                     help="grava as respostas do backend em collections/<projeto>/cassettes/")
+    rec.add_argument("--replay", dest="cassette", action="store_const", const="replay",
+                     help="roda contra um stub local com as respostas gravadas (sem rede)")
+    parser.add_argument("--profile", action="store_true",
+                        help="grava estatísticas do cProfile em logs/<timestamp>/profile.pstats")
+    logs = parser.add_argument_group("arquivo de logs (filtros --project/--env/--collection valem aqui)")
+    logs.add_argument("--compact-logs", action="store_true",
+                      help="compacta execuções antigas de logs/ e aplica a retenção, sem rodar collections")
+    logs.add_argument("--query-logs", action="store_true", help="busca execuções no índice do arquivo de logs")
+    logs.add_argument("--request", help="nome exato do request")
+    logs.add_argument("--run", help="execução ou prefixo de data (ex.: 2026-10-01)")
+    logs.add_argument("--failed", action="store_true", help="só execuções com falha")
+    logs.add_argument("--show", action="store_true", help="mostra os testes/erros de cada execução encontrada")
+    logs.add_argument("--limit", type=int, default=20, help="máximo de execuções listadas")
+    load = parser.add_argument_group("teste de carga")
+    load.add_argument("--load", action="store_true", help="roda uma collection com N usuários virtuais")
+    load.add_argument("--project", help="projeto em collections/")
+    load.add_argument("--collection", help="arquivo da collection (com ou sem .json)")
+    load.add_argument("--env", dest="environment", help="arquivo do environment (com ou sem .json)")
+    load.add_argument("--vus", type=int, default=1, help="usuários virtuais simultâneos")
+    load.add_argument("--duration", type=float, default=0, help="duração em segundos (padrão: 60)")
+    load.add_argument("--iterations", type=int, default=0, help="total de iterações (no lugar da duração)")
+    args = parser.parse_args(argv)
+    if args.load and not args.project:
+        parser.error("--load exige --project")
+    return args
+
+def load_opts_from_args(args):
+    if not args.load:
+        return None
+    return {k: getattr(args, k) for k in ("project", "collection", "environment", "vus", "duration", "iterations")}
 
 
 if __name__ == "__main__":
-    import sys
-    _auto = any(arg in ("--all", "-A") for arg in sys.argv[1:])
-    main(auto_all=_auto)
+    _args = parse_args()
+    if _args.compact_logs or _args.query_logs:
+        raise SystemExit(logs_command(_args))
+    _profiler = cProfile.Profile() if _args.profile else None
+    if _profiler:
+        _profiler.enable()
+    try:
+        main(auto_all=_args.auto_all, jobs=_args.jobs, load=load_opts_from_args(_args),
+             incremental=_args.incremental, shard=_args.shard, daemon=_args.daemon,
+             distributed=_args.distributed, worker=_args.worker, cassette=_args.cassette)
+    finally:
+        if _profiler:
+            # cProfile só enxerga a thread principal: para medir os jobs, rode com -j 1
+            _profiler.disable()
+            _prof_path = os.path.join(TRACER.log_dir or "logs", "profile.pstats")
+            ensure_dir(os.path.dirname(_prof_path))
+            _profiler.dump_stats(_prof_path)
+            print(f"Perfil salvo em {_prof_path} (python -m pstats {_prof_path})")
@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def run_item(name, iteration=None, **extra):
+    item = {"name": name, "status_code": None, "tests": [], **extra}
+    if iteration is not None:
+        item["iteration"] = iteration
+    return item
+
+
+def stdout_item(name, iteration, folder=None, status_code=200, **extra):
+    return {"name": name, "status_code": status_code, "tests": [], "folder": folder,
+            "iteration": iteration, **extra}
+
+
+class MergeStdoutItemsTest(unittest.TestCase):
+    """Mesmo nome repetido em iterações e folders: cada execução do stdout casa com a sua."""
+
+    def test_aligned_lists_merge_in_place(self):
+        items = [run_item("Login", 0), run_item("Login", 0), run_item("Login", 1), run_item("Login", 1)]
+        std = [stdout_item("Login", 0, "A", 200), stdout_item("Login", 0, "B", 201),
+               stdout_item("Login", 1, "A", 202), stdout_item("Login", 1, "B", 203)]
+        merged = main.merge_stdout_items(items, std)
+        self.assertEqual(len(merged), 4)
+        self.assertEqual([(i["folder"], i["iteration"], i["status_code"]) for i in merged],
+                         [("A", 0, 200), ("B", 0, 201), ("A", 1, 202), ("B", 1, 203)])
+
+    def test_missing_execution_only_misaligns_its_iteration(self):
+        # iteração 0 do stdout perdeu o "Busca" (ex.: saída truncada); iterações 1 e 2 seguem casando
+        items = [run_item("Login", 0), run_item("Busca", 0), run_item("Login", 1), run_item("Busca", 1),
+                 run_item("Login", 2), run_item("Busca", 2)]
+        std = [stdout_item("Login", 0, status_code=200), stdout_item("Login", 1, status_code=201),
+               stdout_item("Busca", 1, status_code=202), stdout_item("Login", 2, status_code=203),
+               stdout_item("Busca", 2, status_code=204)]
+        merged = main.merge_stdout_items(items, std)
+        self.assertEqual(len(merged), 6)
+        self.assertEqual([(i["name"], i["iteration"], i["status_code"]) for i in merged],
+                         [("Login", 0, 200), ("Busca", 0, None), ("Login", 1, 201), ("Busca", 1, 202),
+                          ("Login", 2, 203), ("Busca", 2, 204)])
+
+    def test_different_iteration_numbering_falls_back_to_whole_list(self):
+        # run.json numerando a partir de 1 e stdout a partir de 0: nada pode sair duplicado
+        items = [run_item("Busca", 1), run_item("Login", 1), run_item("Login", 2), run_item("Busca", 2)]
+        std = [stdout_item("Login", 0, status_code=200), stdout_item("Busca", 0, status_code=201),
+               stdout_item("Login", 1, status_code=202), stdout_item("Busca", 1, status_code=203)]
+        merged = main.merge_stdout_items(items, std)
+        self.assertEqual(len(merged), 4)
+        self.assertEqual(sorted((i["name"], i["status_code"]) for i in merged),
+                         [("Busca", 201), ("Busca", 203), ("Login", 200), ("Login", 202)])
+
+    def test_run_json_without_iterations(self):
+        items = [run_item("Busca"), run_item("Login"), run_item("Login")]
+        std = [stdout_item("Login", 0, status_code=200), stdout_item("Busca", 0, status_code=201),
+               stdout_item("Login", 1, status_code=202)]
+        merged = main.merge_stdout_items(items, std)
+        self.assertEqual([(i["name"], i["status_code"]) for i in merged],
+                         [("Busca", 201), ("Login", 200), ("Login", 202)])
+
+    def test_extra_stdout_execution_is_appended(self):
+        items = [run_item("Login", 0)]
+        std = [stdout_item("Login", 0), stdout_item("Logout", 0, status_code=204)]
+        merged = main.merge_stdout_items(items, std)
+        self.assertEqual([(i["name"], i["status_code"]) for i in merged], [("Login", 200), ("Logout", 204)])
+
+
+if __name__ == "__main__":
+    unittest.main()